@@ -2,94 +2,515 @@
 """
 Arrow数据处理器 - 从Arrow IPC文件读取数据并进行处理
 """
-import pandas as pd
 import pyarrow as pa
-import pyarrow.ipc as ipc
-import duckdb
-import numpy as np
+import pyarrow.compute as pc
 from datetime import datetime, timedelta
+import glob
 import logging
+import re
+import threading
+import warnings
 from pathlib import Path
 
+try:
+    from .arrow_store import IpcTailReader, hour_key, list_segments, symbol_bucket
+    from .duckdb_pool import DuckDBConnectionManager
+    from .metrics import QueryTimingRegistry
+    from .panel_features import PricePanel, panel_features_table
+except ImportError:
+    from arrow_store import IpcTailReader, hour_key, list_segments, symbol_bucket
+    from duckdb_pool import DuckDBConnectionManager
+    from metrics import QueryTimingRegistry
+    from panel_features import PricePanel, panel_features_table
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 实时数据表结构，(symbol, timestamp) 为主键，加载时用 INSERT OR IGNORE 去重
+REALTIME_OHLC_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        symbol VARCHAR,
+        timestamp TIMESTAMP,
+        open DOUBLE,
+        high DOUBLE,
+        low DOUBLE,
+        close DOUBLE,
+        volume BIGINT,
+        amount DOUBLE,
+        count INTEGER,
+        processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (symbol, timestamp)
+    )
+"""
+
+# 交易对维度表，随加载的批次增量维护
+REALTIME_SYMBOLS_DDL = """
+    CREATE TABLE IF NOT EXISTS realtime_symbols (
+        symbol VARCHAR PRIMARY KEY,
+        first_seen TIMESTAMP,
+        last_seen TIMESTAMP
+    )
+"""
+
+# 保留策略：delete 每次加载时按时间删除过期行；buckets 按小时分表，整表删除过期分桶
+RETENTION_DELETE = "delete"
+RETENTION_BUCKETS = "buckets"
+RETENTION_MODES = (RETENTION_DELETE, RETENTION_BUCKETS)
+
+# 小时分桶表名 realtime_ohlc_YYYYMMDD_HH，realtime_ohlc 为所有存活分桶的 UNION ALL 视图
+BUCKET_PREFIX = "realtime_ohlc_"
+BUCKET_PATTERN = re.compile(r"^realtime_ohlc_(\d{8}_\d{2})$")
+
+# 每个交易对参与特征计算的最近K线数（覆盖 EMA26/MACD 等最长窗口）
+FEATURE_WINDOW = 50
+
+# 多交易对的窗口查询：每个交易对取最近N条K线，按 (symbol, timestamp) 正序返回，
+# 指标统一在价格面板上由 indicator_kernels 的定义计算
+LATEST_ROWS_SQL = """
+    SELECT symbol, timestamp, open, high, low, close, volume
+    FROM realtime_ohlc
+    {symbol_filter}
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY timestamp DESC) <= ?
+    ORDER BY symbol, timestamp
+"""
+
+# _execute 的 fetch 参数：将结果获取为Arrow表
+FETCH_ARROW = "arrow"
+
+# 热路径查询，统一参数化执行并按名称统计耗时
+HOT_QUERIES = {
+    'retention_delete': """
+        DELETE FROM realtime_ohlc
+        WHERE timestamp < ?
+    """,
+    'insert_batch': """
+        INSERT OR IGNORE INTO realtime_ohlc
+        (symbol, timestamp, open, high, low, close, volume, amount, count)
+        SELECT symbol, timestamp, open, high, low, close, volume, amount, count
+        FROM arrow_batch
+    """,
+    'bucket_hours': """
+        SELECT DISTINCT date_trunc('hour', timestamp)
+        FROM {source}
+        WHERE timestamp >= ?
+    """,
+    'insert_bucket': """
+        INSERT OR IGNORE INTO {table}
+        (symbol, timestamp, open, high, low, close, volume, amount, count)
+        SELECT symbol, timestamp, open, high, low, close, volume, amount, count
+        FROM {source}
+        WHERE timestamp >= ? AND timestamp < ?
+    """,
+    'drop_bucket': """
+        DROP TABLE IF EXISTS {table}
+    """,
+    'symbol_bounds': """
+        SELECT symbol, MIN(timestamp), MAX(timestamp)
+        FROM realtime_ohlc
+        GROUP BY symbol
+    """,
+    'upsert_symbols': """
+        INSERT INTO realtime_symbols
+        SELECT symbol, timestamp_min, timestamp_max
+        FROM symbol_batch
+        ON CONFLICT (symbol) DO UPDATE SET last_seen = greatest(last_seen, excluded.last_seen)
+    """,
+    'expire_symbols': """
+        DELETE FROM realtime_symbols
+        WHERE last_seen < ?
+        RETURNING symbol
+    """,
+    'latest_rows': LATEST_ROWS_SQL.format(symbol_filter=""),
+    # 只取指定交易对（事件驱动模式下只重算有新数据的交易对）
+    'symbol_latest_rows': LATEST_ROWS_SQL.format(symbol_filter="WHERE list_contains(?, symbol)"),
+}
+
+def arrow_table(result):
+    """将DuckDB查询结果获取为 pa.Table（新版 arrow() 返回 RecordBatchReader，旧版直接返回Table）"""
+    table = result.arrow()
+    return table.read_all() if isinstance(table, pa.RecordBatchReader) else table
+
+
+def feature_table_from_rows(rows, lookback=FEATURE_WINDOW):
+    """由各交易对最近K线的Arrow表计算全部实时特征，返回带 entity_id/created_at 的列式特征表
+    
+    处理轮次中每个特征只在这里计算一次；没有数据时返回None。
+    """
+    if rows is None or rows.num_rows == 0:
+        return None
+    
+    table = panel_features_table(PricePanel.from_arrow(rows, lookback=lookback))
+    created_at = datetime.now()
+    entity_suffix = created_at.strftime('_%Y%m%d_%H%M')
+    table = table.append_column(
+        'entity_id', pc.binary_join_element_wise(table['symbol'], entity_suffix, ''))
+    return table.append_column(
+        'created_at', pa.array([created_at] * table.num_rows, pa.timestamp('us')))
+
+
+def features_from_rows(rows, lookback=FEATURE_WINDOW):
+    """由各交易对最近K线的Arrow表计算全部实时特征，返回特征字典列表"""
+    table = feature_table_from_rows(rows, lookback=lookback)
+    return table.to_pylist() if table is not None else []
+
+
 class ArrowProcessor:
     """Arrow数据处理器"""
     
-    def __init__(self, arrow_cache_path="/workspace/data/arrow_cache/"):
+    def __init__(self, arrow_cache_path="/workspace/data/arrow_cache/", arrow_layout="hourly",
+                 db_path="/workspace/data/realtime_features.duckdb",
+                 retention_mode=RETENTION_DELETE, retention_hours=1, connection_manager=None,
+                 shard=None, history_glob=None):
+        if retention_mode not in RETENTION_MODES:
+            raise ValueError(f"不支持的保留策略: {retention_mode}，可选: {RETENTION_MODES}")
+        # (index, count)：只处理 symbol_bucket(symbol, count) == index 的交易对
+        self.shard = tuple(shard) if shard else None
         self.arrow_cache_path = Path(arrow_cache_path)
-        self.duckdb_conn = None
+        self.arrow_layout = arrow_layout
+        self.db_path = connection_manager.db_path if connection_manager else db_path
+        self.retention_mode = retention_mode
+        self.retention_hours = retention_hours
+        # 压实后的Parquet历史数据（ArrowCompactor.history_glob），有文件后建立 ohlc_history 视图
+        self.history_glob = history_glob
+        self._history_view = False
+        # 已加载数据的最大事件时间，保留窗口以它为终点（回放历史行情时不按墙上时间清空）
+        self.event_watermark = None
+        # 托管连接，每个线程通过 duckdb_conn 获得自己的游标
+        self.connection_manager = connection_manager
+        # 加载过程（水位、分桶、交易对全集）串行执行，特征查询可与之并行
+        self._load_lock = threading.Lock()
+        # 存活的小时分桶: 表名 -> 小时起点（buckets 策略使用）
+        self._buckets = {}
+        # 交易对全集缓存及尚未取走的变更
+        self._symbols = set()
+        self._pending_added = set()
+        self._pending_removed = set()
+        self._symbol_listeners = []
+        # 每个Arrow段文件的增量读取水位
+        self.tail_reader = IpcTailReader()
+        # 各热路径查询的耗时统计
+        self.query_timings = QueryTimingRegistry()
         self._init_duckdb()
     
+    @property
+    def duckdb_conn(self):
+        """当前线程的DuckDB游标"""
+        if self.connection_manager is None:
+            return None
+        return self.connection_manager.cursor()
+    
     def _init_duckdb(self):
         """初始化DuckDB连接"""
         try:
-            db_path = "/workspace/data/realtime_features.duckdb"
-            self.duckdb_conn = duckdb.connect(db_path)
+            if self.connection_manager is None:
+                self.connection_manager = DuckDBConnectionManager(self.db_path)
             
-            # 创建实时数据表
-            self.duckdb_conn.execute("""
-                CREATE TABLE IF NOT EXISTS realtime_ohlc (
-                    symbol VARCHAR,
-                    timestamp TIMESTAMP,
-                    open DOUBLE,
-                    high DOUBLE,
-                    low DOUBLE,
-                    close DOUBLE,
-                    volume BIGINT,
-                    amount DOUBLE,
-                    count INTEGER,
-                    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            if self.retention_mode == RETENTION_BUCKETS:
+                self._init_buckets()
+            else:
+                if self._object_type("realtime_ohlc") == "view":
+                    self._merge_buckets_to_table()
+                # 创建实时数据表
+                self.duckdb_conn.execute(REALTIME_OHLC_DDL.format(table="realtime_ohlc"))
+                self._migrate_primary_key()
+            
+            self._init_symbols()
+            self._ensure_history_view()
             
             logger.info("DuckDB连接初始化完成")
             
         except Exception as e:
             logger.error(f"初始化DuckDB时出错: {e}")
     
-    def load_arrow_to_duckdb(self, hours_back=1):
-        """将Arrow数据加载到DuckDB"""
+    def _execute(self, name, params=None, fetch=None, **identifiers):
+        """执行 HOT_QUERIES 中的参数化查询并记录耗时（含结果获取）
+        
+        fetch 为结果获取方法名（如 'fetchall'），FETCH_ARROW 表示获取为 pa.Table，为None时不获取结果。
+        identifiers 用于填充表名等不能参数化的标识符（只接受内部生成的名称）。
+        """
+        sql = HOT_QUERIES[name].format(**identifiers) if identifiers else HOT_QUERIES[name]
+        with self.query_timings.timer(name):
+            result = self.duckdb_conn.execute(sql, params)
+            if fetch == FETCH_ARROW:
+                return arrow_table(result)
+            return getattr(result, fetch)() if fetch else result
+    
+    def get_query_stats(self):
+        """各热路径查询的耗时统计（count/mean/p50/p99/max，毫秒）"""
+        return self.query_timings.snapshot()
+    
+    def _migrate_primary_key(self):
+        """为旧版本创建的无主键 realtime_ohlc 表补充主键（去重后重建）"""
+        has_primary_key = self.duckdb_conn.execute("""
+            SELECT COUNT(*) FROM duckdb_constraints()
+            WHERE table_name = 'realtime_ohlc' AND constraint_type = 'PRIMARY KEY'
+        """).fetchone()[0]
+        if has_primary_key:
+            return
+        
+        logger.info("为 realtime_ohlc 添加 (symbol, timestamp) 主键...")
+        self.duckdb_conn.execute("BEGIN TRANSACTION")
+        try:
+            self.duckdb_conn.execute(REALTIME_OHLC_DDL.format(table="realtime_ohlc_pk"))
+            self.duckdb_conn.execute("""
+                INSERT OR IGNORE INTO realtime_ohlc_pk
+                SELECT * FROM realtime_ohlc
+                WHERE symbol IS NOT NULL AND timestamp IS NOT NULL
+            """)
+            self.duckdb_conn.execute("DROP TABLE realtime_ohlc")
+            self.duckdb_conn.execute("ALTER TABLE realtime_ohlc_pk RENAME TO realtime_ohlc")
+            self.duckdb_conn.execute("COMMIT")
+        except Exception:
+            self.duckdb_conn.execute("ROLLBACK")
+            raise
+    
+    def _object_type(self, name):
+        """返回同名对象的类型：'table'、'view' 或 None"""
+        if self.duckdb_conn.execute(
+                "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ?", [name]).fetchone()[0]:
+            return "table"
+        if self.duckdb_conn.execute(
+                "SELECT COUNT(*) FROM duckdb_views() WHERE view_name = ? AND NOT internal",
+                [name]).fetchone()[0]:
+            return "view"
+        return None
+    
+    def _existing_buckets(self):
+        """数据库中已有的小时分桶表"""
+        buckets = {}
+        for (name,) in self.duckdb_conn.execute("SELECT table_name FROM duckdb_tables()").fetchall():
+            match = BUCKET_PATTERN.match(name)
+            if match:
+                buckets[name] = datetime.strptime(match.group(1), "%Y%m%d_%H")
+        return buckets
+    
+    def _init_buckets(self):
+        """初始化小时分桶，原有的 realtime_ohlc 数据表迁移到分桶中"""
+        self._buckets = self._existing_buckets()
+        
+        if self._object_type("realtime_ohlc") == "table":
+            logger.info("将 realtime_ohlc 数据表迁移为小时分桶...")
+            self.duckdb_conn.execute("ALTER TABLE realtime_ohlc RENAME TO realtime_ohlc_legacy")
+            self._insert_into_buckets("realtime_ohlc_legacy")
+            self.duckdb_conn.execute("DROP TABLE realtime_ohlc_legacy")
+        
+        # 保证至少有一个分桶，视图始终可查询
+        self._ensure_bucket(datetime.now())
+        self._refresh_bucket_view()
+    
+    def _merge_buckets_to_table(self):
+        """从 buckets 策略切换回 delete 策略：分桶数据合并回 realtime_ohlc 数据表"""
+        logger.info("将小时分桶合并回 realtime_ohlc 数据表...")
+        self.duckdb_conn.execute(REALTIME_OHLC_DDL.format(table="realtime_ohlc_merged"))
+        self.duckdb_conn.execute("INSERT OR IGNORE INTO realtime_ohlc_merged SELECT * FROM realtime_ohlc")
+        self.duckdb_conn.execute("DROP VIEW realtime_ohlc")
+        for name in self._existing_buckets():
+            self.duckdb_conn.execute(f"DROP TABLE {name}")
+        self.duckdb_conn.execute("ALTER TABLE realtime_ohlc_merged RENAME TO realtime_ohlc")
+    
+    def _ensure_bucket(self, ts):
+        """返回某个时间所在小时的分桶表名，不存在时创建"""
+        hour = ts.replace(minute=0, second=0, microsecond=0)
+        name = BUCKET_PREFIX + hour_key(hour)
+        if name not in self._buckets:
+            self.duckdb_conn.execute(REALTIME_OHLC_DDL.format(table=name))
+            self._buckets[name] = hour
+            self._refresh_bucket_view()
+        return name
+    
+    def _refresh_bucket_view(self):
+        """重建 realtime_ohlc 视图为所有存活分桶的 UNION ALL"""
+        if not self._buckets:
+            return
+        union = "\nUNION ALL\n".join(f"SELECT * FROM {name}" for name in sorted(self._buckets))
+        self.duckdb_conn.execute(f"CREATE OR REPLACE VIEW realtime_ohlc AS\n{union}")
+    
+    def _insert_into_buckets(self, source, since=None):
+        """按小时将 source 中 since 之后的数据写入对应分桶，返回新增行数"""
+        inserted = 0
+        hours = self._execute('bucket_hours', [since or datetime(1970, 1, 1)],
+                              fetch='fetchall', source=source)
+        for (hour,) in sorted(hours):
+            table = self._ensure_bucket(hour)
+            inserted += self._execute('insert_bucket', [hour, hour + timedelta(hours=1)],
+                                      fetch='fetchone', table=table, source=source)[0]
+        return inserted
+    
+    def _drop_expired_buckets(self, cutoff_time):
+        """整表删除已完全早于 cutoff_time 的分桶（只修改元数据，不扫描数据）"""
+        expired = [name for name, hour in self._buckets.items()
+                   if hour + timedelta(hours=1) <= cutoff_time]
+        if not expired:
+            return 0
+        for name in expired:
+            del self._buckets[name]
+        # 当前小时的分桶不会过期，保证视图至少包含一个分桶
+        self._ensure_bucket(max(datetime.now(), cutoff_time))
+        self._refresh_bucket_view()
+        for name in expired:
+            self._execute('drop_bucket', table=name)
+        logger.info(f"删除了 {len(expired)} 个过期分桶: {', '.join(sorted(expired))}")
+        return len(expired)
+    
+    def _ensure_history_view(self):
+        """压实的Parquet文件出现后建立 ohlc_history 视图（查询时按glob展开，之后压实的小时自动可见）
+        
+        已关闭小时的Arrow段压实后被删除，通过该视图按 symbol/timestamp 谓词下推读取历史数据。
+        """
+        if self._history_view or not self.history_glob or not glob.glob(self.history_glob):
+            return
+        pattern = str(self.history_glob).replace("'", "''")
+        self.duckdb_conn.execute(f"""
+            CREATE OR REPLACE VIEW ohlc_history AS
+            SELECT * FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)
+        """)
+        self._history_view = True
+        logger.info(f"创建历史数据视图 ohlc_history: {self.history_glob}")
+    
+    def _init_symbols(self):
+        """加载交易对维度表到内存，首次启用时从已有数据回填"""
+        self.duckdb_conn.execute(REALTIME_SYMBOLS_DDL)
+        rows = self.duckdb_conn.execute("SELECT symbol, last_seen FROM realtime_symbols").fetchall()
+        if not rows:
+            bounds = self._execute('symbol_bounds', fetch='fetchall')
+            if bounds:
+                self.duckdb_conn.executemany(
+                    "INSERT OR IGNORE INTO realtime_symbols VALUES (?, ?, ?)", bounds)
+            rows = [(symbol, last_seen) for symbol, _, last_seen in bounds]
+        self._symbols = {row[0] for row in rows}
+        # 重启后从维度表恢复事件时间水位
+        self.event_watermark = max((row[1] for row in rows if row[1] is not None), default=None)
+    
+    def _update_symbols(self, table):
+        """根据新加载的批次更新交易对维度表（每个交易对的首次/最近出现时间）"""
+        bounds = table.group_by('symbol').aggregate([('timestamp', 'min'), ('timestamp', 'max')])
+        self.duckdb_conn.register('symbol_batch', bounds)
+        try:
+            self._execute('upsert_symbols')
+        finally:
+            self.duckdb_conn.unregister('symbol_batch')
+        
+        added = set(bounds['symbol'].to_pylist()) - self._symbols
+        if added:
+            # 整体替换集合，其他线程读取到的始终是完整快照
+            self._symbols = self._symbols | added
+            self._record_symbol_changes(added=added)
+    
+    def _advance_watermark(self, table):
+        """用新加载批次的最大事件时间推进水位"""
+        latest = pc.max(table['timestamp']).cast(pa.timestamp('us')).as_py()
+        if latest is not None and (self.event_watermark is None or latest > self.event_watermark):
+            self.event_watermark = latest
+    
+    def _retention_cutoff(self):
+        """保留窗口的起点：事件时间水位（尚无数据时为当前时间）之前 retention_hours 小时
+        
+        按已加载数据的事件时间而不是墙上时间计算，实时行情下两者一致；回放历史行情时
+        保留的是回放数据中最近 retention_hours 小时的数据。
+        """
+        return (self.event_watermark or datetime.now()) - timedelta(hours=self.retention_hours)
+    
+    def _expire_symbols(self, cutoff_time):
+        """移除最近出现时间早于 cutoff_time 的交易对（其数据已被保留策略清理）"""
+        removed = {row[0] for row in self._execute('expire_symbols', [cutoff_time], fetch='fetchall')}
+        removed &= self._symbols
+        if removed:
+            self._symbols = self._symbols - removed
+            self._record_symbol_changes(removed=removed)
+    
+    def _record_symbol_changes(self, added=(), removed=()):
+        """累积交易对变更并通知订阅方（先新增后移除的交易对互相抵消）"""
+        for symbol in added:
+            if symbol in self._pending_removed:
+                self._pending_removed.discard(symbol)
+            else:
+                self._pending_added.add(symbol)
+        for symbol in removed:
+            if symbol in self._pending_added:
+                self._pending_added.discard(symbol)
+            else:
+                self._pending_removed.add(symbol)
+        
+        logger.info(f"交易对变更: 新增 {sorted(added)}, 移除 {sorted(removed)}")
+        for listener in self._symbol_listeners:
+            try:
+                listener(set(added), set(removed))
+            except Exception as e:
+                logger.error(f"交易对变更回调出错: {e}")
+    
+    def add_symbol_listener(self, callback):
+        """订阅交易对变更，callback(added, removed) 在加载时同步调用"""
+        self._symbol_listeners.append(callback)
+    
+    def pop_symbol_changes(self):
+        """取走自上次调用以来的交易对变更，返回 {'added': [...], 'removed': [...]}"""
+        changes = {'added': sorted(self._pending_added), 'removed': sorted(self._pending_removed)}
+        self._pending_added = set()
+        self._pending_removed = set()
+        return changes
+    
+    def _shard_rows(self, table):
+        """分片模式下只保留属于本分片的交易对"""
+        if self.shard is None:
+            return table
+        index, count = self.shard
+        owned = [symbol for symbol in pc.unique(table['symbol']).to_pylist()
+                 if symbol_bucket(symbol, count) == index]
+        return table.filter(pc.is_in(table['symbol'], value_set=pa.array(owned, pa.string())))
+    
+    def load_arrow_to_duckdb(self, hours_back=1, symbols=None):
+        """将Arrow数据加载到DuckDB（分区布局下可按 symbols 只加载相关的段文件）"""
+        with self._load_lock:
+            return self._load_arrow_to_duckdb(hours_back, symbols)
+    
+    def _load_arrow_to_duckdb(self, hours_back, symbols):
         try:
-            # 获取Arrow文件列表
+            # 获取Arrow文件列表（段文件按写入时的墙上时间分区）
             current_time = datetime.now()
             loaded_count = 0
             
             for i in range(hours_back):
                 target_time = current_time - timedelta(hours=i)
-                file_pattern = target_time.strftime("%Y%m%d_%H")
-                file_path = self.arrow_cache_path / f"ohlc_{file_pattern}.arrow"
                 
-                if file_path.exists():
-                    # 读取Arrow文件
-                    with pa.ipc.open_file(file_path) as reader:
-                        table = reader.read_all()
-                        df = table.to_pandas()
+                for file_path in list_segments(self.arrow_cache_path, hour_key(target_time),
+                                               layout=self.arrow_layout, symbols=symbols,
+                                               shard=self.shard):
+                    # 只读取该文件水位之后新追加的批次
+                    schema, batches = self.tail_reader.read_new_batches(file_path)
+                    if not batches:
+                        continue
+                    table = self._shard_rows(pa.Table.from_batches(batches, schema=schema))
                     
-                    if not df.empty:
-                        # 清理旧数据（保留最近1小时）
-                        cutoff_time = current_time - timedelta(hours=1)
-                        self.duckdb_conn.execute("""
-                            DELETE FROM realtime_ohlc 
-                            WHERE timestamp < ?
-                        """, [cutoff_time])
+                    if table.num_rows:
+                        self._advance_watermark(table)
+                        cutoff_time = self._retention_cutoff()
+                        if self.retention_mode == RETENTION_DELETE:
+                            # 清理旧数据（保留水位之前 retention_hours 小时）
+                            self._execute('retention_delete', [cutoff_time])
                         
-                        # 插入新数据（避免重复）
-                        self.duckdb_conn.execute("""
-                            INSERT INTO realtime_ohlc 
-                            (symbol, timestamp, open, high, low, close, volume, amount, count)
-                            SELECT * FROM df
-                            WHERE NOT EXISTS (
-                                SELECT 1 FROM realtime_ohlc r 
-                                WHERE r.symbol = df.symbol 
-                                AND r.timestamp = df.timestamp
-                            )
-                        """)
+                        # 直接注册Arrow表供DuckDB扫描（内存映射的批次，不经过pandas），主键去重
+                        self.duckdb_conn.register('arrow_batch', table)
+                        try:
+                            if self.retention_mode == RETENTION_BUCKETS:
+                                inserted = self._insert_into_buckets('arrow_batch', since=cutoff_time)
+                            else:
+                                inserted = self._execute('insert_batch', fetch='fetchone')[0]
+                        finally:
+                            self.duckdb_conn.unregister('arrow_batch')
                         
-                        loaded_count += len(df)
-                        logger.info(f"加载了 {len(df)} 条数据从 {file_path}")
-            
+                        self._update_symbols(table)
+                        loaded_count += table.num_rows
+                        logger.info(f"增量加载了 {table.num_rows} 条数据（新增 {inserted} 条）从 {file_path}")
+            
+            # 按加载后的水位删除过期分桶；数据已被清理的交易对移出全集（分桶策略以最早的存活分桶为界）
+            if self.retention_mode == RETENTION_BUCKETS:
+                self._drop_expired_buckets(self._retention_cutoff())
+                self._expire_symbols(min(self._buckets.values()))
+            elif loaded_count:
+                self._expire_symbols(self._retention_cutoff())
+            
+            self.tail_reader.forget_missing()
+            self._ensure_history_view()
             logger.info(f"总共加载了 {loaded_count} 条Arrow数据到DuckDB")
             return loaded_count
             
@@ -97,186 +518,65 @@ class ArrowProcessor:
             logger.error(f"加载Arrow数据到DuckDB时出错: {e}")
             return 0
     
-    def calculate_realtime_features(self, symbol, lookback_periods=20):
-        """计算实时技术指标特征"""
-        try:
-            # 获取最近的数据
-            query = f"""
-                SELECT *
-                FROM realtime_ohlc 
-                WHERE symbol = '{symbol}'
-                ORDER BY timestamp DESC
-                LIMIT {lookback_periods * 2}
-            """
-            
-            df = self.duckdb_conn.execute(query).df()
-            
-            if len(df) < 5:
-                logger.warning(f"{symbol} 数据不足，无法计算特征")
-                return None
-            
-            # 按时间正序排列
-            df = df.sort_values('timestamp').reset_index(drop=True)
-            
-            # 计算技术指标
-            features = self._compute_technical_indicators(df)
-            
-            if features:
-                # 添加元数据
-                features.update({
-                    'symbol': symbol,
-                    'timestamp': df.iloc[-1]['timestamp'],
-                    'entity_id': f"{symbol}_{datetime.now().strftime('%Y%m%d_%H%M')}",
-                    'event_timestamp': df.iloc[-1]['timestamp'],
-                    'created_at': datetime.now()
-                })
-                
-                return features
-            
-        except Exception as e:
-            logger.error(f"计算 {symbol} 实时特征时出错: {e}")
+    def calculate_realtime_features(self, symbol, lookback=FEATURE_WINDOW, lookback_periods=None):
+        """计算单个交易对的实时技术指标特征（与 calculate_all_features 同一口径）
+        
+        lookback_periods 为旧参数名（已弃用）：旧版取最近 lookback_periods * 2 根K线，
+        按同样的换算映射到 lookback。
+        """
+        if lookback_periods is not None:
+            warnings.warn("lookback_periods 已弃用，请改用 lookback（K线根数 = lookback_periods * 2）",
+                          DeprecationWarning, stacklevel=2)
+            lookback = lookback_periods * 2
+        features = self.calculate_all_features(lookback=lookback, symbols=[symbol])
+        if not features:
+            logger.warning(f"{symbol} 数据不足，无法计算特征")
             return None
+        return features[0]
     
-    def _compute_technical_indicators(self, df):
-        """计算技术指标"""
-        try:
-            if len(df) < 5:
-                return None
-            
-            features = {}
-            
-            # 基础价格特征
-            features['price'] = float(df.iloc[-1]['close'])
-            features['volume'] = int(df.iloc[-1]['volume'])
-            
-            # 计算收益率
-            if len(df) >= 2:
-                prev_close = df.iloc[-2]['close']
-                if prev_close != 0:
-                    features['daily_return'] = float((features['price'] - prev_close) / prev_close)
-                else:
-                    features['daily_return'] = 0.0
-            else:
-                features['daily_return'] = 0.0
-            
-            # 移动平均线
-            if len(df) >= 5:
-                features['ma_5'] = float(df.tail(5)['close'].mean())
-            else:
-                features['ma_5'] = features['price']
-            
-            if len(df) >= 10:
-                features['ma_10'] = float(df.tail(10)['close'].mean())
-            else:
-                features['ma_10'] = features['price']
-            
-            # RSI计算
-            if len(df) >= 14:
-                features['rsi_14'] = self._calculate_rsi(df['close'].tail(14))
-            else:
-                features['rsi_14'] = 50.0
-            
-            # 波动率（标准差）
-            if len(df) >= 10:
-                returns = df['close'].pct_change().dropna()
-                if len(returns) > 1:
-                    features['volatility'] = float(returns.std())
-                else:
-                    features['volatility'] = 0.0
-            else:
-                features['volatility'] = 0.0
-            
-            # 成交量比率
-            if len(df) >= 10:
-                avg_volume = df.tail(10)['volume'].mean()
-                if avg_volume != 0:
-                    features['volume_ratio'] = float(features['volume'] / avg_volume)
-                else:
-                    features['volume_ratio'] = 1.0
-            else:
-                features['volume_ratio'] = 1.0
-            
-            # 动量指标
-            if len(df) >= 6:
-                price_5d_ago = df.iloc[-6]['close']
-                if price_5d_ago != 0:
-                    features['momentum_5d'] = float((features['price'] - price_5d_ago) / price_5d_ago)
-                else:
-                    features['momentum_5d'] = 0.0
-            else:
-                features['momentum_5d'] = 0.0
-            
-            return features
-            
-        except Exception as e:
-            logger.error(f"计算技术指标时出错: {e}")
-            return None
+    def get_all_symbols(self):
+        """获取所有交易对（加载时增量维护的缓存，不扫描数据表）"""
+        return sorted(self._symbols)
     
-    def _calculate_rsi(self, prices):
-        """计算RSI指标"""
-        try:
-            if len(prices) < 2:
-                return 50.0
-            
-            # 计算价格变化
-            deltas = prices.diff().dropna()
-            
-            # 分离涨跌
-            gains = deltas.where(deltas > 0, 0)
-            losses = -deltas.where(deltas < 0, 0)
-            
-            # 计算平均涨跌幅
-            avg_gains = gains.rolling(window=14, min_periods=1).mean().iloc[-1]
-            avg_losses = losses.rolling(window=14, min_periods=1).mean().iloc[-1]
-            
-            if avg_losses == 0:
-                return 100.0
-            
-            rs = avg_gains / avg_losses
-            rsi = 100 - (100 / (1 + rs))
-            
-            return float(rsi)
-            
-        except Exception as e:
-            logger.error(f"计算RSI时出错: {e}")
-            return 50.0
+    def fetch_latest_rows(self, symbols=None, lookback=FEATURE_WINDOW):
+        """一次窗口查询取所有（或 symbols 指定的）交易对最近 lookback 条K线的Arrow表"""
+        if symbols is None:
+            return self._execute('latest_rows', [lookback], fetch=FETCH_ARROW)
+        return self._execute('symbol_latest_rows', [sorted(symbols), lookback],
+                             fetch=FETCH_ARROW)
     
-    def get_all_symbols(self):
-        """获取所有交易对"""
+    def calculate_feature_table(self, lookback=FEATURE_WINDOW, symbols=None):
+        """计算所有（或 symbols 指定的）交易对的实时特征，返回每个交易对一行的列式特征表
+        
+        每轮只需一次DuckDB查询，指标在价格面板上一次向量化计算，K线不足5条的交易对被跳过；
+        没有数据时返回None。
+        """
+        rows = self.fetch_latest_rows(symbols=symbols, lookback=lookback)
+        return feature_table_from_rows(rows, lookback=lookback)
+    
+    def calculate_all_features(self, lookback=FEATURE_WINDOW, symbols=None):
+        """计算所有（或 symbols 指定的）交易对的实时技术指标，返回特征字典列表"""
         try:
-            result = self.duckdb_conn.execute("""
-                SELECT DISTINCT symbol 
-                FROM realtime_ohlc 
-                ORDER BY symbol
-            """).fetchall()
-            
-            return [row[0] for row in result]
+            table = self.calculate_feature_table(lookback=lookback, symbols=symbols)
+            return table.to_pylist() if table is not None else []
             
         except Exception as e:
-            logger.error(f"获取交易对列表时出错: {e}")
+            logger.error(f"批量计算实时特征时出错: {e}")
             return []
     
-    def process_all_symbols(self):
-        """处理所有交易对的实时特征"""
+    def process_all_symbols(self, symbols=None):
+        """处理所有交易对的实时特征（symbols 指定时只重算这些交易对）"""
         try:
             # 首先加载最新的Arrow数据
-            self.load_arrow_to_duckdb()
+            self.load_arrow_to_duckdb(symbols=symbols)
             
-            # 获取所有交易对
-            symbols = self.get_all_symbols()
+            # 一次查询取数，在价格面板上计算所有交易对的特征
+            all_features = self.calculate_all_features(symbols=symbols)
             
-            if not symbols:
+            if not all_features:
                 logger.warning("没有找到交易对数据")
                 return []
             
-            # 计算每个交易对的特征
-            all_features = []
-            for symbol in symbols:
-                features = self.calculate_realtime_features(symbol)
-                if features:
-                    all_features.append(features)
-                    logger.info(f"计算了 {symbol} 的实时特征")
-            
             logger.info(f"总共计算了 {len(all_features)} 个交易对的特征")
             return all_features
             
@@ -286,8 +586,8 @@ class ArrowProcessor:
     
     def close(self):
         """关闭连接"""
-        if self.duckdb_conn:
-            self.duckdb_conn.close()
+        if self.connection_manager:
+            self.connection_manager.close()
 
 def main():
     """主函数 - 测试Arrow处理器"""
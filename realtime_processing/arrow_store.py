@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+Arrow IPC缓存存储 - 按小时/交易对分区的追加写入与读取
+"""
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+import zlib
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "_manifest.json"
+
+
+def hour_key(ts=None):
+    """返回小时分区键 (YYYYMMDD_HH)"""
+    return (ts or datetime.now()).strftime("%Y%m%d_%H")
+
+
+def hourly_files(base_path, key, prefix="ohlc"):
+    """列出某个小时的所有段文件（主文件及重启后产生的续写段）"""
+    base_path = Path(base_path)
+    files = []
+    main_file = base_path / f"{prefix}_{key}.arrow"
+    if main_file.exists():
+        files.append(main_file)
+    files.extend(sorted(
+        base_path.glob(f"{prefix}_{key}_*.arrow"),
+        key=lambda p: int(p.stem.rsplit('_', 1)[-1]) if p.stem.rsplit('_', 1)[-1].isdigit() else 0
+    ))
+    return files
+
+
+def symbol_bucket(symbol, num_buckets):
+    """稳定的交易对分桶（跨进程一致，不依赖Python的hash随机化）"""
+    return zlib.crc32(symbol.encode('utf-8')) % num_buckets
+
+
+def partition_dir(base_path, key):
+    """小时分区目录 date=YYYYMMDD/hour=HH"""
+    date_part, hour_part = key.split('_')
+    return Path(base_path) / f"date={date_part}" / f"hour={hour_part}"
+
+
+def load_manifest(base_path, key):
+    """读取小时分区的manifest，不存在时返回None"""
+    manifest_path = partition_dir(base_path, key) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def partitioned_files(base_path, key, symbols=None, since=None, shard=None):
+    """列出分区布局下某个小时需要读取的段文件
+
+    symbols 指定时只返回包含这些交易对的段；since 指定时跳过已关闭且
+    max_timestamp 早于 since 的段（未关闭段的统计值可能滞后，不做时间裁剪）。
+    shard 为 (index, count) 时，若分桶数是 count 的整数倍，只返回属于该分片的分桶
+    （symbol_bucket(s, num_buckets) % count == symbol_bucket(s, count)）。
+    """
+    hour_dir = partition_dir(base_path, key)
+    manifest = load_manifest(base_path, key)
+
+    if manifest is None:
+        # 没有manifest时无法裁剪，读取全部段
+        return sorted(hour_dir.glob("symbol_bucket=*/*.arrow")) if hour_dir.exists() else []
+
+    wanted = set(symbols) if symbols is not None else None
+    if shard is not None and manifest.get('num_buckets', 0) % shard[1] != 0:
+        shard = None
+    files = []
+    for rel_path, info in sorted(manifest['segments'].items()):
+        if wanted is not None and wanted.isdisjoint(info['symbols']):
+            continue
+        if shard is not None and info['bucket'] % shard[1] != shard[0]:
+            continue
+        if since is not None and info.get('closed') and info['max_timestamp'] \
+                and datetime.fromisoformat(info['max_timestamp']) < since:
+            continue
+        path = hour_dir / rel_path
+        if path.exists():
+            files.append(path)
+    return files
+
+
+def list_segments(base_path, key, layout="hourly", symbols=None, since=None, shard=None):
+    """按布局列出某个小时的段文件（shard 只对分区布局生效，按小时布局需读取方按行过滤）"""
+    if layout == "partitioned":
+        return partitioned_files(base_path, key, symbols=symbols, since=since, shard=shard)
+    return hourly_files(base_path, key)
+
+
+def ipc_write_options(compression=None):
+    """IPC写入选项，compression 可为 None、"lz4" 或 "zstd"（读取时自动解压）"""
+    if not compression:
+        return None
+    return ipc.IpcWriteOptions(compression=compression)
+
+
+def read_ipc_batches(source, memory_map=False):
+    """读取IPC文件中的全部记录批次，兼容File格式与Stream格式
+
+    memory_map=True 时通过 pa.memory_map 打开文件，返回的批次直接引用映射页，
+    不复制到堆内存。Stream格式的文件可能正被写入，末尾不完整的消息会被忽略。
+    """
+    if memory_map:
+        source = pa.memory_map(str(source), 'r')
+
+    try:
+        reader = ipc.open_file(source)
+        return reader.schema, [reader.get_batch(i) for i in range(reader.num_record_batches)]
+    except pa.ArrowInvalid:
+        if memory_map:
+            source.seek(0)
+
+    reader = ipc.open_stream(source)
+    batches = []
+    while True:
+        try:
+            batches.append(reader.read_next_batch())
+        except StopIteration:
+            break
+        except (pa.ArrowInvalid, OSError):
+            # 写入方尚未写完的尾部消息
+            break
+    return reader.schema, batches
+
+
+def read_ipc_table(source, memory_map=False):
+    """读取IPC文件为Arrow Table"""
+    schema, batches = read_ipc_batches(source, memory_map=memory_map)
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+class IpcTailReader:
+    """Arrow IPC增量读取器
+
+    为每个文件记录已读取位置的水位（Stream格式为字节偏移，File格式为批次数），
+    每次只返回水位之后新追加的记录批次。文件通过内存映射打开，跳过的部分不解析。
+    """
+
+    def __init__(self):
+        self._states = {}
+
+    def watermark(self, path):
+        """某个文件的当前水位，未读取过时返回None"""
+        state = self._states.get(str(path))
+        if state is None:
+            return None
+        return state['offset'] if state['format'] == 'stream' else state['batches']
+
+    def read_new_batches(self, path):
+        """读取文件中水位之后的新批次，返回 (schema, batches)"""
+        key = str(path)
+        state = self._states.get(key)
+        source = pa.memory_map(key, 'r')
+
+        if state is None:
+            try:
+                reader = ipc.open_file(source)
+                state = {'format': 'file', 'schema': reader.schema, 'batches': 0}
+            except pa.ArrowInvalid:
+                source.seek(0)
+                message_reader = ipc.MessageReader.open_stream(source)
+                schema = ipc.read_schema(message_reader.read_next_message())
+                state = {'format': 'stream', 'schema': schema, 'offset': source.tell()}
+            self._states[key] = state
+
+        if state['format'] == 'file':
+            reader = ipc.open_file(source)
+            batches = [reader.get_batch(i)
+                       for i in range(state['batches'], reader.num_record_batches)]
+            state['batches'] = reader.num_record_batches
+            return state['schema'], batches
+
+        source.seek(state['offset'])
+        message_reader = ipc.MessageReader.open_stream(source)
+        batches = []
+        while True:
+            try:
+                message = message_reader.read_next_message()
+            except StopIteration:
+                break
+            except (pa.ArrowInvalid, OSError):
+                # 写入方尚未写完的尾部消息，下次从当前水位重读
+                break
+            batches.append(ipc.read_record_batch(message, state['schema']))
+            state['offset'] = source.tell()
+        return state['schema'], batches
+
+    def forget_missing(self):
+        """丢弃已不存在文件的水位（被压实或清理的段）"""
+        for key in list(self._states):
+            if not Path(key).exists():
+                del self._states[key]
+
+
+def column_views(table, columns=None):
+    """将Arrow Table的列转换为NumPy数组
+
+    单块且无空值的数值列直接返回底层缓冲区的只读视图（内存映射读取时即为映射页），
+    多块或字符串列才会发生复制。
+    """
+    views = {}
+    for name in columns or table.column_names:
+        column = table.column(name)
+        if column.num_chunks == 1:
+            views[name] = column.chunk(0).to_numpy(zero_copy_only=False)
+        else:
+            views[name] = column.to_numpy()
+    return views
+
+
+class HourlyArrowWriter:
+    """按小时滚动的Arrow IPC追加写入器
+
+    每个小时保持一个打开的RecordBatchStreamWriter，新批次直接追加到文件尾部，
+    不再回读已有数据；跨小时或关闭时写入流结束标记并关闭文件。
+    """
+
+    def __init__(self, base_path, schema, prefix="ohlc", compression=None):
+        self.base_path = Path(base_path)
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.prefix = prefix
+        self.write_options = ipc_write_options(compression)
+
+        self._lock = threading.Lock()
+        self._current_hour = None
+        self._current_path = None
+        self._sink = None
+        self._writer = None
+
+    @property
+    def current_path(self):
+        """当前写入的段文件路径"""
+        return self._current_path
+
+    def write_batch(self, batch, ts=None):
+        """追加一个记录批次，必要时按小时滚动文件"""
+        key = hour_key(ts)
+        with self._lock:
+            if key != self._current_hour:
+                self._rotate(key)
+            self._writer.write_batch(batch)
+            return self._current_path
+
+    def write_table(self, table, ts=None):
+        """追加一个Arrow Table"""
+        path = self._current_path
+        for batch in table.to_batches():
+            path = self.write_batch(batch, ts)
+        return path
+
+    def _next_segment_path(self, key):
+        """生成本小时的新段文件路径，不覆盖已有文件"""
+        path = self.base_path / f"{self.prefix}_{key}.arrow"
+        seq = 0
+        while path.exists():
+            seq += 1
+            path = self.base_path / f"{self.prefix}_{key}_{seq}.arrow"
+        return path
+
+    def _rotate(self, key):
+        """关闭当前小时的写入器并打开新的段文件"""
+        self._close_current()
+        self._current_path = self._next_segment_path(key)
+        self._sink = pa.OSFile(str(self._current_path), 'wb')
+        self._writer = ipc.new_stream(self._sink, self.schema, options=self.write_options)
+        self._current_hour = key
+        logger.info(f"打开Arrow段文件 {self._current_path}")
+
+    def _close_current(self):
+        """写入流结束标记并关闭当前文件"""
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            finally:
+                self._sink.close()
+                logger.info(f"关闭Arrow段文件 {self._current_path}")
+        self._writer = None
+        self._sink = None
+        self._current_hour = None
+
+    def close(self):
+        """关闭写入器"""
+        with self._lock:
+            self._close_current()
+
+
+class PartitionedArrowWriter:
+    """按 date=/hour=/symbol_bucket= 分区的Arrow IPC追加写入器
+
+    每个分桶保持一个打开的流式段文件，并在小时目录下维护 _manifest.json，
+    记录每个段的行数、最小/最大时间戳和包含的交易对，读取方据此只打开
+    需要的段。manifest在新开段、段内出现新交易对以及关闭段时落盘。
+    """
+
+    def __init__(self, base_path, schema, num_buckets=16, symbol_field="symbol",
+                 timestamp_field="timestamp", compression=None):
+        self.base_path = Path(base_path)
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.write_options = ipc_write_options(compression)
+        self.num_buckets = num_buckets
+        self.symbol_field = symbol_field
+        self.timestamp_field = timestamp_field
+
+        self._lock = threading.Lock()
+        self._current_hour = None
+        self._segments = {}   # bucket -> (sink, writer, path)
+        self._manifest = None
+
+    def write_batch(self, batch, ts=None):
+        """按交易对分桶追加一个记录批次，返回小时分区目录"""
+        key = hour_key(ts)
+        with self._lock:
+            if key != self._current_hour:
+                self._rotate(key)
+
+            symbols = batch.column(self.symbol_field)
+            buckets = {}
+            for symbol in pc.unique(symbols).to_pylist():
+                buckets.setdefault(symbol_bucket(symbol, self.num_buckets), []).append(symbol)
+
+            manifest_dirty = False
+            for bucket, bucket_symbols in buckets.items():
+                if len(buckets) == 1:
+                    sub_batch = batch
+                else:
+                    sub_batch = batch.filter(pc.is_in(symbols, value_set=pa.array(bucket_symbols)))
+                manifest_dirty |= self._append(bucket, sub_batch, bucket_symbols)
+
+            if manifest_dirty:
+                self._save_manifest()
+            return partition_dir(self.base_path, key)
+
+    def write_table(self, table, ts=None):
+        """追加一个Arrow Table"""
+        path = None
+        for batch in table.to_batches():
+            path = self.write_batch(batch, ts)
+        return path
+
+    def _append(self, bucket, batch, bucket_symbols):
+        """写入单个分桶，返回manifest结构是否发生变化"""
+        dirty = False
+        if bucket not in self._segments:
+            self._open_segment(bucket)
+            dirty = True
+
+        _, writer, path = self._segments[bucket]
+        writer.write_batch(batch)
+
+        info = self._manifest['segments'][self._rel_path(path)]
+        info['rows'] += batch.num_rows
+        min_max = pc.min_max(batch.column(self.timestamp_field)).as_py()
+        batch_min = min_max['min'].isoformat()
+        batch_max = min_max['max'].isoformat()
+        if info['min_timestamp'] is None or batch_min < info['min_timestamp']:
+            info['min_timestamp'] = batch_min
+        if info['max_timestamp'] is None or batch_max > info['max_timestamp']:
+            info['max_timestamp'] = batch_max
+
+        new_symbols = set(bucket_symbols).difference(info['symbols'])
+        if new_symbols:
+            info['symbols'] = sorted(new_symbols.union(info['symbols']))
+            dirty = True
+        return dirty
+
+    def _rel_path(self, path):
+        return str(path.relative_to(partition_dir(self.base_path, self._current_hour)))
+
+    def _open_segment(self, bucket):
+        """为分桶打开新的段文件，不覆盖已有文件"""
+        bucket_dir = partition_dir(self.base_path, self._current_hour) / f"symbol_bucket={bucket:02d}"
+        bucket_dir.mkdir(parents=True, exist_ok=True)
+        seq = 0
+        path = bucket_dir / f"part-{seq}.arrow"
+        while path.exists():
+            seq += 1
+            path = bucket_dir / f"part-{seq}.arrow"
+
+        sink = pa.OSFile(str(path), 'wb')
+        writer = ipc.new_stream(sink, self.schema, options=self.write_options)
+        self._segments[bucket] = (sink, writer, path)
+        self._manifest['segments'][self._rel_path(path)] = {
+            'bucket': bucket,
+            'rows': 0,
+            'min_timestamp': None,
+            'max_timestamp': None,
+            'symbols': [],
+            'closed': False,
+        }
+
+    def _rotate(self, key):
+        """关闭当前小时的所有段并切换到新小时"""
+        self._close_current()
+        self._current_hour = key
+        partition_dir(self.base_path, key).mkdir(parents=True, exist_ok=True)
+        self._manifest = load_manifest(self.base_path, key) or {
+            'num_buckets': self.num_buckets,
+            'segments': {},
+        }
+        logger.info(f"切换Arrow分区 {partition_dir(self.base_path, key)}")
+
+    def _save_manifest(self):
+        """原子地写入manifest"""
+        manifest_path = partition_dir(self.base_path, self._current_hour) / MANIFEST_NAME
+        tmp_path = manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+
+    def _close_current(self):
+        """关闭当前小时的所有段文件并落盘manifest"""
+        if self._current_hour is None:
+            return
+        for sink, writer, path in self._segments.values():
+            try:
+                writer.close()
+            finally:
+                sink.close()
+            self._manifest['segments'][self._rel_path(path)]['closed'] = True
+        if self._segments:
+            self._save_manifest()
+            logger.info(f"关闭Arrow分区 {partition_dir(self.base_path, self._current_hour)}")
+        self._segments = {}
+        self._manifest = None
+        self._current_hour = None
+
+    def close(self):
+        """关闭写入器"""
+        with self._lock:
+            self._close_current()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+列式Tick构建器 - 预分配的按列缓冲区，直接生成Arrow RecordBatch，以及写入刷新策略
+"""
+import pyarrow as pa
+import numpy as np
+from datetime import datetime, timedelta
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_US = timedelta(microseconds=1)
+
+
+def to_epoch_ns(ts):
+    """将时间戳转换为纳秒整数（无时区，保持本地墙上时间）"""
+    if isinstance(ts, (int, np.integer)):
+        return int(ts)
+    if isinstance(ts, datetime):
+        if ts.tzinfo is not None:
+            ts = ts.replace(tzinfo=None)
+        return ((ts - _EPOCH) // _ONE_US) * 1000
+    return int(np.datetime64(ts, 'ns').astype(np.int64))
+
+
+def _numpy_dtype(arrow_type):
+    """Arrow字段类型对应的缓冲区dtype"""
+    if pa.types.is_timestamp(arrow_type):
+        return np.int64
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return object
+    return arrow_type.to_pandas_dtype()
+
+
+class ColumnarTickBuilder:
+    """列式Tick累加器
+
+    按 arrow_schema 为每个字段预分配类型化的NumPy缓冲区，逐行追加后
+    直接转换为 pa.RecordBatch，不经过逐条dict和pandas的转换。
+    行数据可以是按schema字段顺序排列的tuple，也可以是字段名到值的dict。
+    """
+
+    def __init__(self, schema, capacity=1024):
+        self.schema = schema
+        self.capacity = capacity
+        self.field_names = schema.names
+        self._converters = [
+            to_epoch_ns if pa.types.is_timestamp(field.type) else None for field in schema
+        ]
+        self._buffers = [np.empty(capacity, dtype=_numpy_dtype(field.type)) for field in schema]
+        self._string_cols = [i for i, buf in enumerate(self._buffers) if buf.dtype == object]
+        # 每行的定长字节数（字符串列按4字节偏移量计，字符内容按UTF-8编码字节数另行累计）
+        self._row_width = sum(
+            buf.dtype.itemsize if buf.dtype != object else 4 for buf in self._buffers
+        )
+        self._size = 0
+        self._string_bytes = 0
+        self.first_append_at = None   # 缓冲区中最早一行的追加时间（time.monotonic）
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        """已累积数据的估算字节数"""
+        return self._size * self._row_width + self._string_bytes
+
+    @property
+    def age_ms(self):
+        """缓冲区中最早一行已等待的毫秒数"""
+        if self.first_append_at is None:
+            return 0.0
+        return (time.monotonic() - self.first_append_at) * 1000
+
+    @property
+    def is_full(self):
+        """缓冲区是否已满"""
+        return self._size >= self.capacity
+
+    def append(self, row):
+        """追加一行数据（tuple按schema顺序，或dict按字段名）"""
+        if isinstance(row, dict):
+            row = tuple(row[name] for name in self.field_names)
+
+        if self._size >= self.capacity:
+            self._grow()
+
+        idx = self._size
+        for buf, convert, value in zip(self._buffers, self._converters, row):
+            buf[idx] = convert(value) if convert is not None else value
+        for col in self._string_cols:
+            self._string_bytes += len(row[col].encode())
+        if idx == 0:
+            self.first_append_at = time.monotonic()
+        self._size += 1
+
+    def extend(self, rows):
+        """追加多行数据"""
+        for row in rows:
+            self.append(row)
+
+    def _grow(self):
+        """容量不足时按2倍扩容"""
+        new_capacity = self.capacity * 2
+        for col, buf in enumerate(self._buffers):
+            new_buf = np.empty(new_capacity, dtype=buf.dtype)
+            new_buf[:self._size] = buf[:self._size]
+            self._buffers[col] = new_buf
+        logger.debug(f"列式缓冲区扩容: {self.capacity} -> {new_capacity}")
+        self.capacity = new_capacity
+
+    def to_record_batch(self):
+        """将已累积的数据转换为RecordBatch（复制当前行，缓冲区可继续复用）"""
+        n = self._size
+        arrays = [
+            pa.array(buf[:n].copy() if buf.dtype != object else buf[:n], type=field.type)
+            for buf, field in zip(self._buffers, self.schema)
+        ]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def reset(self):
+        """清空缓冲区（保留已分配的内存）"""
+        if self._size:
+            for buf in self._buffers:
+                if buf.dtype == object:
+                    buf[:self._size] = None
+        self._size = 0
+        self._string_bytes = 0
+        self.first_append_at = None
+
+    def flush(self):
+        """生成RecordBatch并清空缓冲区"""
+        batch = self.to_record_batch()
+        self.reset()
+        return batch
+
+
+class FlushPolicy:
+    """Arrow写入刷新策略
+
+    满足任一条件即刷新：行数达到 max_rows、估算字节数达到 max_bytes、
+    最早一行等待时间达到 max_age_ms。为None的条件不生效。
+    用于在特征新鲜度和写放大之间按部署调节。
+    """
+
+    def __init__(self, max_rows=100, max_bytes=None, max_age_ms=1000):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age_ms = max_age_ms
+
+    @classmethod
+    def from_config(cls, config):
+        """从 data_sources 配置构建"""
+        return cls(
+            max_rows=config.get('flush_max_rows', 100),
+            max_bytes=config.get('flush_max_bytes'),
+            max_age_ms=config.get('flush_max_age_ms', 1000),
+        )
+
+    def should_flush(self, builder):
+        """是否应当刷新，返回触发原因（rows/bytes/age），不需要刷新时返回None"""
+        if not len(builder):
+            return None
+        if self.max_rows is not None and len(builder) >= self.max_rows:
+            return 'rows'
+        if self.max_bytes is not None and builder.nbytes >= self.max_bytes:
+            return 'bytes'
+        if self.max_age_ms is not None and builder.age_ms >= self.max_age_ms:
+            return 'age'
+        return None
+
+    def wait_timeout(self, builder, idle_timeout=1.0):
+        """从队列取数据时的等待秒数：缓冲区非空时不超过距离按时间刷新的剩余时间"""
+        if not len(builder) or self.max_age_ms is None:
+            return idle_timeout
+        return max(0.0, (self.max_age_ms - builder.age_ms) / 1000)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Arrow缓存压实 - 将已关闭小时的Arrow段合并为按交易对聚簇排序的Parquet文件
+"""
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    from .arrow_store import (MANIFEST_NAME, hourly_files, partition_dir, partitioned_files,
+                              read_ipc_table)
+except ImportError:
+    from arrow_store import (MANIFEST_NAME, hourly_files, partition_dir, partitioned_files,
+                             read_ipc_table)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def remove_empty_dirs(directory, root):
+    """自下而上删除空目录，直到 root（不含）或遇到非空目录"""
+    directory, root = Path(directory), Path(root)
+    while directory != root and root in directory.parents:
+        try:
+            directory.rmdir()
+        except OSError:
+            break
+        directory = directory.parent
+
+
+class ArrowCompactor:
+    """Arrow缓存压实任务
+
+    把已关闭小时（早于最近 keep_recent_hours 个小时）的所有段文件，无论按小时还是
+    按交易对分区布局写入，合并为 {output_path}/date=YYYYMMDD/ohlc_YYYYMMDD_HH.parquet。
+    数据按 (symbol, timestamp) 排序，row group 带统计信息，DuckDB/dbt 读取历史数据时
+    可以按交易对和时间做谓词下推（ArrowProcessor 以 history_glob 建立 ohlc_history 视图）。
+    压实成功后删除源段文件。keep_recent_hours 至少为1，当前正在写入的小时不会被压实。
+    """
+
+    def __init__(self, arrow_cache_path, output_path, keep_recent_hours=2,
+                 row_group_size=65536, compression="zstd", delete_source=True):
+        if keep_recent_hours < 1:
+            raise ValueError(f"keep_recent_hours 至少为1（当前小时仍在写入），当前: {keep_recent_hours}")
+        self.arrow_cache_path = Path(arrow_cache_path)
+        self.output_path = Path(output_path)
+        self.keep_recent_hours = keep_recent_hours
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.delete_source = delete_source
+
+        self.is_running = False
+        self.background_thread = None
+
+    @classmethod
+    def from_config(cls, config):
+        """从 data_sources 配置构建"""
+        arrow_cache_path = Path(config['arrow_cache_path'])
+        return cls(
+            arrow_cache_path,
+            config.get('compaction_path') or arrow_cache_path.parent / 'ohlc_history',
+            keep_recent_hours=config.get('compaction_keep_recent_hours', 2),
+            row_group_size=config.get('compaction_row_group_size', 65536),
+            compression=config.get('compaction_compression', 'zstd'),
+        )
+
+    @property
+    def history_glob(self):
+        """压实后Parquet文件的glob路径，供DuckDB read_parquet使用"""
+        return str(self.output_path / "date=*" / "ohlc_*.parquet")
+
+    def output_file(self, key):
+        """某个小时压实后的Parquet路径"""
+        date_part = key.split('_')[0]
+        return self.output_path / f"date={date_part}" / f"ohlc_{key}.parquet"
+
+    def _source_segments(self, key):
+        """某个小时的全部源段文件（两种布局）"""
+        return hourly_files(self.arrow_cache_path, key) + \
+            partitioned_files(self.arrow_cache_path, key)
+
+    def closed_hours(self, now=None):
+        """列出可以压实的小时键"""
+        now = now or datetime.now()
+        cutoff = (now.replace(minute=0, second=0, microsecond=0)
+                  - timedelta(hours=self.keep_recent_hours - 1)).strftime("%Y%m%d_%H")
+
+        keys = set()
+        for path in self.arrow_cache_path.glob("ohlc_*.arrow"):
+            parts = path.stem.split('_')
+            if len(parts) >= 3:
+                keys.add(f"{parts[1]}_{parts[2]}")
+        for hour_dir in self.arrow_cache_path.glob("date=*/hour=*"):
+            keys.add(f"{hour_dir.parent.name[5:]}_{hour_dir.name[5:]}")
+
+        return sorted(key for key in keys if key < cutoff)
+
+    def compact_hour(self, key):
+        """压实一个小时，返回写入的行数"""
+        segments = self._source_segments(key)
+        output_file = self.output_file(key)
+        if not segments:
+            return 0
+
+        tables = [read_ipc_table(path).replace_schema_metadata(None) for path in segments]
+        if output_file.exists():
+            # 重复运行时与已有结果合并，保证幂等
+            tables.append(pq.read_table(output_file))
+        table = pa.concat_tables(tables, promote_options='permissive')
+        table = table.sort_by([('symbol', 'ascending'), ('timestamp', 'ascending')])
+
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = output_file.with_suffix('.parquet.tmp')
+        pq.write_table(
+            table, tmp_file,
+            row_group_size=self.row_group_size,
+            compression=self.compression,
+            write_statistics=True,
+            sorting_columns=[
+                pq.SortingColumn(table.schema.get_field_index('symbol')),
+                pq.SortingColumn(table.schema.get_field_index('timestamp')),
+            ],
+        )
+        os.replace(tmp_file, output_file)
+
+        if self.delete_source:
+            # 只删除已压实的段文件及其manifest，分区目录在清空后才删除
+            hour_dir = partition_dir(self.arrow_cache_path, key)
+            for path in segments:
+                path.unlink(missing_ok=True)
+                remove_empty_dirs(path.parent, hour_dir)
+            (hour_dir / MANIFEST_NAME).unlink(missing_ok=True)
+            remove_empty_dirs(hour_dir, self.arrow_cache_path)
+
+        logger.info(f"压实 {key}: {len(segments)} 个段文件, {table.num_rows} 条数据 -> {output_file}")
+        return table.num_rows
+
+    def run_once(self, now=None):
+        """压实所有已关闭的小时，返回压实的行数"""
+        total = 0
+        for key in self.closed_hours(now):
+            try:
+                total += self.compact_hour(key)
+            except Exception as e:
+                logger.error(f"压实 {key} 时出错: {e}")
+        return total
+
+    def start_background_compaction(self, interval=600):
+        """启动后台压实服务"""
+        if self.is_running:
+            logger.warning("后台压实服务已在运行")
+            return
+
+        self.is_running = True
+
+        def background_worker():
+            logger.info(f"后台压实服务已启动，间隔: {interval}秒")
+            while self.is_running:
+                self.run_once()
+                # 分段等待，便于及时停止
+                for _ in range(int(interval)):
+                    if not self.is_running:
+                        break
+                    time.sleep(1)
+
+        self.background_thread = threading.Thread(target=background_worker, daemon=True)
+        self.background_thread.start()
+
+    def stop_background_compaction(self):
+        """停止后台压实服务"""
+        if self.is_running:
+            logger.info("停止后台压实服务...")
+            self.is_running = False
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+DuckDB连接管理 - 应用配置的线程数/内存限制，并为每个工作线程分配独立游标
+"""
+import duckdb
+import logging
+import os
+import threading
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class DuckDBConnectionManager:
+    """托管的DuckDB连接
+
+    打开一个数据库实例并应用 threads / memory_limit 设置，cursor() 为调用线程
+    返回它专属的游标（同一数据库实例上的独立连接），因此加载、特征查询与导出
+    可以在不同线程中并行执行而无需共享一个连接。
+    """
+
+    def __init__(self, db_path, threads=None, memory_limit=None):
+        self.db_path = str(db_path)
+        self.threads = threads
+        self.memory_limit = memory_limit
+
+        config = {}
+        if threads:
+            config['threads'] = threads
+        if memory_limit:
+            config['memory_limit'] = memory_limit
+
+        if self.db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = duckdb.connect(self.db_path, config=config)
+        self._local = threading.local()
+        self._cursors = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        logger.info(f"DuckDB连接已打开: {self.db_path}（threads={threads}, memory_limit={memory_limit}）")
+
+    @classmethod
+    def from_config(cls, config, db_path=None):
+        """从 database.yml 的完整配置构建（使用 duckdb.realtime_db_path 与 duckdb.config）"""
+        duckdb_config = config.get('duckdb', {})
+        settings = duckdb_config.get('config', {})
+        return cls(
+            db_path or duckdb_config.get('realtime_db_path', '/workspace/data/realtime_features.duckdb'),
+            threads=settings.get('threads'),
+            memory_limit=settings.get('memory_limit'),
+        )
+
+    def cursor(self):
+        """返回当前线程的游标，首次调用时创建"""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            with self._lock:
+                if self._closed:
+                    raise duckdb.ConnectionException("DuckDB连接已关闭")
+                cursor = self._conn.cursor()
+                self._cursors.append(cursor)
+            self._local.cursor = cursor
+        return cursor
+
+    def settings(self):
+        """返回当前生效的 threads 与 memory_limit"""
+        threads, memory_limit = self.cursor().execute(
+            "SELECT current_setting('threads'), current_setting('memory_limit')"
+        ).fetchone()
+        return {'threads': threads, 'memory_limit': memory_limit}
+
+    def close(self):
+        """关闭所有游标与数据库连接"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for cursor in self._cursors:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+            self._cursors = []
+            self._conn.close()
@@ -42,7 +42,7 @@ class FeastPusher:
         
         try:
             # 准备数据格式
-            feature_df = self._prepare_feature_dataframe([features])
+            feature_df = self.prepare_feature_dataframe([features])
             
             if feature_df.empty:
                 logger.warning("特征数据为空，跳过推送")
@@ -70,7 +70,7 @@ class FeastPusher:
         
         try:
             # 准备数据格式
-            feature_df = self._prepare_feature_dataframe(features_list)
+            feature_df = self.prepare_feature_dataframe(features_list)
             
             if feature_df.empty:
                 logger.warning("特征数据为空，跳过推送")
@@ -87,7 +87,25 @@ class FeastPusher:
             logger.error(f"批量推送特征时出错: {e}")
             return 0
     
-    def _prepare_feature_dataframe(self, features_list: List[Dict]) -> pd.DataFrame:
+    def push_feature_dataframe(self, feature_df: pd.DataFrame) -> int:
+        """推送已准备好的特征DataFrame（流水线的序列化阶段已完成格式转换）"""
+        if not self.fs:
+            logger.error("Feast存储未初始化")
+            return 0
+        
+        if feature_df is None or feature_df.empty:
+            return 0
+        
+        try:
+            self.fs.push("realtime_features_push_source", feature_df)
+            logger.info(f"成功批量推送 {len(feature_df)} 条实时特征")
+            return len(feature_df)
+            
+        except Exception as e:
+            logger.error(f"批量推送特征时出错: {e}")
+            return 0
+    
+    def prepare_feature_dataframe(self, features_list: List[Dict]) -> pd.DataFrame:
         """准备特征数据格式用于Feast推送"""
         try:
             if not features_list:
@@ -118,7 +136,7 @@ class FeastPusher:
                     'ma_5': 'ma_5',
                     'ma_10': 'ma_10',
                     'rsi_14': 'rsi_14',
-                    'volatility_20d': 'volatility',
+                    'volatility': 'volatility_20d',
                     'volume_ratio': 'volume_ratio',
                     'momentum_5d': 'momentum_5d'
                 }
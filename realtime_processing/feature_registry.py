@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+特征注册表 - 声明每个特征的输入列、回看窗口与依赖，按请求的特征子集只计算所需的子图
+
+指标的计算与回退值全部调用 indicator_kernels 中的定义；节点沿最后一维计算，同一张图既可用于
+单个序列，也可用于 symbols × time 价格面板。被多个特征共享的中间结果（MACD三线、布林带）
+也注册为节点，只计算一次。
+"""
+from collections import ChainMap
+import logging
+
+import numpy as np
+
+try:
+    from .indicator_kernels import (HIGH_VOLUME_RATIO, RSI_OVERBOUGHT, RSI_OVERSOLD,
+                                    STOCH_OVERBOUGHT, STOCH_OVERSOLD, atr, bollinger,
+                                    breakout_signal, doji, double_signal, ema, flag, gap_down,
+                                    gap_up, hammer, high_low_ratio, macd, moving_average, obv,
+                                    open_close_ratio, price_position, rate_of_change,
+                                    reversal_signal, rsi, shooting_star, squeeze_scalar,
+                                    stochastic_k, strong_uptrend, trend_strength, volatility,
+                                    volume_ratio)
+except ImportError:
+    from indicator_kernels import (HIGH_VOLUME_RATIO, RSI_OVERBOUGHT, RSI_OVERSOLD,
+                                   STOCH_OVERBOUGHT, STOCH_OVERSOLD, atr, bollinger,
+                                   breakout_signal, doji, double_signal, ema, flag, gap_down,
+                                   gap_up, hammer, high_low_ratio, macd, moving_average, obv,
+                                   open_close_ratio, price_position, rate_of_change,
+                                   reversal_signal, rsi, shooting_star, squeeze_scalar,
+                                   stochastic_k, strong_uptrend, trend_strength, volatility,
+                                   volume_ratio)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 原始输入列
+RAW_INPUTS = ('open', 'high', 'low', 'close', 'volume')
+
+# 计算任何特征所需的最少K线数（与 FeatureCalculator.calculate_comprehensive_features 一致）
+MIN_BARS = 5
+
+# realtime_features_push_source 推送的特征（feast_config/feature_repo/features.py）
+REALTIME_PUSH_FEATURES = [
+    'price', 'volume', 'ma_5', 'ma_10', 'rsi_14', 'volatility_20d', 'volume_ratio', 'momentum_5d',
+]
+
+
+class FeatureSpec:
+    """一个特征（或中间结果）的声明
+
+    inputs 为用到的原始列，deps 为依赖的其他节点，lookback 为得到真实值（而非
+    窗口不足时的回退值）所需的K线数。func(ctx) 从 ctx 读取输入与依赖并返回值。
+    """
+
+    def __init__(self, name, func, inputs=(), deps=(), lookback=1, public=True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.deps = tuple(deps)
+        self.lookback = lookback
+        self.public = public
+
+    def __repr__(self):
+        return f'FeatureSpec({self.name!r}, deps={self.deps}, lookback={self.lookback})'
+
+
+class FeatureRegistry:
+    """特征注册表与按需计算引擎"""
+
+    def __init__(self):
+        self._specs = {}
+        self._plans = {}
+
+    def register(self, spec):
+        unknown = set(spec.inputs) - set(RAW_INPUTS)
+        if unknown:
+            raise ValueError(f'特征 {spec.name} 使用了未知的输入列: {sorted(unknown)}')
+        self._specs[spec.name] = spec
+        self._plans = {}
+        return spec
+
+    def feature(self, name, inputs=(), deps=(), lookback=1, public=True):
+        """以装饰器方式注册特征"""
+        def decorator(func):
+            self.register(FeatureSpec(name, func, inputs, deps, lookback, public))
+            return func
+        return decorator
+
+    def names(self):
+        """所有对外特征名（按注册顺序）"""
+        return [name for name, spec in self._specs.items() if spec.public]
+
+    def spec(self, name):
+        if name not in self._specs:
+            raise ValueError(f'未知特征: {name}')
+        return self._specs[name]
+
+    def resolve(self, names=None):
+        """返回计算 names 所需的全部节点（依赖在前的拓扑顺序）"""
+        names = tuple(self.names() if names is None else names)
+        key = tuple(sorted(set(names)))
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+
+        plan = []
+        state = {}  # 节点名 -> 'visiting' / 'done'
+
+        def visit(name, path):
+            status = state.get(name)
+            if status == 'done':
+                return
+            if status == 'visiting':
+                raise ValueError(f"特征依赖存在环: {' -> '.join(path + [name])}")
+            state[name] = 'visiting'
+            spec = self.spec(name)
+            for dep in spec.deps:
+                visit(dep, path + [name])
+            state[name] = 'done'
+            plan.append(spec)
+
+        for name in names:
+            visit(name, [])
+        self._plans[key] = plan
+        return plan
+
+    def min_lookback(self, names=None):
+        """计算 names 得到真实值所需的最少K线数"""
+        return max([MIN_BARS] + [spec.lookback for spec in self.resolve(names)])
+
+    def required_inputs(self, names=None):
+        """计算 names 需要的原始列"""
+        return sorted({column for spec in self.resolve(names) for column in spec.inputs})
+
+    def compute(self, columns, names=None, lengths=None, kernels=None):
+        """按依赖顺序只计算 names 所需的节点
+
+        columns 为原始列名到按时间正序排列的数组：单个序列，或 symbols × time 面板
+        （lengths 为每行的真实K线数）。kernels 指定单个序列上EMA/RSI/ATR/OBV的计算后端。
+        返回 {特征名: 值}（只含 names），单个序列时为Python标量，面板时为每个交易对一个值的数组。
+        原始列优先于同名特征（如 volume），节点函数读到的始终是原始数组。
+        """
+        names = self.names() if names is None else list(names)
+        raw = {column: np.asarray(values, dtype=np.float64) for column, values in columns.items()}
+        raw['n'] = raw['close'].shape[-1] if lengths is None else np.asarray(lengths)
+        raw['kernels'] = kernels
+        values = {}
+        ctx = ChainMap(raw, values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for spec in self.resolve(names):
+                values[spec.name] = spec.func(ctx)
+        return {name: squeeze_scalar(values[name]) for name in names}
+
+
+# ---- 特征定义 ----
+
+REGISTRY = FeatureRegistry()
+feature = REGISTRY.feature
+
+
+def _last(ctx, column):
+    """最新K线的某一列（面板时为每个交易对一个值）"""
+    return ctx[column][..., -1]
+
+
+def _candle(ctx):
+    return _last(ctx, 'open'), _last(ctx, 'high'), _last(ctx, 'low'), _last(ctx, 'close')
+
+
+# 共享中间结果
+feature('macd_12_26_9', inputs=['close'], lookback=26, public=False)(
+    lambda ctx: macd(ctx['close'], 12, 26, 9, ctx['n'], ctx['kernels']))
+feature('bollinger_20', inputs=['close'], lookback=20, public=False)(
+    lambda ctx: bollinger(ctx['close'], 20, ctx['n']))
+
+# 基础价格特征
+feature('price', inputs=['close'])(lambda ctx: _last(ctx, 'close'))
+feature('volume', inputs=['volume'])(lambda ctx: _last(ctx, 'volume').astype(np.int64))
+feature('daily_return', inputs=['close'], lookback=2)(
+    lambda ctx: rate_of_change(ctx['close'], 1, ctx['n']))
+feature('high_low_ratio', inputs=['high', 'low', 'close'])(
+    lambda ctx: high_low_ratio(_last(ctx, 'high'), _last(ctx, 'low'), _last(ctx, 'close')))
+feature('open_close_ratio', inputs=['open', 'close'])(
+    lambda ctx: open_close_ratio(_last(ctx, 'open'), _last(ctx, 'close')))
+feature('price_position', inputs=['high', 'low', 'close'])(
+    lambda ctx: price_position(_last(ctx, 'high'), _last(ctx, 'low'), _last(ctx, 'close')))
+
+
+# 趋势指标
+def _moving_average(period):
+    return lambda ctx: moving_average(ctx['close'], period, ctx['n'])
+
+
+for _period in (5, 10, 20):
+    feature(f'ma_{_period}', inputs=['close'], lookback=_period)(_moving_average(_period))
+
+feature('price_above_ma5', inputs=['close'], deps=['ma_5'])(
+    lambda ctx: flag(_last(ctx, 'close') > ctx['ma_5']))
+feature('price_above_ma10', inputs=['close'], deps=['ma_10'])(
+    lambda ctx: flag(_last(ctx, 'close') > ctx['ma_10']))
+feature('price_above_ma20', inputs=['close'], deps=['ma_20'])(
+    lambda ctx: flag(_last(ctx, 'close') > ctx['ma_20']))
+feature('ma5_above_ma10', deps=['ma_5', 'ma_10'])(lambda ctx: flag(ctx['ma_5'] > ctx['ma_10']))
+feature('ma10_above_ma20', deps=['ma_10', 'ma_20'])(lambda ctx: flag(ctx['ma_10'] > ctx['ma_20']))
+feature('ema_12', inputs=['close'], lookback=12)(
+    lambda ctx: ema(ctx['close'], 12, ctx['n'], ctx['kernels']))
+feature('ema_26', inputs=['close'], lookback=26)(
+    lambda ctx: ema(ctx['close'], 26, ctx['n'], ctx['kernels']))
+
+# 动量指标
+feature('rsi_14', inputs=['close'], lookback=14)(
+    lambda ctx: rsi(ctx['close'], 14, ctx['n'], ctx['kernels']))
+feature('rsi_overbought', deps=['rsi_14'])(lambda ctx: flag(ctx['rsi_14'] > RSI_OVERBOUGHT))
+feature('rsi_oversold', deps=['rsi_14'])(lambda ctx: flag(ctx['rsi_14'] < RSI_OVERSOLD))
+feature('stoch_k_14', inputs=['high', 'low', 'close'], lookback=14)(
+    lambda ctx: stochastic_k(ctx['high'], ctx['low'], ctx['close'], 14, lengths=ctx['n']))
+feature('stoch_overbought', deps=['stoch_k_14'])(
+    lambda ctx: flag(ctx['stoch_k_14'] > STOCH_OVERBOUGHT))
+feature('stoch_oversold', deps=['stoch_k_14'])(lambda ctx: flag(ctx['stoch_k_14'] < STOCH_OVERSOLD))
+
+
+def _momentum(period):
+    return lambda ctx: rate_of_change(ctx['close'], period, ctx['n'])
+
+
+feature('momentum_5d', inputs=['close'], lookback=6)(_momentum(5))
+feature('momentum_10d', inputs=['close'], lookback=11)(_momentum(10))
+feature('momentum_5d_positive', deps=['momentum_5d'])(lambda ctx: flag(ctx['momentum_5d'] > 0))
+feature('momentum_10d_positive', deps=['momentum_10d'])(lambda ctx: flag(ctx['momentum_10d'] > 0))
+
+feature('macd', deps=['macd_12_26_9'], lookback=26)(lambda ctx: ctx['macd_12_26_9'][0])
+feature('macd_signal', deps=['macd_12_26_9'], lookback=26)(lambda ctx: ctx['macd_12_26_9'][1])
+feature('macd_histogram', deps=['macd_12_26_9'], lookback=26)(lambda ctx: ctx['macd_12_26_9'][2])
+feature('macd_bullish', deps=['macd', 'macd_signal'], lookback=26)(
+    lambda ctx: flag(ctx['macd'] > ctx['macd_signal']))
+
+# 波动率指标
+feature('volatility_20d', inputs=['close'], lookback=20)(
+    lambda ctx: volatility(ctx['close'], 20, ctx['n']))
+feature('bollinger_upper', deps=['bollinger_20'], lookback=20)(lambda ctx: ctx['bollinger_20'][0])
+feature('bollinger_lower', deps=['bollinger_20'], lookback=20)(lambda ctx: ctx['bollinger_20'][1])
+feature('bollinger_width', deps=['bollinger_20'], lookback=20)(lambda ctx: ctx['bollinger_20'][2])
+feature('bb_position', deps=['bollinger_20'], lookback=20)(lambda ctx: ctx['bollinger_20'][3])
+feature('price_above_bb_upper', inputs=['close'], deps=['bollinger_upper'], lookback=20)(
+    lambda ctx: flag((ctx['n'] >= 20) & (_last(ctx, 'close') > ctx['bollinger_upper'])))
+feature('price_below_bb_lower', inputs=['close'], deps=['bollinger_lower'], lookback=20)(
+    lambda ctx: flag((ctx['n'] >= 20) & (_last(ctx, 'close') < ctx['bollinger_lower'])))
+feature('atr_14', inputs=['high', 'low', 'close'], lookback=14)(
+    lambda ctx: atr(ctx['high'], ctx['low'], ctx['close'], 14, ctx['n'], ctx['kernels']))
+
+# 成交量指标
+feature('avg_volume_20d', inputs=['volume'], lookback=20)(
+    lambda ctx: moving_average(ctx['volume'], 20, ctx['n']))
+feature('volume_ratio', inputs=['volume'], deps=['avg_volume_20d'])(
+    lambda ctx: volume_ratio(_last(ctx, 'volume'), ctx['avg_volume_20d']))
+feature('high_volume', deps=['volume_ratio'])(
+    lambda ctx: flag(ctx['volume_ratio'] > HIGH_VOLUME_RATIO))
+feature('vpt', inputs=['volume'], deps=['daily_return'], lookback=2)(
+    lambda ctx: _last(ctx, 'volume') * ctx['daily_return'])
+feature('obv_5', inputs=['close', 'volume'], lookback=5)(
+    lambda ctx: obv(ctx['close'], ctx['volume'], 5, ctx['n'], ctx['kernels']))
+
+# 模式识别特征
+feature('doji', inputs=['open', 'high', 'low', 'close'])(lambda ctx: doji(*_candle(ctx)))
+feature('hammer', inputs=['open', 'high', 'low', 'close'])(lambda ctx: hammer(*_candle(ctx)))
+feature('shooting_star', inputs=['open', 'high', 'low', 'close'])(
+    lambda ctx: shooting_star(*_candle(ctx)))
+feature('gap_up', inputs=['high', 'low'], lookback=2)(
+    lambda ctx: gap_up(ctx['high'], ctx['low'], ctx['n']))
+feature('gap_down', inputs=['high', 'low'], lookback=2)(
+    lambda ctx: gap_down(ctx['high'], ctx['low'], ctx['n']))
+
+# 组合特征
+feature('double_overbought', deps=['rsi_overbought', 'stoch_overbought'])(
+    lambda ctx: double_signal(ctx['rsi_overbought'], ctx['stoch_overbought']))
+feature('double_oversold', deps=['rsi_oversold', 'stoch_oversold'])(
+    lambda ctx: double_signal(ctx['rsi_oversold'], ctx['stoch_oversold']))
+feature('trend_strength',
+        deps=['price_above_ma5', 'ma5_above_ma10', 'ma10_above_ma20', 'momentum_5d_positive'])(
+    lambda ctx: trend_strength(ctx['price_above_ma5'], ctx['ma5_above_ma10'],
+                               ctx['ma10_above_ma20'], ctx['momentum_5d_positive']))
+feature('strong_uptrend', deps=['trend_strength'])(
+    lambda ctx: strong_uptrend(ctx['trend_strength']))
+feature('reversal_signal', deps=['doji', 'hammer'])(
+    lambda ctx: reversal_signal(ctx['doji'], ctx['hammer']))
+feature('breakout_signal', deps=['price_above_bb_upper', 'high_volume'])(
+    lambda ctx: breakout_signal(ctx['price_above_bb_upper'], ctx['high_volume']))
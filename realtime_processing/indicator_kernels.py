@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+指标计算内核 - 实时链路中所有技术指标的唯一定义
+
+- 指标定义（ma/ema/macd/rsi/stochastic_k/volatility/bollinger/atr/obv、单根K线的比率与形态、
+  组合信号等）：沿最后一维计算，既可用于单个序列，也可用于 symbols × time 价格面板（lengths
+  为每行的真实K线数），窗口不足时的回退值也在这里定义。特征注册表（及经由注册表的
+  FeatureCalculator 与面板计算）都调用这里的定义。
+- EMA/ATR/RSI/OBV 等逐点递推或循环计算的单序列内核，作为上述定义在单个序列上的计算后端：
+  - numba: 用 numba.njit 编译循环内核（需要安装 numba，可选依赖）
+  - numpy: 未安装 numba 时的纯NumPy实现（EMA按块用闭式向量化，其余指标只处理所需的尾部窗口）
+  两个后端的结果一致，get_kernels() 默认优先使用 numba。
+"""
+import logging
+import math
+
+import numpy as np
+
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    numba = None
+    NUMBA_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKEND_NUMBA = "numba"
+BACKEND_NUMPY = "numpy"
+
+# 信号阈值
+RSI_OVERBOUGHT = 70
+RSI_OVERSOLD = 30
+STOCH_OVERBOUGHT = 80
+STOCH_OVERSOLD = 20
+HIGH_VOLUME_RATIO = 1.5
+DOJI_BODY_RATIO = 0.1
+STRONG_TREND_SIGNALS = 3
+
+
+# ---- 循环内核（numba可编译的写法，未编译时也作为参考实现） ----
+
+def _ema_loop(values, alpha):
+    """以第一个值为初值的EMA序列"""
+    out = np.empty(values.shape[0])
+    if values.shape[0] == 0:
+        return out
+    out[0] = values[0]
+    for i in range(1, values.shape[0]):
+        out[i] = alpha * values[i] + (1 - alpha) * out[i - 1]
+    return out
+
+
+def _true_range_loop(highs, lows, closes):
+    """真实波幅序列（从第二根K线开始）"""
+    n = closes.shape[0]
+    out = np.empty(max(n - 1, 0))
+    for i in range(1, n):
+        tr = highs[i] - lows[i]
+        up = abs(highs[i] - closes[i - 1])
+        down = abs(lows[i] - closes[i - 1])
+        if up > tr:
+            tr = up
+        if down > tr:
+            tr = down
+        out[i - 1] = tr
+    return out
+
+
+def _atr_loop(highs, lows, closes, period):
+    """最近 period 个真实波幅的均值；不足两根K线时为最后一根的高低差"""
+    n = closes.shape[0]
+    if n < 2:
+        return highs[n - 1] - lows[n - 1]
+    count = min(period, n - 1)
+    total = 0.0
+    for i in range(n - count, n):
+        tr = highs[i] - lows[i]
+        up = abs(highs[i] - closes[i - 1])
+        down = abs(lows[i] - closes[i - 1])
+        if up > tr:
+            tr = up
+        if down > tr:
+            tr = down
+        total += tr
+    return total / count
+
+
+def _rsi_loop(closes, period):
+    """最近 period 个有效价格变化的平均涨跌幅计算的RSI（跳过NaN）"""
+    gains = 0.0
+    losses = 0.0
+    count = 0
+    for i in range(closes.shape[0] - 1, 0, -1):
+        delta = closes[i] - closes[i - 1]
+        if math.isnan(delta):
+            continue
+        if delta > 0:
+            gains += delta
+        else:
+            losses -= delta
+        count += 1
+        if count == period:
+            break
+    if count == 0:
+        return 50.0
+    if losses == 0:
+        return 100.0
+    rs = (gains / count) / (losses / count)
+    return 100 - 100 / (1 + rs)
+
+
+def _obv_loop(closes, volumes, period):
+    """最近 period 根K线（period-1 个价格变化）的带方向成交量之和"""
+    n = closes.shape[0]
+    obv = 0.0
+    for i in range(max(n - period + 1, 1), n):
+        if closes[i] > closes[i - 1]:
+            obv += volumes[i]
+        elif closes[i] < closes[i - 1]:
+            obv -= volumes[i]
+    return obv
+
+
+# ---- 纯NumPy实现 ----
+
+def _ema_numpy(values, alpha):
+    """分块向量化的EMA（沿最后一维，面板的每行各自递推）
+
+    块内用闭式 e_t = d^(t+1)·e_(-1) + a·Σ d^(t-k)·x_k（d = 1 - a）以累加和计算，
+    块长使 d^(-块长) 不超过约 e^300，保证权重不溢出。
+    """
+    n = values.shape[-1]
+    out = np.empty(values.shape)
+    if n == 0:
+        return out
+    decay = 1 - alpha
+    if decay <= 0:
+        out[:] = values
+        return out
+
+    block = max(1, min(n, int(300 / -math.log(decay))))
+    exponents = np.arange(block)
+    growth = decay ** -(exponents + 1.0)
+    shrink = decay ** (exponents + 1.0)
+
+    previous = values[..., :1]   # 以第一个值为初值：e_0 = d·x_0 + a·x_0
+    for start in range(0, n, block):
+        x = values[..., start:start + block]
+        m = x.shape[-1]
+        weighted = np.cumsum(x * growth[:m], axis=-1)
+        out[..., start:start + m] = shrink[:m] * (previous + alpha * weighted)
+        previous = out[..., start + m - 1:start + m]
+    return out
+
+
+def _true_range_numpy(highs, lows, closes):
+    return np.maximum.reduce([
+        highs[..., 1:] - lows[..., 1:],
+        np.abs(highs[..., 1:] - closes[..., :-1]),
+        np.abs(lows[..., 1:] - closes[..., :-1]),
+    ])
+
+
+def _atr_numpy(highs, lows, closes, period):
+    if closes.shape[0] < 2:
+        return highs[-1] - lows[-1]
+    start = max(closes.shape[0] - period - 1, 0)
+    return _true_range_numpy(highs[start:], lows[start:], closes[start:]).mean()
+
+
+def _rsi_numpy(closes, period):
+    tail = closes[-(period + 1):]
+    return rsi_from_changes(np.diff(tail if not np.isnan(tail).any() else closes), period)
+
+
+def _obv_numpy(closes, volumes, period):
+    closes, volumes = closes[-period:], volumes[-period:]
+    return float((np.sign(np.diff(closes)) * volumes[1:]).sum())
+
+
+# ---- 指标定义（沿最后一维计算；lengths 为每行的真实K线数，面板左侧填充部分不参与计算） ----
+
+def valid_mask(width, lengths):
+    """面板中属于真实K线的列（右对齐，最后 lengths 列）"""
+    return np.arange(width)[None, :] >= (width - np.asarray(lengths))[:, None]
+
+
+def _last_valid(values, period, mask=None):
+    """每行最后 period 个有效值（mask 为真且非NaN）的位置"""
+    valid = ~np.isnan(values)
+    if mask is not None:
+        valid &= mask
+    elif valid.all():
+        return np.broadcast_to(np.arange(values.shape[-1]) >= values.shape[-1] - period, values.shape)
+    rank = np.cumsum(valid[..., ::-1], axis=-1)[..., ::-1]
+    return valid & (rank <= period)
+
+
+def tail_mean(values, period, mask=None):
+    """最后 period 个有效值的均值（跳过NaN）"""
+    values = np.asarray(values, dtype=np.float64)
+    take = _last_valid(values, period, mask)
+    return np.where(take, values, 0.0).sum(axis=-1) / np.maximum(take.sum(axis=-1), 1)
+
+
+def tail_std(values, period, mask=None, ddof=0):
+    """最后 period 个有效值的标准差（默认总体标准差 ddof=0）"""
+    values = np.asarray(values, dtype=np.float64)
+    take = _last_valid(values, period, mask)
+    count = take.sum(axis=-1)
+    mean = np.where(take, values, 0.0).sum(axis=-1) / np.maximum(count, 1)
+    squares = np.where(take, (values - mean[..., None]) ** 2, 0.0).sum(axis=-1)
+    return np.sqrt(squares / np.maximum(count - ddof, 1))
+
+
+def _lengths(values, lengths):
+    return values.shape[-1] if lengths is None else np.asarray(lengths)
+
+
+def moving_average(values, period, lengths=None):
+    """最近 period 个值的简单均值，不足 period 个时为最新值"""
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(_lengths(values, lengths) >= period,
+                    values[..., -period:].mean(axis=-1), values[..., -1])
+
+
+def rate_of_change(values, period, lengths=None):
+    """相对 period 根K线前的变化率（daily_return 为 period=1，动量为5/10），不足时为0"""
+    values = np.asarray(values, dtype=np.float64)
+    base = values[..., -min(period + 1, values.shape[-1])]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(_lengths(values, lengths) > period, (values[..., -1] - base) / base, 0.0)
+
+
+def returns(values):
+    """逐根K线的收益率序列，长度比输入少1"""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.diff(values, axis=-1) / values[..., :-1]
+
+
+def rsi_from_changes(changes, period, mask=None):
+    """最近 period 个有效变化（跳过NaN）的平均涨跌幅计算的RSI
+
+    没有变化时为50，平均跌幅为0时为100。收盘价差分得到实时口径的RSI。
+    """
+    changes = np.asarray(changes, dtype=np.float64)
+    if mask is None and not np.isnan(changes).any():
+        changes = changes[..., -period:]
+        count = changes.shape[-1]
+    else:
+        take = _last_valid(changes, period, mask)
+        changes, count = np.where(take, changes, 0.0), take.sum(axis=-1)
+    gains = np.where(changes > 0, changes, 0.0).sum(axis=-1)
+    losses = np.where(changes < 0, -changes, 0.0).sum(axis=-1)
+    rsi = np.where(losses == 0, 100.0, 100 - 100 / (1 + gains / np.where(losses == 0, 1.0, losses)))
+    return np.where(count > 0, rsi, 50.0)
+
+
+def stochastic_k(highs, lows, closes, period, scale=100.0, lengths=None):
+    """随机指标%K：收盘价在最近 period 根K线高低区间中的位置，区间为0或K线不足时取中值"""
+    closes = np.asarray(closes, dtype=np.float64)
+    recent_high = np.asarray(highs, dtype=np.float64)[..., -period:].max(axis=-1)
+    recent_low = np.asarray(lows, dtype=np.float64)[..., -period:].min(axis=-1)
+    close = closes[..., -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((_lengths(closes, lengths) < period) | (recent_high == recent_low), scale / 2,
+                        scale * (close - recent_low) / (recent_high - recent_low))
+
+
+def bollinger_bands(closes, period, num_std=2.0, ddof=0):
+    """布林带 (中轨, 上轨, 下轨)：最近 period 个收盘价的均值 ± num_std 倍标准差"""
+    window = np.asarray(closes, dtype=np.float64)[..., -period:]
+    middle = window.mean(axis=-1)
+    std = window.std(axis=-1, ddof=ddof)
+    return middle, middle + num_std * std, middle - num_std * std
+
+
+def ema_series(values, period):
+    """EMA序列（以第一个值为初值），values 可以是面板，每行各自递推"""
+    return _ema_numpy(np.asarray(values, dtype=np.float64), 2 / (period + 1))
+
+
+def true_range(highs, lows, closes):
+    """真实波幅序列，沿最后一维比输入少1"""
+    return _true_range_numpy(np.asarray(highs, dtype=np.float64), np.asarray(lows, dtype=np.float64),
+                             np.asarray(closes, dtype=np.float64))
+
+
+# ---- 带回退值的指标（K线不足窗口时取回退值；单个序列且给出 kernels 时用该后端计算） ----
+
+def _use_backend(kernels, values):
+    return kernels is not None and values.ndim == 1
+
+
+def _delta_mask(values, lengths):
+    """面板中两端都是真实K线的差分位置（单个序列不需要屏蔽）"""
+    if lengths is None or np.ndim(lengths) == 0:
+        return None
+    return valid_mask(values.shape[-1], lengths)[:, :-1]
+
+
+def ema(values, period, lengths=None, kernels=None):
+    """最新的EMA值，K线不足 period 根时为最新值"""
+    values = np.asarray(values, dtype=np.float64)
+    series = kernels.ema(values, period) if _use_backend(kernels, values) else ema_series(values, period)
+    return np.where(_lengths(values, lengths) >= period, series[..., -1], values[..., -1])
+
+
+def macd(closes, fast=12, slow=26, signal=9, lengths=None, kernels=None):
+    """MACD (MACD线, 信号线, 柱状图) 的最新值，K线不足 slow 根时均为0"""
+    closes = np.asarray(closes, dtype=np.float64)
+    series = kernels.ema if _use_backend(kernels, closes) else ema_series
+    line = series(closes, fast) - series(closes, slow)
+    signal_line = series(line, signal)[..., -1]
+    line = line[..., -1]
+    has_macd = _lengths(closes, lengths) >= slow
+    return (np.where(has_macd, line, 0.0), np.where(has_macd, signal_line, 0.0),
+            np.where(has_macd, line - signal_line, 0.0))
+
+
+def rsi(closes, period, lengths=None, kernels=None):
+    """RSI（最近 period 个收盘价变化的平均涨跌幅），K线不足 period 根时为50"""
+    closes = np.asarray(closes, dtype=np.float64)
+    if _use_backend(kernels, closes):
+        value = kernels.rsi(closes, period)
+    else:
+        value = rsi_from_changes(np.diff(closes, axis=-1), period, _delta_mask(closes, lengths))
+    return np.where(_lengths(closes, lengths) >= period, value, 50.0)
+
+
+def volatility(closes, period, lengths=None):
+    """最近 period 个收益率的总体标准差，K线不足 period 根时为0"""
+    closes = np.asarray(closes, dtype=np.float64)
+    value = tail_std(returns(closes), period, _delta_mask(closes, lengths))
+    return np.where(_lengths(closes, lengths) >= period, value, 0.0)
+
+
+def bollinger(closes, period, lengths=None, num_std=2.0):
+    """布林带 (上轨, 下轨, 带宽, 收盘价在带内的位置)
+
+    K线不足 period 根时上下轨为最新收盘价的 ±2%，位置为0.5。
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    close, has_bands = closes[..., -1], _lengths(closes, lengths) >= period
+    _, upper, lower = bollinger_bands(closes, period, num_std)
+    width = upper - lower
+    with np.errstate(divide='ignore', invalid='ignore'):
+        position = np.where(has_bands & (width != 0), (close - lower) / width, 0.5)
+    return (np.where(has_bands, upper, close * 1.02), np.where(has_bands, lower, close * 0.98),
+            np.where(has_bands, width, close * 0.04), position)
+
+
+def atr(highs, lows, closes, period, lengths=None, kernels=None):
+    """平均真实波幅（最近 period 个真实波幅的均值），K线不足 period 根时为最新K线的高低差"""
+    highs, lows = np.asarray(highs, dtype=np.float64), np.asarray(lows, dtype=np.float64)
+    closes = np.asarray(closes, dtype=np.float64)
+    if _use_backend(kernels, closes):
+        value = kernels.atr(highs, lows, closes, period)
+    else:
+        value = tail_mean(true_range(highs, lows, closes), period, _delta_mask(closes, lengths))
+    return np.where(_lengths(closes, lengths) >= period, value, highs[..., -1] - lows[..., -1])
+
+
+def obv(closes, volumes, period, lengths=None, kernels=None):
+    """简化OBV（最近 period 根K线的带方向成交量之和），K线不足 period 根时为0"""
+    closes, volumes = np.asarray(closes, dtype=np.float64), np.asarray(volumes, dtype=np.float64)
+    if _use_backend(kernels, closes):
+        value = kernels.obv(closes, volumes, period)
+    else:
+        signed_volumes = np.sign(np.diff(closes, axis=-1)) * volumes[..., 1:]
+        value = signed_volumes[..., max(closes.shape[-1] - period, 0):].sum(axis=-1)
+    return np.where(_lengths(closes, lengths) >= period, value, 0.0)
+
+
+def gap_up(highs, lows, lengths=None):
+    """向上跳空：最新K线的最低价高于前一根的最高价"""
+    highs, lows = np.asarray(highs, dtype=np.float64), np.asarray(lows, dtype=np.float64)
+    previous = highs[..., -min(2, highs.shape[-1])]
+    return flag((_lengths(highs, lengths) >= 2) & (lows[..., -1] > previous))
+
+
+def gap_down(highs, lows, lengths=None):
+    """向下跳空：最新K线的最高价低于前一根的最低价"""
+    highs, lows = np.asarray(highs, dtype=np.float64), np.asarray(lows, dtype=np.float64)
+    previous = lows[..., -min(2, lows.shape[-1])]
+    return flag((_lengths(highs, lengths) >= 2) & (highs[..., -1] < previous))
+
+
+# ---- 单根K线的特征（输入为最新K线的值，单个值或每个交易对一个值的数组） ----
+
+def squeeze_scalar(values):
+    """0维结果转换为Python标量，面板结果保持数组"""
+    values = np.asarray(values)
+    return values.item() if values.ndim == 0 else values
+
+
+def flag(condition):
+    """布尔条件转换为0/1"""
+    return squeeze_scalar(np.asarray(condition).astype(np.int64))
+
+
+def safe_divide(numerator, denominator, default):
+    """逐元素相除，分母为0时取 default"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return squeeze_scalar(np.where(denominator != 0, numerator / denominator, default))
+
+
+def high_low_ratio(high, low, close):
+    """振幅相对收盘价的比例"""
+    return safe_divide(np.subtract(high, low), close, 0.0)
+
+
+def open_close_ratio(open_, close):
+    """收盘价相对开盘价的涨跌幅"""
+    return safe_divide(np.subtract(close, open_), open_, 0.0)
+
+
+def price_position(high, low, close):
+    """收盘价在当根K线高低区间中的位置，无振幅时为0.5"""
+    return safe_divide(np.subtract(close, low), np.subtract(high, low), 0.5)
+
+
+def volume_ratio(volume, avg_volume):
+    """成交量相对均量的比例，均量为0时为1"""
+    return safe_divide(volume, avg_volume, 1.0)
+
+
+def _candle(open_, high, low, close):
+    """K线的 (实体, 振幅, 下影线, 上影线)"""
+    open_, high = np.asarray(open_, dtype=np.float64), np.asarray(high, dtype=np.float64)
+    low, close = np.asarray(low, dtype=np.float64), np.asarray(close, dtype=np.float64)
+    return (np.abs(close - open_), high - low,
+            np.minimum(open_, close) - low, high - np.maximum(open_, close))
+
+
+def doji(open_, high, low, close):
+    """十字星：实体小于振幅的 DOJI_BODY_RATIO"""
+    body_size, total_range, _, _ = _candle(open_, high, low, close)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return flag((total_range != 0) & (body_size / total_range < DOJI_BODY_RATIO))
+
+
+def hammer(open_, high, low, close):
+    """锤子线：下影线超过实体两倍且上影线短于实体"""
+    body_size, _, lower_shadow, upper_shadow = _candle(open_, high, low, close)
+    return flag((body_size != 0) & (lower_shadow > 2 * body_size) & (upper_shadow < body_size))
+
+
+def shooting_star(open_, high, low, close):
+    """流星线：上影线超过实体两倍且下影线短于实体"""
+    body_size, _, lower_shadow, upper_shadow = _candle(open_, high, low, close)
+    return flag((body_size != 0) & (upper_shadow > 2 * body_size) & (lower_shadow < body_size))
+
+
+# ---- 组合信号 ----
+
+def double_signal(first, second):
+    """两个信号同时成立（如RSI与%K同时超买）"""
+    return flag(np.logical_and(first, second))
+
+
+def trend_strength(price_above_ma5, ma5_above_ma10, ma10_above_ma20, momentum_positive):
+    """趋势强度：四个趋势信号之和"""
+    return squeeze_scalar(np.add(np.add(price_above_ma5, ma5_above_ma10),
+                                 np.add(ma10_above_ma20, momentum_positive)))
+
+
+def strong_uptrend(strength):
+    """强势上涨：至少 STRONG_TREND_SIGNALS 个趋势信号成立"""
+    return flag(np.greater_equal(strength, STRONG_TREND_SIGNALS))
+
+
+def reversal_signal(doji_flag, hammer_flag):
+    """反转信号：只由K线形态（十字星或锤子线）决定"""
+    return flag(np.logical_or(doji_flag, hammer_flag))
+
+
+def breakout_signal(above_bb_upper, high_volume):
+    """突破信号：突破布林带上轨或放量"""
+    return flag(np.logical_or(above_bb_upper, high_volume))
+
+
+class IndicatorKernels:
+    """一组指标内核，输入统一转换为连续的float64数组"""
+
+    def __init__(self, name, ema, true_range, atr, rsi, obv):
+        self.name = name
+        self._ema = ema
+        self._true_range = true_range
+        self._atr = atr
+        self._rsi = rsi
+        self._obv = obv
+
+    def ema(self, values, period):
+        """指数移动平均序列（以第一个值为初值）"""
+        return self._ema(_as_float64(values), 2 / (period + 1))
+
+    def true_range(self, highs, lows, closes):
+        """真实波幅序列，长度为 len(closes) - 1"""
+        return self._true_range(_as_float64(highs), _as_float64(lows), _as_float64(closes))
+
+    def atr(self, highs, lows, closes, period):
+        """平均真实波幅（最近 period 个真实波幅的简单均值）"""
+        return float(self._atr(_as_float64(highs), _as_float64(lows), _as_float64(closes), period))
+
+    def rsi(self, closes, period):
+        """RSI（最近 period 个价格变化的平均涨跌幅）"""
+        return float(self._rsi(_as_float64(closes), period))
+
+    def obv(self, closes, volumes, period):
+        """简化OBV（最近 period 根K线的带方向成交量之和）"""
+        return float(self._obv(_as_float64(closes), _as_float64(volumes), period))
+
+
+def _as_float64(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+_backends = {}
+
+
+def get_kernels(backend=None):
+    """返回指定后端的内核（默认安装了numba时用numba，否则用numpy）"""
+    if backend is None:
+        backend = BACKEND_NUMBA if NUMBA_AVAILABLE else BACKEND_NUMPY
+    if backend not in (BACKEND_NUMBA, BACKEND_NUMPY):
+        raise ValueError(f"未知的指标内核后端: {backend}")
+    if backend == BACKEND_NUMBA and not NUMBA_AVAILABLE:
+        raise ImportError("numba未安装，无法使用numba指标内核")
+
+    kernels = _backends.get(backend)
+    if kernels is None:
+        if backend == BACKEND_NUMBA:
+            jit = numba.njit(cache=True)
+            kernels = IndicatorKernels(BACKEND_NUMBA, jit(_ema_loop), jit(_true_range_loop),
+                                       jit(_atr_loop), jit(_rsi_loop), jit(_obv_loop))
+        else:
+            kernels = IndicatorKernels(BACKEND_NUMPY, _ema_numpy, _true_range_numpy,
+                                       _atr_numpy, _rsi_numpy, _obv_numpy)
+        _backends[backend] = kernels
+        logger.debug(f"指标内核后端: {backend}")
+    return kernels
+
+
+def available_backends():
+    """当前环境可用的内核后端"""
+    return [BACKEND_NUMBA, BACKEND_NUMPY] if NUMBA_AVAILABLE else [BACKEND_NUMPY]
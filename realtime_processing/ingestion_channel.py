@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+行情接入通道 - 带背压策略与计数指标的有界队列
+"""
+from collections import deque
+import logging
+import queue
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 队列满时的处理策略
+POLICY_BLOCK = "block"                # 阻塞生产者直到有空位
+POLICY_DROP_OLDEST = "drop_oldest"    # 丢弃队首最旧的tick
+POLICY_DROP_NEWEST = "drop_newest"    # 丢弃新到达的tick
+POLICY_COALESCE = "coalesce"          # 同一交易对只保留最新tick
+
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_COALESCE)
+
+
+def tick_symbol(tick):
+    """提取tick的交易对（tuple按schema顺序第一个字段为symbol，dict按键）"""
+    return tick['symbol'] if isinstance(tick, dict) else tick[0]
+
+
+class IngestionChannel:
+    """有界行情接入通道
+
+    队列满时按策略处理：block 阻塞生产者；drop_oldest 丢弃最旧的tick；
+    drop_newest 丢弃新tick；coalesce 用新tick覆盖同一交易对尚未消费的tick，
+    该交易对没有待消费tick时退化为丢弃最旧的tick。
+    接口与 queue.Queue 的 put/get/empty/full/qsize 保持兼容。
+    """
+
+    def __init__(self, maxsize=10000, policy=POLICY_DROP_NEWEST, key=tick_symbol,
+                 drop_log_interval=10.0):
+        if policy not in POLICIES:
+            raise ValueError(f"不支持的背压策略: {policy}，可选: {POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+        self.drop_log_interval = drop_log_interval
+
+        self._slots = deque()   # 每个槽位为 [symbol, tick]
+        self._pending = {}      # symbol -> 该交易对最新的待消费槽位（coalesce策略使用）
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+
+        # 指标
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water_mark = 0
+        self._dropped_since_log = 0
+        self._last_drop_log = 0.0
+
+    def qsize(self):
+        with self._mutex:
+            return len(self._slots)
+
+    def empty(self):
+        with self._mutex:
+            return not self._slots
+
+    def full(self):
+        with self._mutex:
+            return len(self._slots) >= self.maxsize
+
+    def put(self, tick, block=True, timeout=None):
+        """放入一个tick，返回是否被接收（coalesce覆盖视为接收）"""
+        symbol = self.key(tick)
+        with self._not_full:
+            if len(self._slots) >= self.maxsize:
+                if self.policy == POLICY_BLOCK:
+                    if not block:
+                        raise queue.Full
+                    if not self._not_full.wait_for(
+                            lambda: len(self._slots) < self.maxsize, timeout=timeout):
+                        raise queue.Full
+                elif self.policy == POLICY_DROP_NEWEST:
+                    self._record_drop()
+                    return False
+                elif self.policy == POLICY_COALESCE and symbol in self._pending:
+                    self._pending[symbol][1] = tick
+                    self.coalesced += 1
+                    return True
+                else:
+                    self._pop_slot()
+                    self._record_drop()
+
+            slot = [symbol, tick]
+            self._slots.append(slot)
+            if self.policy == POLICY_COALESCE:
+                self._pending[symbol] = slot
+            self.enqueued += 1
+            if len(self._slots) > self.high_water_mark:
+                self.high_water_mark = len(self._slots)
+            self._not_empty.notify()
+            return True
+
+    def put_nowait(self, tick):
+        return self.put(tick, block=False)
+
+    def get(self, block=True, timeout=None):
+        """取出最旧的tick，超时抛出 queue.Empty"""
+        with self._not_empty:
+            if not self._slots:
+                if not block:
+                    raise queue.Empty
+                if not self._not_empty.wait_for(lambda: bool(self._slots), timeout=timeout):
+                    raise queue.Empty
+            tick = self._pop_slot()
+            self._not_full.notify()
+            return tick
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def _pop_slot(self):
+        symbol, tick = slot = self._slots.popleft()
+        if self._pending.get(symbol) is slot:
+            del self._pending[symbol]
+        return tick
+
+    def _record_drop(self):
+        """记录丢弃并按间隔汇总告警，避免逐条刷日志"""
+        self.dropped += 1
+        self._dropped_since_log += 1
+        now = time.monotonic()
+        if now - self._last_drop_log >= self.drop_log_interval:
+            logger.warning(
+                f"接入队列已满（策略: {self.policy}），最近丢弃 {self._dropped_since_log} 条tick，"
+                f"累计丢弃 {self.dropped} 条"
+            )
+            self._dropped_since_log = 0
+            self._last_drop_log = now
+
+    def stats(self):
+        """返回通道指标"""
+        with self._mutex:
+            return {
+                'policy': self.policy,
+                'maxsize': self.maxsize,
+                'size': len(self._slots),
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'high_water_mark': self.high_water_mark,
+            }
@@ -2,6 +2,7 @@
 """
 实时处理主程序 - 整合所有实时处理组件
 """
+import argparse
 import asyncio
 import logging
 import signal
@@ -12,8 +13,12 @@ from threading import Thread, Event
 
 from miniqmt_connector import MiniQMTConnector
 from arrow_processor import ArrowProcessor
-from feature_calculator import FeatureCalculator
 from feast_pusher import FeastPusher
+from market_feeds import HistoricalReplayFeed
+from compaction import ArrowCompactor
+from duckdb_pool import DuckDBConnectionManager
+from sharded_processor import ShardedArrowProcessor
+from pipeline import ProcessingPipeline
 
 # 设置日志
 logging.basicConfig(
@@ -25,20 +30,68 @@ logger = logging.getLogger(__name__)
 class RealtimeProcessingEngine:
     """实时处理引擎"""
     
-    def __init__(self):
+    def __init__(self, replay_paths=None, replay_speed=1.0):
         self.is_running = False
         self.stop_event = Event()
         
         # 初始化组件
         self.miniqmt_connector = MiniQMTConnector()
-        self.arrow_processor = ArrowProcessor()
-        self.feature_calculator = FeatureCalculator()
+        data_sources = self.miniqmt_connector.config['data_sources']
+        retention_mode = data_sources.get('retention_mode', 'delete')
+        retention_hours = data_sources.get('retention_hours', 1)
+        num_shards = data_sources.get('processing_shards', 0)
+        
+        # 已关闭小时的Arrow段压实为Parquet历史数据
+        self.compactor = ArrowCompactor.from_config(data_sources)
+        self.compaction_interval = data_sources.get('compaction_interval', 600)
+        
+        if num_shards > 1:
+            # 按交易对哈希分片到多个工作进程计算特征
+            self.arrow_processor = ShardedArrowProcessor(
+                self.miniqmt_connector.arrow_cache_path,
+                num_shards=num_shards,
+                arrow_layout=self.miniqmt_connector.arrow_layout,
+                retention_mode=retention_mode,
+                retention_hours=retention_hours,
+                threads_per_shard=data_sources.get('shard_threads', 1)
+            )
+        else:
+            # 按配置的 threads / memory_limit 打开实时库，各工作线程使用独立游标
+            self.duckdb_manager = DuckDBConnectionManager.from_config(self.miniqmt_connector.config)
+            self.arrow_processor = ArrowProcessor(
+                self.miniqmt_connector.arrow_cache_path,
+                arrow_layout=self.miniqmt_connector.arrow_layout,
+                retention_mode=retention_mode,
+                retention_hours=retention_hours,
+                connection_manager=self.duckdb_manager,
+                history_glob=self.compactor.history_glob
+            )
         self.feast_pusher = FeastPusher()
         
         # 配置参数
         self.trading_pairs = ['BTCUSDT', 'ETHUSDT', 'ADAUSDT', 'DOTUSDT']
         self.processing_interval = 10  # 秒
         
+        # 处理触发方式：interval 按固定间隔轮询；event 由写入方的新数据通知触发，只重算有更新的交易对
+        self.processing_trigger = data_sources.get('processing_trigger', 'interval')
+        self.event_debounce = data_sources.get('event_debounce_ms', 200) / 1000
+        
+        # 流水线模式：ingest -> compute -> serialize -> push 各阶段独立线程，经有界队列交换批次
+        self.pipeline = None
+        if data_sources.get('processing_pipeline', False):
+            self.pipeline = ProcessingPipeline([
+                ('ingest', self.ingest),
+                ('compute', self.compute_features),
+                ('serialize', self.feast_pusher.prepare_feature_dataframe),
+                ('push', self.feast_pusher.push_feature_dataframe),
+            ], queue_size=data_sources.get('pipeline_queue_size', 4))
+        
+        # 历史行情回放（用于按生产数据量端到端压测），不设置时使用实时/模拟行情
+        self.replay_feed = None
+        if replay_paths:
+            self.replay_feed = HistoricalReplayFeed(replay_paths, speed=replay_speed)
+            self.trading_pairs = self.replay_feed.symbols()
+        
     def start(self):
         """启动实时处理引擎"""
         logger.info("启动实时处理引擎...")
@@ -46,10 +99,17 @@ class RealtimeProcessingEngine:
         
         try:
             # 启动MiniQMT数据采集
-            self.miniqmt_connector.start_data_collection(self.trading_pairs)
+            self.miniqmt_connector.start_data_collection(self.trading_pairs, feed=self.replay_feed)
             
-            # 启动Feast后台推送服务
-            self.feast_pusher.start_background_pusher(push_interval=15)
+            # 启动处理流水线（由推送阶段直接推送），否则启动Feast后台推送服务
+            if self.pipeline:
+                self.pipeline.start()
+            else:
+                self.feast_pusher.start_background_pusher(push_interval=15)
+            
+            # 启动后台压实服务
+            if self.compaction_interval:
+                self.compactor.start_background_compaction(interval=self.compaction_interval)
             
             # 启动主处理循环
             self.run_processing_loop()
@@ -66,16 +126,27 @@ class RealtimeProcessingEngine:
         
         # 停止各个组件
         if hasattr(self, 'miniqmt_connector'):
+            self.miniqmt_connector.update_notifier.close()
             self.miniqmt_connector.stop_data_collection()
         
+        if getattr(self, 'pipeline', None):
+            self.pipeline.stop()
+        
         if hasattr(self, 'feast_pusher'):
             self.feast_pusher.stop_background_pusher()
         
+        if hasattr(self, 'compactor'):
+            self.compactor.stop_background_compaction()
+        
         if hasattr(self, 'arrow_processor'):
             self.arrow_processor.close()
     
     def run_processing_loop(self):
         """运行主处理循环"""
+        if self.processing_trigger == 'event':
+            self.run_event_loop()
+            return
+        
         logger.info(f"开始处理循环，间隔: {self.processing_interval}秒")
         
         while self.is_running and not self.stop_event.is_set():
@@ -102,11 +173,46 @@ class RealtimeProcessingEngine:
                 logger.error(f"处理循环中出错: {e}")
                 time.sleep(5)  # 出错后等待5秒再继续
     
-    def process_round(self):
-        """执行一轮完整的处理"""
+    def run_event_loop(self):
+        """事件驱动的处理循环：有交易对写入新数据后（防抖合并）只重算这些交易对
+        
+        processing_interval 内没有新数据时只做健康检查，不执行空轮次。
+        """
+        logger.info(f"开始事件驱动处理，防抖: {self.event_debounce * 1000:.0f}ms")
+        notifier = self.miniqmt_connector.update_notifier
+        
+        while self.is_running and not self.stop_event.is_set():
+            try:
+                symbols = notifier.wait_for_updates(timeout=self.processing_interval,
+                                                    debounce=self.event_debounce)
+                if self.stop_event.is_set():
+                    break
+                if not symbols:
+                    self.health_check()
+                    continue
+                
+                start_time = time.time()
+                self.process_round(symbols=symbols)
+                logger.info(f"处理 {len(symbols)} 个有更新的交易对，耗时: {time.time() - start_time:.2f}秒")
+                
+            except KeyboardInterrupt:
+                logger.info("收到中断信号，停止处理...")
+                break
+            except Exception as e:
+                logger.error(f"事件处理循环中出错: {e}")
+                time.sleep(5)  # 出错后等待5秒再继续
+    
+    def process_round(self, symbols=None):
+        """执行一轮完整的处理（symbols 指定时只处理这些交易对）"""
         try:
-            # 1. 处理所有交易对的Arrow数据
-            all_features = self.arrow_processor.process_all_symbols()
+            if self.pipeline:
+                # 流水线模式下只提交本轮，ingest阶段忙时阻塞（背压）
+                self.pipeline.submit(symbols)
+                self.health_check()
+                return
+            
+            # 1. 加载交易对的Arrow数据，在价格面板上一次计算全部特征（分片模式下由各工作进程计算）
+            all_features = self.arrow_processor.process_all_symbols(symbols=symbols)
             
             if not all_features:
                 logger.warning("没有获取到任何特征数据")
@@ -114,50 +220,31 @@ class RealtimeProcessingEngine:
             
             logger.info(f"处理了 {len(all_features)} 个交易对的特征")
             
-            # 2. 为每个特征计算更详细的技术指标
-            enhanced_features = []
-            
-            for basic_features in all_features:
-                try:
-                    symbol = basic_features['symbol']
-                    
-                    # 获取该交易对的最新数据
-                    recent_data = self.miniqmt_connector.get_latest_data(symbol, limit=50)
-                    
-                    if recent_data.empty:
-                        logger.warning(f"没有获取到 {symbol} 的最新数据")
-                        continue
-                    
-                    # 计算全面的技术指标
-                    comprehensive_features = self.feature_calculator.calculate_comprehensive_features(
-                        recent_data, symbol
-                    )
-                    
-                    if comprehensive_features:
-                        # 合并基础特征和全面特征
-                        merged_features = {**basic_features, **comprehensive_features}
-                        enhanced_features.append(merged_features)
-                        
-                        logger.debug(f"增强了 {symbol} 的特征数据")
-                    
-                except Exception as e:
-                    logger.error(f"处理 {symbol} 特征时出错: {e}")
-                    continue
+            # 2. 推送特征到Feast
+            for features in all_features:
+                self.feast_pusher.queue_feature_for_push(features)
             
-            # 3. 推送特征到Feast
-            if enhanced_features:
-                # 批量推送到队列
-                for features in enhanced_features:
-                    self.feast_pusher.queue_feature_for_push(features)
-                
-                logger.info(f"将 {len(enhanced_features)} 个特征加入推送队列")
+            logger.info(f"将 {len(all_features)} 个特征加入推送队列")
             
-            # 4. 健康检查
+            # 3. 健康检查
             self.health_check()
             
         except Exception as e:
             logger.error(f"处理轮次时出错: {e}")
     
+    def ingest(self, symbols):
+        """流水线 ingest 阶段：增量加载本轮交易对（symbols 为None时全部）的Arrow数据"""
+        loaded = self.arrow_processor.load_arrow_to_duckdb(symbols=symbols)
+        return {'symbols': symbols, 'loaded': loaded}
+    
+    def compute_features(self, batch):
+        """流水线 compute 阶段：计算 ingest 阶段已加载的交易对的全部特征，返回特征字典列表
+        
+        所有交易对在价格面板上一次向量化计算，每个特征每轮只计算一次；
+        分片模式下各工作进程计算本分片的特征表并以Arrow IPC返回。
+        """
+        return self.arrow_processor.calculate_all_features(symbols=batch['symbols'])
+    
     def health_check(self):
         """健康检查"""
         try:
@@ -172,6 +259,22 @@ class RealtimeProcessingEngine:
             if queue_size > 500:
                 logger.warning(f"推送队列过大: {queue_size}")
             
+            # 输出流水线各阶段耗时与队列深度
+            if self.pipeline:
+                logger.info("流水线: " + ", ".join(
+                    f"{name} 队列={stats['queue']['size']} p99={stats['latency']['p99_ms']:.1f}ms"
+                    f" 丢弃={stats['queue']['dropped']}"
+                    for name, stats in self.pipeline.stats().items()
+                ))
+            
+            # 输出热路径查询耗时
+            query_stats = self.arrow_processor.get_query_stats()
+            if query_stats:
+                logger.info("查询耗时: " + ", ".join(
+                    f"{name} p50={stats['p50_ms']:.2f}ms p99={stats['p99_ms']:.2f}ms"
+                    for name, stats in query_stats.items()
+                ))
+            
         except Exception as e:
             logger.error(f"健康检查时出错: {e}")
     
@@ -182,6 +285,10 @@ class RealtimeProcessingEngine:
                 'is_running': self.is_running,
                 'trading_pairs': self.trading_pairs,
                 'processing_interval': self.processing_interval,
+                'ingestion': self.miniqmt_connector.get_ingestion_stats(),
+                'updates': self.miniqmt_connector.update_notifier.stats(),
+                'pipeline': self.pipeline.stats() if self.pipeline else None,
+                'queries': self.arrow_processor.get_query_stats(),
                 'feast_health': self.feast_pusher.health_check() if hasattr(self, 'feast_pusher') else {},
                 'timestamp': datetime.now().isoformat()
             }
@@ -206,6 +313,12 @@ def main():
     """主函数"""
     global engine
     
+    parser = argparse.ArgumentParser(description="量化分析实时处理系统")
+    parser.add_argument('--replay', nargs='+', help="回放录制的Arrow/Parquet行情文件")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="回放速度倍数，0表示尽快回放（保留窗口按回放数据的事件时间计算）")
+    args = parser.parse_args()
+    
     logger.info("启动量化分析实时处理系统...")
     
     # 注册信号处理器
@@ -214,7 +327,7 @@ def main():
     
     try:
         # 创建并启动处理引擎
-        engine = RealtimeProcessingEngine()
+        engine = RealtimeProcessingEngine(replay_paths=args.replay, replay_speed=args.speed)
         engine.start()
         
     except KeyboardInterrupt:
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+行情源 - 可插拔行情源（模拟行情、本地回放、历史数据加速回放）
+"""
+import asyncio
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from datetime import datetime
+import logging
+import time
+from pathlib import Path
+
+try:
+    from .arrow_store import read_ipc_table
+except ImportError:
+    from arrow_store import read_ipc_table
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 与 MiniQMTConnector.arrow_schema 一致的tick字段顺序
+TICK_COLUMNS = ['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume', 'amount', 'count']
+
+
+def simulate_tick(symbol, last_price):
+    """按随机游走生成一条模拟tick，返回 (tick元组, 新价格)"""
+    # 模拟价格波动
+    price_change = np.random.normal(0, 0.001) * last_price
+    new_price = max(last_price + price_change, last_price * 0.99)
+
+    # 生成OHLC数据
+    high = new_price * (1 + abs(np.random.normal(0, 0.0005)))
+    low = new_price * (1 - abs(np.random.normal(0, 0.0005)))
+    volume = int(np.random.exponential(1000000))
+    amount = new_price * volume
+    count = int(np.random.poisson(100))
+
+    # 按arrow_schema字段顺序组织的tick元组
+    tick = (symbol, datetime.now(), last_price, high, low, new_price, volume, amount, count)
+    return tick, new_price
+
+
+class SimulatedFeed:
+    """模拟行情源（与线程模式的模拟器使用相同的价格模型）"""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+
+    async def stream(self, symbol):
+        """异步产生某个交易对的tick"""
+        last_price = 45000 if symbol == 'BTCUSDT' else 2500
+        while True:
+            tick, last_price = simulate_tick(symbol, last_price)
+            yield tick
+            await asyncio.sleep(self.interval)
+
+
+class LocalReplayFeed:
+    """本地回放行情源 - 按顺序回放内存中的tick，用于离线测试异步接入
+
+    ticks 为按schema顺序的元组或dict，stream(symbol) 只回放该交易对的tick。
+    """
+
+    def __init__(self, ticks, interval=0.0):
+        self.ticks = list(ticks)
+        self.interval = interval
+
+    async def stream(self, symbol):
+        """异步回放某个交易对的tick，回放完毕后结束"""
+        for tick in self.ticks:
+            tick_symbol = tick['symbol'] if isinstance(tick, dict) else tick[0]
+            if tick_symbol != symbol:
+                continue
+            yield tick
+            # interval为0时也让出事件循环，使多个行情源交替推进
+            await asyncio.sleep(self.interval)
+
+
+class ReplayClock:
+    """回放时钟 - 将事件时间映射到墙上时间
+
+    speed=1 按原始节奏回放，speed=N 加速N倍，speed为None或0时不等待（尽快回放）。
+    第一次调用时以该事件时间为起点，多个交易对的回放共享同一个时钟。
+    """
+
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self._event_start = None
+        self._wall_start = None
+
+    def delay(self, event_ns):
+        """距离该事件应被发出还需等待的秒数"""
+        if not self.speed:
+            return 0.0
+        if self._event_start is None:
+            self._event_start = event_ns
+            self._wall_start = time.monotonic()
+            return 0.0
+        due = self._wall_start + (event_ns - self._event_start) / 1e9 / self.speed
+        return max(0.0, due - time.monotonic())
+
+
+class HistoricalReplayFeed:
+    """历史行情回放源 - 读取录制的Arrow/Parquet文件，按事件时间以1x/Nx/尽快的速度回放
+
+    speed=1 按原始节奏，speed=N 加速N倍，speed为0或None时尽快回放（对应 main.py --speed 0）。
+    tick保留原始的事件时间戳，经与实时行情相同的队列/写入路径落入Arrow缓存
+    （段文件仍按写入时的墙上时间分区）；ArrowProcessor 的保留窗口以已加载数据的
+    事件时间水位为准，回放的历史数据不会被按墙上时间清理。
+    异步模式使用 stream(symbol)，线程模式使用 iter_ticks()。
+    """
+
+    def __init__(self, paths, speed=1.0, symbols=None):
+        if isinstance(paths, (str, Path)):
+            paths = [paths]
+        self.paths = [Path(p) for p in paths]
+        self.speed = speed
+        self.clock = ReplayClock(speed)
+
+        table = self._load(self.paths)
+        if symbols is not None:
+            table = table.filter(pc.is_in(table['symbol'], value_set=pa.array(list(symbols))))
+        self.table = table
+        self._by_symbol = None
+        logger.info(f"加载回放数据 {table.num_rows} 条，速度: {speed or '尽快'}")
+
+    @staticmethod
+    def _load(paths):
+        """读取Arrow IPC或Parquet文件，按事件时间排序并统一为tick字段顺序"""
+        tables = []
+        for path in paths:
+            if path.suffix == '.parquet':
+                import pyarrow.parquet as pq
+                table = pq.read_table(path)
+            else:
+                table = read_ipc_table(path, memory_map=True)
+
+            missing = [name for name in TICK_COLUMNS if name not in table.column_names]
+            if missing:
+                raise ValueError(f"回放文件 {path} 缺少字段: {missing}")
+            tables.append(table.select(TICK_COLUMNS).replace_schema_metadata(None))
+
+        if not tables:
+            raise ValueError("没有指定回放文件")
+
+        table = pa.concat_tables(tables, promote_options='permissive')
+        # 时间戳以纳秒整数回放，写入时不丢精度
+        timestamps = pc.cast(table['timestamp'], pa.timestamp('ns')).cast(pa.int64())
+        table = table.set_column(1, 'timestamp', timestamps)
+        return table.sort_by([('timestamp', 'ascending')])
+
+    def symbols(self):
+        """回放数据中包含的交易对"""
+        return sorted(pc.unique(self.table['symbol']).to_pylist())
+
+    def _symbol_slices(self):
+        """一次性按交易对切分（组内保持时间顺序）"""
+        if self._by_symbol is None:
+            table = self.table.sort_by([('symbol', 'ascending'), ('timestamp', 'ascending')])
+            symbols = table['symbol'].to_numpy()
+            bounds = np.flatnonzero(symbols[1:] != symbols[:-1]) + 1
+            starts = np.concatenate([[0], bounds])
+            ends = np.concatenate([bounds, [len(symbols)]])
+            self._by_symbol = {
+                symbols[start]: table.slice(start, end - start)
+                for start, end in zip(starts, ends)
+            } if len(symbols) else {}
+        return self._by_symbol
+
+    @staticmethod
+    def _rows(table):
+        """按批次将Table转换为tick元组"""
+        for batch in table.to_batches():
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+
+    def iter_ticks(self):
+        """同步回放全部交易对的tick（按事件时间顺序，线程模式使用）"""
+        for tick in self._rows(self.table):
+            wait = self.clock.delay(tick[1])
+            if wait > 0:
+                time.sleep(wait)
+            yield tick
+
+    async def stream(self, symbol):
+        """异步回放某个交易对的tick（异步模式使用）"""
+        table = self._symbol_slices().get(symbol)
+        if table is None:
+            return
+        for tick in self._rows(table):
+            wait = self.clock.delay(tick[1])
+            # 尽快回放时也让出事件循环，使多个交易对交替推进
+            await asyncio.sleep(wait)
+            yield tick
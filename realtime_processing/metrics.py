@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+运行指标 - 延迟直方图与查询耗时注册表
+"""
+import bisect
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 默认的延迟分桶上界（毫秒），按约2倍递增
+DEFAULT_BUCKETS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000
+)
+
+
+class LatencyHistogram:
+    """定长分桶的延迟直方图（毫秒），线程安全
+
+    记录开销为一次二分查找，分位数按桶上界近似返回。
+    """
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._counts = [0] * (len(self.buckets_ms) + 1)   # 最后一个桶为溢出桶
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, value_ms):
+        """记录一次延迟"""
+        idx = bisect.bisect_left(self.buckets_ms, value_ms)
+        with self._lock:
+            self._counts[idx] += 1
+            self._count += 1
+            self._sum += value_ms
+            if value_ms > self._max:
+                self._max = value_ms
+
+    @property
+    def count(self):
+        return self._count
+
+    def percentile(self, q):
+        """近似分位数（q取0-100），返回所在桶的上界，溢出桶返回最大值"""
+        with self._lock:
+            if not self._count:
+                return 0.0
+            rank = q / 100 * self._count
+            seen = 0
+            for idx, bucket_count in enumerate(self._counts):
+                seen += bucket_count
+                if seen >= rank and bucket_count:
+                    if idx < len(self.buckets_ms):
+                        return min(float(self.buckets_ms[idx]), self._max)
+                    return self._max
+            return self._max
+
+    def snapshot(self):
+        """返回统计摘要与各桶计数"""
+        with self._lock:
+            count, total, max_ms = self._count, self._sum, self._max
+            buckets = {
+                (f"le_{bound}" if i < len(self.buckets_ms) else "inf"): n
+                for i, (bound, n) in enumerate(zip(self.buckets_ms + (None,), self._counts))
+            }
+        return {
+            'count': count,
+            'mean_ms': total / count if count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'max_ms': max_ms,
+            'buckets': buckets,
+        }
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._counts = [0] * (len(self.buckets_ms) + 1)
+            self._count = 0
+            self._sum = 0.0
+            self._max = 0.0
+
+
+class QueryTimingRegistry:
+    """按查询名称汇总执行耗时的注册表，每个查询一个延迟直方图"""
+
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        """获取（必要时创建）某个查询的直方图"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram(self.buckets_ms)
+            return histogram
+
+    def record(self, name, value_ms):
+        self.histogram(name).record(value_ms)
+
+    @contextmanager
+    def timer(self, name):
+        """计时上下文，退出时记录耗时（毫秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self):
+        """返回各查询的 count/mean/p50/p99/max（不含分桶明细）"""
+        with self._lock:
+            histograms = dict(self._histograms)
+        summary = {}
+        for name, histogram in sorted(histograms.items()):
+            stats = histogram.snapshot()
+            stats.pop('buckets')
+            summary[name] = stats
+        return summary
+
+    def reset(self):
+        with self._lock:
+            for histogram in self._histograms.values():
+                histogram.reset()
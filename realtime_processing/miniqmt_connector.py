@@ -5,17 +5,33 @@ MiniQMT连接器 - 用于实时数据采集和Arrow IPC存储
 import asyncio
 import pandas as pd
 import pyarrow as pa
-import pyarrow.ipc as ipc
-import numpy as np
+import pyarrow.compute as pc
 from datetime import datetime, timedelta
 import logging
-import json
-import os
 import time
 from pathlib import Path
 import threading
 import queue
 
+try:
+    from .arrow_store import (HourlyArrowWriter, PartitionedArrowWriter, hour_key,
+                              list_segments, read_ipc_table)
+    from .columnar_builder import ColumnarTickBuilder, FlushPolicy
+    from .metrics import LatencyHistogram
+    from .ingestion_channel import IngestionChannel
+    from .market_feeds import SimulatedFeed, simulate_tick
+    from .ring_buffer import RingBufferStore
+    from .update_notifier import SymbolUpdateNotifier
+except ImportError:
+    from arrow_store import (HourlyArrowWriter, PartitionedArrowWriter, hour_key,
+                             list_segments, read_ipc_table)
+    from columnar_builder import ColumnarTickBuilder, FlushPolicy
+    from metrics import LatencyHistogram
+    from ingestion_channel import IngestionChannel
+    from market_feeds import SimulatedFeed, simulate_tick
+    from ring_buffer import RingBufferStore
+    from update_notifier import SymbolUpdateNotifier
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -28,8 +44,11 @@ class MiniQMTConnector:
         self.arrow_cache_path = Path(self.config['data_sources']['arrow_cache_path'])
         self.arrow_cache_path.mkdir(parents=True, exist_ok=True)
         
-        # 数据缓存队列
-        self.data_queue = queue.Queue(maxsize=10000)
+        # 数据接入通道（有界队列 + 背压策略：block/drop_oldest/drop_newest/coalesce）
+        self.data_queue = IngestionChannel(
+            maxsize=self.config['data_sources'].get('ingestion_queue_size', 10000),
+            policy=self.config['data_sources'].get('ingestion_policy', 'drop_newest')
+        )
         self.is_running = False
         
         # Arrow schema定义
@@ -44,6 +63,40 @@ class MiniQMTConnector:
             pa.field("amount", pa.float64()),
             pa.field("count", pa.int64()),
         ])
+        
+        # Arrow缓存布局：hourly（每小时一个文件）或 partitioned（date=/hour=/symbol_bucket=）
+        # 热数据段可选 lz4/zstd 缓冲区压缩
+        self.arrow_layout = self.config['data_sources'].get('arrow_layout', 'hourly')
+        compression = self.config['data_sources'].get('arrow_compression')
+        if self.arrow_layout == 'partitioned':
+            self.arrow_writer = PartitionedArrowWriter(
+                self.arrow_cache_path, self.arrow_schema,
+                num_buckets=self.config['data_sources'].get('arrow_symbol_buckets', 16),
+                compression=compression
+            )
+        else:
+            self.arrow_writer = HourlyArrowWriter(
+                self.arrow_cache_path, self.arrow_schema, compression=compression
+            )
+        self._writer_thread = None
+        
+        # 写入刷新策略（行数/字节数/等待时间）与每次刷新的延迟统计
+        self.flush_policy = FlushPolicy.from_config(self.config['data_sources'])
+        self.flush_latency = LatencyHistogram()   # 生成批次并写入的耗时
+        self.flush_age = LatencyHistogram()       # 刷新时最早一行已等待的时间
+        self.flush_reasons = {}
+        
+        # 接入模式：thread（每个交易对一个线程）或 async（单个事件循环复用所有行情源）
+        self.ingestion_mode = self.config['data_sources'].get('ingestion_mode', 'thread')
+        
+        # 每个交易对最近N根K线的内存环形缓冲区（由写入路径填充）
+        self.ring_buffer = RingBufferStore(
+            self.arrow_schema,
+            capacity=self.config['data_sources'].get('ring_buffer_size', 512)
+        )
+        
+        # 每个批次落盘后按交易对发出新数据通知（事件驱动处理使用）
+        self.update_notifier = SymbolUpdateNotifier()
     
     def _load_config(self, config_path):
         """加载配置文件"""
@@ -51,26 +104,50 @@ class MiniQMTConnector:
         with open(config_path, 'r', encoding='utf-8') as f:
             return yaml.safe_load(f)
     
-    def start_data_collection(self, symbols=['BTCUSDT', 'ETHUSDT']):
-        """启动数据采集"""
-        logger.info(f"开始采集数据，交易对: {symbols}")
+    def start_data_collection(self, symbols=['BTCUSDT', 'ETHUSDT'], mode=None, feed=None):
+        """启动数据采集
+        
+        mode: thread 或 async，默认取配置中的 ingestion_mode
+        feed: 行情源，默认为模拟行情。异步模式使用其 async stream(symbol)；
+              线程模式下若提供（如 HistoricalReplayFeed）则由一个回放线程调用 iter_ticks()
+        """
+        mode = mode or self.ingestion_mode
+        if symbols is None and feed is not None:
+            symbols = feed.symbols()
+        logger.info(f"开始采集数据，交易对: {symbols}，接入模式: {mode}")
         self.is_running = True
         
-        # 启动数据生成线程（模拟实时数据）
-        for symbol in symbols:
-            thread = threading.Thread(
-                target=self._simulate_realtime_data, 
-                args=(symbol,),
+        if mode == 'async':
+            # 所有行情源和写入协程运行在同一个事件循环线程中
+            self._writer_thread = threading.Thread(
+                target=asyncio.run,
+                args=(self.ingest_async(symbols, feed or SimulatedFeed()),),
                 daemon=True
             )
+            self._writer_thread.start()
+            logger.info("数据采集已启动")
+            return
+        
+        if feed is not None:
+            # 回放线程经同一个接入通道送入写入线程
+            thread = threading.Thread(target=self._replay_worker, args=(feed,), daemon=True)
             thread.start()
+        else:
+            # 启动数据生成线程（模拟实时数据）
+            for symbol in symbols:
+                thread = threading.Thread(
+                    target=self._simulate_realtime_data, 
+                    args=(symbol,),
+                    daemon=True
+                )
+                thread.start()
         
         # 启动Arrow写入线程
-        writer_thread = threading.Thread(
+        self._writer_thread = threading.Thread(
             target=self._arrow_writer_worker,
             daemon=True
         )
-        writer_thread.start()
+        self._writer_thread.start()
         
         logger.info("数据采集已启动")
     
@@ -78,6 +155,12 @@ class MiniQMTConnector:
         """停止数据采集"""
         logger.info("停止数据采集...")
         self.is_running = False
+        
+        # 等待写入线程刷完剩余数据并关闭当前段文件
+        if self._writer_thread is not None:
+            self._writer_thread.join(timeout=5)
+            self._writer_thread = None
+        self.arrow_writer.close()
     
     def _simulate_realtime_data(self, symbol):
         """模拟实时数据生成（在实际环境中，这里会连接到真实的数据源）"""
@@ -86,34 +169,10 @@ class MiniQMTConnector:
         
         while self.is_running:
             try:
-                # 模拟价格波动
-                price_change = np.random.normal(0, 0.001) * last_price
-                new_price = max(last_price + price_change, last_price * 0.99)
-                
-                # 生成OHLC数据
-                high = new_price * (1 + abs(np.random.normal(0, 0.0005)))
-                low = new_price * (1 - abs(np.random.normal(0, 0.0005)))
-                volume = int(np.random.exponential(1000000))
-                amount = new_price * volume
-                count = int(np.random.poisson(100))
-                
-                tick_data = {
-                    'symbol': symbol,
-                    'timestamp': datetime.now(),
-                    'open': last_price,
-                    'high': high,
-                    'low': low,
-                    'close': new_price,
-                    'volume': volume,
-                    'amount': amount,
-                    'count': count
-                }
+                tick_data, new_price = simulate_tick(symbol, last_price)
                 
-                # 添加到队列
-                if not self.data_queue.full():
-                    self.data_queue.put(tick_data)
-                else:
-                    logger.warning(f"数据队列已满，丢弃 {symbol} 的数据")
+                # 添加到队列（队列满时由通道按背压策略处理并汇总告警）
+                self.data_queue.put(tick_data)
                 
                 last_price = new_price
                 time.sleep(0.1)  # 100ms间隔
@@ -122,73 +181,139 @@ class MiniQMTConnector:
                 logger.error(f"生成 {symbol} 数据时出错: {e}")
                 time.sleep(1)
     
-    def _arrow_writer_worker(self):
-        """Arrow IPC写入工作线程"""
-        batch_size = 100
-        batch_data = []
+    def _replay_worker(self, feed):
+        """回放线程：按回放时钟把历史tick送入接入通道（无损回放需将 ingestion_policy 设为 block）"""
+        replayed = 0
+        try:
+            for tick_data in feed.iter_ticks():
+                if not self.is_running:
+                    break
+                self.data_queue.put(tick_data)
+                replayed += 1
+        except Exception as e:
+            logger.error(f"回放行情时出错: {e}")
+        logger.info(f"回放完成，共 {replayed} 条tick")
+    
+    def _arrow_writer_worker(self, feeds_done=None):
+        """Arrow IPC写入工作线程
         
-        while self.is_running or not self.data_queue.empty():
+        feeds_done: 异步接入时行情源全部结束的事件，置位后写入线程取完通道中剩余数据即退出
+        """
+        builder = ColumnarTickBuilder(self.arrow_schema, capacity=self.flush_policy.max_rows or 1024)
+        
+        def stopping():
+            return not self.is_running or (feeds_done is not None and feeds_done.is_set())
+        
+        while not stopping() or not self.data_queue.empty():
             try:
-                # 获取数据
+                # 获取数据（缓冲区非空时最多等待到按时间刷新的时刻）
+                idle = False
                 try:
-                    data = self.data_queue.get(timeout=1)
-                    batch_data.append(data)
+                    data = self.data_queue.get(timeout=self.flush_policy.wait_timeout(builder))
+                    builder.append(data)
                 except queue.Empty:
-                    if batch_data:
-                        self._write_arrow_batch(batch_data)
-                        batch_data = []
-                    continue
+                    if stopping():
+                        break
+                    idle = True
                 
-                # 达到批次大小时写入
-                if len(batch_data) >= batch_size:
-                    self._write_arrow_batch(batch_data)
-                    batch_data = []
+                # 按刷新策略写入；未配置按时间刷新时，队列空闲即写入
+                reason = self.flush_policy.should_flush(builder)
+                if reason is None and idle and len(builder) and self.flush_policy.max_age_ms is None:
+                    reason = 'idle'
+                if reason:
+                    self._write_arrow_batch(builder, reason)
                     
             except Exception as e:
                 logger.error(f"Arrow写入工作线程出错: {e}")
         
         # 写入剩余数据
-        if batch_data:
-            self._write_arrow_batch(batch_data)
+        if len(builder):
+            self._write_arrow_batch(builder, 'close')
+        
+        self.arrow_writer.close()
+    
+    async def ingest_async(self, symbols, feed):
+        """异步接入：在一个事件循环中复用所有交易对的行情源，经接入通道交给Arrow写入线程
+        
+        与线程模式共用 data_queue 的背压策略和指标；block 策略下通道已满时在线程池中等待空位，
+        不阻塞事件循环。行情源全部结束（如本地回放完毕）或停止采集后，写入线程刷完剩余数据并关闭段文件。
+        """
+        loop = asyncio.get_running_loop()
+        feeds_done = threading.Event()
+        writer = loop.run_in_executor(None, self._arrow_writer_worker, feeds_done)
+        
+        async def produce(symbol):
+            try:
+                async for tick in feed.stream(symbol):
+                    if not self.is_running:
+                        break
+                    try:
+                        self.data_queue.put_nowait(tick)
+                    except queue.Full:
+                        await loop.run_in_executor(None, self.data_queue.put, tick)
+            except Exception as e:
+                logger.error(f"接入 {symbol} 行情时出错: {e}")
+        
+        try:
+            await asyncio.gather(*(produce(symbol) for symbol in symbols))
+        finally:
+            feeds_done.set()
+            await writer
+    
+    def _write_arrow_batch(self, builder, reason=None):
+        """写入Arrow批次数据，并记录刷新延迟"""
+        if not len(builder):
+            return
+        
+        age_ms = builder.age_ms
+        start = time.perf_counter()
+        
+        # 列式缓冲区直接生成RecordBatch（无pandas转换）
+        self._write_record_batch(builder.flush())
+        
+        self.flush_latency.record((time.perf_counter() - start) * 1000)
+        self.flush_age.record(age_ms)
+        self.flush_reasons[reason] = self.flush_reasons.get(reason, 0) + 1
     
-    def _write_arrow_batch(self, batch_data):
-        """写入Arrow批次数据"""
+    def _write_record_batch(self, batch):
+        """写入一个RecordBatch"""
         try:
-            if not batch_data:
-                return
-            
-            # 转换为DataFrame
-            df = pd.DataFrame(batch_data)
-            
-            # 转换为Arrow Table
-            table = pa.Table.from_pandas(df, schema=self.arrow_schema)
-            
-            # 生成文件名（按小时分区）
-            current_hour = datetime.now().strftime("%Y%m%d_%H")
-            file_path = self.arrow_cache_path / f"ohlc_{current_hour}.arrow"
-            
-            # 写入Arrow IPC文件（追加模式）
-            if file_path.exists():
-                # 读取现有数据
-                with pa.ipc.open_file(file_path) as reader:
-                    existing_table = reader.read_all()
-                
-                # 合并数据
-                combined_table = pa.concat_tables([existing_table, table])
-            else:
-                combined_table = table
+            # 追加到当前小时的段文件（不回读已有数据）
+            file_path = self.arrow_writer.write_batch(batch)
             
-            # 写入文件
-            with pa.ipc.new_file(file_path, combined_table.schema) as writer:
-                writer.write_table(combined_table)
+            # 落盘后更新内存环形缓冲区，并通知有新数据的交易对
+            self.ring_buffer.append_batch(batch)
+            self.update_notifier.notify(pc.unique(batch.column('symbol')).to_pylist())
             
-            logger.info(f"写入 {len(batch_data)} 条数据到 {file_path}")
+            logger.info(f"写入 {batch.num_rows} 条数据到 {file_path}")
             
         except Exception as e:
             logger.error(f"写入Arrow批次数据时出错: {e}")
     
-    def read_arrow_data(self, hours_back=1):
-        """读取Arrow数据"""
+    def get_flush_stats(self):
+        """获取写入刷新指标（刷新耗时、刷新时数据等待时间的直方图及触发原因计数）"""
+        return {
+            'policy': {
+                'max_rows': self.flush_policy.max_rows,
+                'max_bytes': self.flush_policy.max_bytes,
+                'max_age_ms': self.flush_policy.max_age_ms,
+            },
+            'flush_latency': self.flush_latency.snapshot(),
+            'flush_age': self.flush_age.snapshot(),
+            'reasons': dict(self.flush_reasons),
+        }
+    
+    def get_ingestion_stats(self):
+        """获取接入通道指标（入队/丢弃/合并计数及高水位）"""
+        return self.data_queue.stats()
+    
+    def read_arrow_data(self, hours_back=1, symbols=None, memory_map=True, to_pandas=True):
+        """读取Arrow数据
+        
+        symbols: 分区布局下只打开包含这些交易对的段文件
+        memory_map: 通过内存映射零拷贝读取
+        to_pandas: False时直接返回Arrow Table，跳过pandas转换
+        """
         try:
             # 获取最近几小时的文件
             current_time = datetime.now()
@@ -196,47 +321,53 @@ class MiniQMTConnector:
             
             for i in range(hours_back):
                 target_time = current_time - timedelta(hours=i)
-                file_pattern = target_time.strftime("%Y%m%d_%H")
-                file_path = self.arrow_cache_path / f"ohlc_{file_pattern}.arrow"
-                
-                if file_path.exists():
-                    files_to_read.append(file_path)
+                files_to_read.extend(list_segments(
+                    self.arrow_cache_path, hour_key(target_time),
+                    layout=self.arrow_layout, symbols=symbols
+                ))
             
             if not files_to_read:
                 logger.warning("没有找到Arrow数据文件")
-                return pd.DataFrame()
+                return pd.DataFrame() if to_pandas else self.arrow_schema.empty_table()
             
             # 读取并合并数据
             tables = []
             for file_path in files_to_read:
-                with pa.ipc.open_file(file_path) as reader:
-                    table = reader.read_all()
-                    tables.append(table)
+                tables.append(read_ipc_table(file_path, memory_map=memory_map))
             
-            if tables:
-                combined_table = pa.concat_tables(tables)
-                df = combined_table.to_pandas()
-                logger.info(f"读取到 {len(df)} 条Arrow数据")
-                return df
-            else:
-                return pd.DataFrame()
+            combined_table = pa.concat_tables(tables)
+            logger.info(f"读取到 {combined_table.num_rows} 条Arrow数据")
+            
+            if not to_pandas:
+                return combined_table
+            return combined_table.to_pandas()
                 
         except Exception as e:
             logger.error(f"读取Arrow数据时出错: {e}")
-            return pd.DataFrame()
+            return pd.DataFrame() if to_pandas else self.arrow_schema.empty_table()
     
     def get_latest_data(self, symbol, limit=100):
         """获取指定交易对的最新数据"""
         try:
-            df = self.read_arrow_data(hours_back=1)
-            if df.empty:
+            # 内存环形缓冲区中已有足够数据时直接返回
+            if self.ring_buffer.size(symbol) >= limit:
+                return self.ring_buffer.latest_frame(symbol, limit)
+            
+            # 冷启动时回退到磁盘读取
+            table = self.read_arrow_data(hours_back=1, symbols=[symbol], to_pandas=False)
+            if table.num_rows == 0:
                 return pd.DataFrame()
             
-            # 筛选指定交易对
-            symbol_data = df[df['symbol'] == symbol]
+            # 在Arrow上筛选指定交易对并取最新数据，只转换结果行
+            symbol_data = table.filter(pc.equal(table['symbol'], symbol))
+            if symbol_data.num_rows == 0:
+                return pd.DataFrame()
             
-            # 按时间排序并取最新数据
-            latest_data = symbol_data.sort_values('timestamp', ascending=False).head(limit)
+            latest_idx = pc.select_k_unstable(
+                symbol_data, k=min(limit, symbol_data.num_rows),
+                sort_keys=[('timestamp', 'descending')]
+            )
+            latest_data = symbol_data.take(latest_idx).to_pandas()
             
             return latest_data.reset_index(drop=True)
             
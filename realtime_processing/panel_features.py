@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+跨交易对向量化特征计算 - 在 symbols × time 价格面板上一次性计算所有交易对的技术指标
+"""
+import numpy as np
+import pyarrow as pa
+import logging
+
+try:
+    from .feature_registry import MIN_BARS, REGISTRY
+except ImportError:
+    from feature_registry import MIN_BARS, REGISTRY
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PricePanel:
+    """symbols × time 价格面板
+
+    每行是一个交易对最近的 width 根K线，按时间正序右对齐；历史不足 width 的交易对
+    左侧用其第一根K线填充，lengths 记录每个交易对的真实K线数。用第一根K线填充
+    使EMA等递推指标在填充段保持初值，不影响结果。
+    """
+
+    def __init__(self, symbols, timestamps, opens, highs, lows, closes, volumes, lengths):
+        self.symbols = list(symbols)
+        self.timestamps = np.asarray(timestamps)
+        self.opens = np.asarray(opens, dtype=np.float64)
+        self.highs = np.asarray(highs, dtype=np.float64)
+        self.lows = np.asarray(lows, dtype=np.float64)
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.volumes = np.asarray(volumes, dtype=np.float64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+
+    @property
+    def width(self):
+        return self.closes.shape[1]
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @classmethod
+    def from_arrow(cls, table, lookback=50):
+        """由包含 symbol/timestamp/OHLCV 的Arrow表构建面板
+
+        表按 (symbol, timestamp) 排序后按交易对的偏移量直接索引出每个交易对
+        最近 lookback 行，不逐交易对切分。
+        """
+        if table.num_rows == 0:
+            empty = np.empty((0, lookback))
+            return cls([], np.empty(0, dtype='datetime64[ns]'), empty, empty, empty, empty, empty,
+                       np.empty(0, dtype=np.int64))
+
+        table = table.sort_by([('symbol', 'ascending'), ('timestamp', 'ascending')])
+        symbols = table['symbol'].to_numpy(zero_copy_only=False)
+        starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+        ends = np.r_[starts[1:], len(symbols)]
+        lengths = np.minimum(ends - starts, lookback)
+
+        # 右对齐的行索引，不足部分指向该交易对的第一行
+        index = ends[:, None] - lookback + np.arange(lookback)[None, :]
+        index = np.maximum(index, (ends - lengths)[:, None])
+
+        def gather(name):
+            return table[name].to_numpy()[index]
+
+        timestamps = table['timestamp'].to_numpy()[ends - 1]
+        return cls(symbols[starts], timestamps, gather('open'), gather('high'), gather('low'),
+                   gather('close'), gather('volume'), lengths)
+
+
+def calculate_panel_features(panel, names=None):
+    """在价格面板上向量化计算特征（默认注册表中的全部特征）
+
+    与逐交易对计算走同一张特征注册表，返回 {特征名: 长度为交易对数的数组}。
+    """
+    columns = {'open': panel.opens, 'high': panel.highs, 'low': panel.lows,
+               'close': panel.closes, 'volume': panel.volumes}
+    return REGISTRY.compute(columns, names, lengths=panel.lengths)
+
+
+def panel_features_table(panel):
+    """计算面板特征并输出为一张列式Arrow表（每个交易对一行）
+
+    K线数少于 MIN_BARS 的交易对不输出，与逐交易对计算时返回None一致。
+    """
+    keep = panel.lengths >= MIN_BARS
+    timestamps = pa.array(panel.timestamps[keep])
+    columns = {
+        'symbol': pa.array(np.asarray(panel.symbols, dtype=object)[keep], pa.string()),
+        'timestamp': timestamps,
+        'event_timestamp': timestamps,
+    }
+    if len(panel):
+        for name, values in calculate_panel_features(panel).items():
+            columns[name] = pa.array(values[keep])
+    return pa.table(columns)
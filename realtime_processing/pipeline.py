@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+处理流水线 - 由有界队列连接的多级工作线程，每级独立统计耗时与队列深度
+"""
+import logging
+import queue
+import threading
+import time
+
+try:
+    from .ingestion_channel import IngestionChannel, POLICY_BLOCK, POLICY_DROP_OLDEST
+    from .metrics import LatencyHistogram
+except ImportError:
+    from ingestion_channel import IngestionChannel, POLICY_BLOCK, POLICY_DROP_OLDEST
+    from metrics import LatencyHistogram
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _batch_key(item):
+    """流水线中的批次不按交易对合并"""
+    return None
+
+
+def _is_empty(result):
+    """判断阶段输出是否为空（列表/DataFrame等）"""
+    empty = getattr(result, 'empty', None)
+    if isinstance(empty, bool):
+        return empty
+    try:
+        return len(result) == 0
+    except TypeError:
+        return False
+
+
+class PipelineStage:
+    """流水线的一级：从输入队列取批次，处理后放入下一级的输入队列
+
+    func 返回 None 或空结果时不向下游传递。
+    """
+
+    def __init__(self, name, func, inbox, outbox=None):
+        self.name = name
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.latency = LatencyHistogram()
+        self.processed = 0
+        self.errors = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        # 取出批次到处理完成（含放入下游）期间为忙碌，与取批次在同一把锁内切换
+        self._busy = False
+        self._state_lock = threading.Lock()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"pipeline-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._state_lock:
+                try:
+                    item = self.inbox.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                self._busy = True
+
+            try:
+                self._process(item)
+            finally:
+                self._busy = False
+
+    def _process(self, item):
+        start = time.perf_counter()
+        try:
+            result = self.func(item)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"流水线阶段 {self.name} 处理出错: {e}")
+            return
+        finally:
+            self.latency.record((time.perf_counter() - start) * 1000)
+        self.processed += 1
+
+        if self.outbox is not None and result is not None and not _is_empty(result):
+            # 下游为阻塞队列时分段等待，便于及时停止
+            while not self._stop_event.is_set():
+                try:
+                    self.outbox.put(result, timeout=0.2)
+                    break
+                except queue.Full:
+                    continue
+
+    def drained(self):
+        """输入队列为空且没有正在处理的批次"""
+        with self._state_lock:
+            return not self._busy and self.inbox.empty()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def stats(self):
+        latency = self.latency.snapshot()
+        latency.pop('buckets')
+        return {
+            'processed': self.processed,
+            'errors': self.errors,
+            'latency': latency,
+            'queue': self.inbox.stats(),
+        }
+
+
+class ProcessingPipeline:
+    """多级处理流水线
+
+    stages 为 [(名称, 处理函数), ...]，相邻两级之间是容量为 queue_size 的有界队列。
+    默认各级输入队列满时阻塞上游（背压），last_stage_policy 指定最后一级
+    （通常是外部推送）的输入队列策略，默认 drop_oldest：推送变慢时丢弃最旧的
+    待推送批次，而不是阻塞特征计算。
+    """
+
+    def __init__(self, stages, queue_size=4, last_stage_policy=POLICY_DROP_OLDEST):
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.queue_size = queue_size
+        self.stages = []
+
+        inboxes = []
+        for index in range(len(stages)):
+            policy = last_stage_policy if index == len(stages) - 1 and index > 0 else POLICY_BLOCK
+            inboxes.append(IngestionChannel(maxsize=queue_size, policy=policy, key=_batch_key))
+
+        for index, (name, func) in enumerate(stages):
+            outbox = inboxes[index + 1] if index + 1 < len(stages) else None
+            self.stages.append(PipelineStage(name, func, inboxes[index], outbox))
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        logger.info(f"处理流水线已启动: {' -> '.join(stage.name for stage in self.stages)}")
+
+    def submit(self, item, timeout=None):
+        """向第一级提交一个批次，队列满时阻塞（背压），超时返回False"""
+        try:
+            return self.stages[0].inbox.put(item, timeout=timeout)
+        except queue.Full:
+            return False
+
+    def idle(self):
+        """所有队列为空且没有正在处理的批次"""
+        return all(stage.drained() for stage in self.stages)
+
+    def stop(self, drain_timeout=10):
+        """按阶段顺序排空后停止：每一级在上游停止且自身排空后再停止
+
+        超过 drain_timeout 秒仍未排空时直接停止剩余阶段，丢弃未处理的批次。
+        """
+        deadline = time.monotonic() + drain_timeout
+        for stage in self.stages:
+            while not stage.drained() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            if not stage.drained():
+                logger.warning(f"流水线阶段 {stage.name} 未能在 {drain_timeout} 秒内排空，"
+                               f"丢弃 {stage.inbox.qsize()} 个待处理批次")
+            stage.stop()
+        logger.info("处理流水线已停止")
+
+    def stats(self):
+        """各阶段的处理计数、耗时与输入队列深度"""
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+按交易对的内存环形缓冲区 - 保存每个交易对最近N根K线，供最新数据查询
+"""
+import pandas as pd
+import pyarrow as pa
+import numpy as np
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SymbolRingBuffer:
+    """单个交易对的定长环形缓冲区（每个字段一个预分配的NumPy数组）"""
+
+    def __init__(self, capacity, dtypes):
+        self.capacity = capacity
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+        self._head = 0    # 下一次写入的位置
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, columns):
+        """追加一组按时间正序排列的行（各字段等长的数组）"""
+        n = len(next(iter(columns.values())))
+        if n == 0:
+            return
+        if n > self.capacity:
+            columns = {name: values[-self.capacity:] for name, values in columns.items()}
+            n = self.capacity
+
+        with self._lock:
+            start = self._head
+            end = start + n
+            for name, values in columns.items():
+                buf = self._columns[name]
+                if end <= self.capacity:
+                    buf[start:end] = values
+                else:
+                    split = self.capacity - start
+                    buf[start:] = values[:split]
+                    buf[:end - self.capacity] = values[split:]
+            self._head = end % self.capacity
+            self._size = min(self._size + n, self.capacity)
+
+    def latest(self, limit):
+        """返回最近 limit 行的副本（按时间倒序）"""
+        with self._lock:
+            n = min(limit, self._size)
+            idx = (self._head - 1 - np.arange(n)) % self.capacity
+            return {name: buf[idx] for name, buf in self._columns.items()}
+
+
+class RingBufferStore:
+    """所有交易对的环形缓冲区集合，由Arrow写入路径填充"""
+
+    def __init__(self, schema, capacity=512, symbol_field="symbol"):
+        self.schema = schema
+        self.capacity = capacity
+        self.symbol_field = symbol_field
+        self.value_fields = [name for name in schema.names if name != symbol_field]
+        self._dtypes = {
+            field.name: (np.dtype('datetime64[ns]') if pa.types.is_timestamp(field.type)
+                         else np.dtype(field.type.to_pandas_dtype()))
+            for field in schema if field.name != symbol_field
+        }
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, symbol):
+        buffer = self._buffers.get(symbol)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.get(symbol)
+                if buffer is None:
+                    buffer = SymbolRingBuffer(self.capacity, self._dtypes)
+                    self._buffers[symbol] = buffer
+        return buffer
+
+    def append_batch(self, batch):
+        """按交易对拆分RecordBatch并追加到各自的缓冲区"""
+        if batch.num_rows == 0:
+            return
+
+        symbols = batch.column(self.symbol_field).to_numpy(zero_copy_only=False)
+        columns = {
+            name: batch.column(name).to_numpy(zero_copy_only=False) for name in self.value_fields
+        }
+
+        # 稳定排序后按交易对切分，保持各交易对内部的时间顺序
+        unique_symbols, inverse = np.unique(symbols, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_symbols) + 1))
+
+        for i, symbol in enumerate(unique_symbols):
+            rows = order[bounds[i]:bounds[i + 1]]
+            self._get_or_create(symbol).extend(
+                {name: values[rows] for name, values in columns.items()}
+            )
+
+    def size(self, symbol):
+        """缓冲区中某交易对的行数"""
+        buffer = self._buffers.get(symbol)
+        return len(buffer) if buffer is not None else 0
+
+    def symbols(self):
+        """已缓存的交易对"""
+        return list(self._buffers.keys())
+
+    def latest(self, symbol, limit):
+        """返回最近 limit 行（字段名到数组，按时间倒序），没有数据时返回None"""
+        buffer = self._buffers.get(symbol)
+        if buffer is None or len(buffer) == 0:
+            return None
+        return buffer.latest(limit)
+
+    def latest_frame(self, symbol, limit):
+        """以DataFrame形式返回最近 limit 行（列顺序与arrow_schema一致）"""
+        columns = self.latest(symbol, limit)
+        if columns is None:
+            return pd.DataFrame()
+        n = len(columns[self.value_fields[0]])
+        data = {self.symbol_field: np.full(n, symbol, dtype=object)}
+        data.update(columns)
+        return pd.DataFrame(data, columns=self.schema.names)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+分片Arrow处理器 - 按交易对哈希将特征计算分布到多个常驻工作进程
+"""
+import multiprocessing
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import logging
+import threading
+
+try:
+    from .arrow_processor import ArrowProcessor, RETENTION_DELETE
+    from .arrow_store import symbol_bucket
+    from .duckdb_pool import DuckDBConnectionManager
+except ImportError:
+    from arrow_processor import ArrowProcessor, RETENTION_DELETE
+    from arrow_store import symbol_bucket
+    from duckdb_pool import DuckDBConnectionManager
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def table_to_ipc(table):
+    """将Arrow Table序列化为Arrow IPC流缓冲区"""
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def features_from_ipc(buffer):
+    """从Arrow IPC流缓冲区还原Arrow Table"""
+    return ipc.open_stream(buffer).read_all()
+
+
+def _feature_ipc(processor, symbols):
+    """在本分片的价格面板上计算特征表并序列化为IPC字节（没有数据或出错时为None）"""
+    try:
+        table = processor.calculate_feature_table(symbols=symbols)
+    except Exception as e:
+        logger.error(f"分片计算特征时出错: {e}")
+        return None
+    return table_to_ipc(table).to_pybytes() if table is not None and table.num_rows else None
+
+
+def _shard_worker(conn, shard, arrow_cache_path, arrow_layout, retention_mode,
+                  retention_hours, threads):
+    """分片工作进程：持有只加载本分片数据的内存DuckDB，按协调方指令加载数据并计算特征"""
+    processor = ArrowProcessor(
+        arrow_cache_path,
+        arrow_layout=arrow_layout,
+        retention_mode=retention_mode,
+        retention_hours=retention_hours,
+        connection_manager=DuckDBConnectionManager(':memory:', threads=threads),
+        shard=shard,
+    )
+    try:
+        while True:
+            command, args = conn.recv()
+            if command == 'load':
+                conn.send(processor.load_arrow_to_duckdb(symbols=args))
+            elif command == 'features':
+                conn.send(_feature_ipc(processor, args))
+            elif command == 'process':
+                processor.load_arrow_to_duckdb(symbols=args)
+                conn.send(_feature_ipc(processor, args))
+            elif command == 'stats':
+                conn.send(processor.get_query_stats())
+            elif command == 'symbols':
+                conn.send(processor.get_all_symbols())
+            elif command == 'stop':
+                break
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        processor.close()
+        conn.close()
+
+
+class ShardedArrowProcessor:
+    """分片执行的Arrow处理器
+
+    交易对按 symbol_bucket(symbol, num_shards) 划分到 num_shards 个常驻工作进程，
+    每个进程只读取本分片的Arrow段（分区布局按分桶裁剪，按小时布局按行过滤），
+    在各自的内存DuckDB中增量加载，并在本分片的价格面板上计算特征，特征表以Arrow IPC缓冲区
+    返回协调方。对外接口与 ArrowProcessor 的 load_arrow_to_duckdb / calculate_all_features /
+    process_all_symbols / get_all_symbols / get_query_stats / close 保持一致。
+    """
+
+    def __init__(self, arrow_cache_path, num_shards=2, arrow_layout="hourly",
+                 retention_mode=RETENTION_DELETE, retention_hours=1, threads_per_shard=1):
+        self.arrow_cache_path = str(arrow_cache_path)
+        self.num_shards = num_shards
+        self.arrow_layout = arrow_layout
+        self.retention_mode = retention_mode
+        self.retention_hours = retention_hours
+        self.threads_per_shard = threads_per_shard
+
+        self._workers = []
+        self._lock = threading.Lock()
+        self._start_workers()
+
+    def _start_workers(self):
+        """启动工作进程（spawn方式，不继承父进程的DuckDB与线程状态）"""
+        context = multiprocessing.get_context('spawn')
+        for index in range(self.num_shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_shard_worker,
+                args=(child_conn, (index, self.num_shards), self.arrow_cache_path,
+                      self.arrow_layout, self.retention_mode, self.retention_hours,
+                      self.threads_per_shard),
+                name=f"arrow-shard-{index}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append((process, parent_conn))
+        logger.info(f"启动了 {self.num_shards} 个分片工作进程")
+
+    def _broadcast(self, command, shard_args=None):
+        """向分片发送指令并按分片顺序收集结果
+
+        shard_args 为 {分片序号: 参数}，指定时只发送给其中的分片。
+        """
+        with self._lock:
+            targets = [(index, conn) for index, (_, conn) in enumerate(self._workers)
+                       if shard_args is None or index in shard_args]
+            for index, conn in targets:
+                conn.send((command, shard_args[index] if shard_args else None))
+            return [conn.recv() for _, conn in targets]
+
+    def _shard_args(self, symbols):
+        """{分片序号: 交易对列表}，symbols 为None时发送给全部分片"""
+        if symbols is None:
+            return None
+        shard_args = {}
+        for symbol in symbols:
+            shard_args.setdefault(symbol_bucket(symbol, self.num_shards), []).append(symbol)
+        return shard_args
+
+    def load_arrow_to_duckdb(self, symbols=None):
+        """各分片并行增量加载本分片的Arrow数据，返回加载的总行数"""
+        try:
+            return sum(self._broadcast('load', self._shard_args(symbols)))
+
+        except Exception as e:
+            logger.error(f"分片加载Arrow数据时出错: {e}")
+            return 0
+
+    def calculate_all_features(self, symbols=None):
+        """各分片并行计算已加载数据的特征，合并为与 ArrowProcessor 相同的特征字典列表"""
+        return self._collect_features('features', symbols)
+
+    def process_all_symbols(self, symbols=None):
+        """各分片并行加载并计算特征，合并为与 ArrowProcessor 相同的特征字典列表
+
+        symbols 指定时只发送给拥有这些交易对的分片，且只重算这些交易对。
+        """
+        return self._collect_features('process', symbols)
+
+    def _collect_features(self, command, symbols):
+        """发送计算指令并合并各分片返回的特征表"""
+        try:
+            tables = [features_from_ipc(buffer)
+                      for buffer in self._broadcast(command, self._shard_args(symbols))
+                      if buffer is not None]
+            if not tables:
+                logger.warning("没有找到交易对数据")
+                return []
+
+            table = pa.concat_tables(tables, promote_options='permissive')
+            table = table.sort_by([('symbol', 'ascending')])
+            all_features = table.to_pylist()
+            logger.info(f"{self.num_shards} 个分片总共计算了 {len(all_features)} 个交易对的特征")
+            return all_features
+
+        except Exception as e:
+            logger.error(f"分片处理交易对特征时出错: {e}")
+            return []
+
+    def get_all_symbols(self):
+        """所有分片的交易对"""
+        return sorted(symbol for symbols in self._broadcast('symbols') for symbol in symbols)
+
+    def get_query_stats(self):
+        """各分片的查询耗时统计，键为 查询名@shardN"""
+        stats = {}
+        for index, shard_stats in enumerate(self._broadcast('stats')):
+            for name, values in shard_stats.items():
+                stats[f"{name}@shard{index}"] = values
+        return stats
+
+    def close(self):
+        """停止所有工作进程"""
+        with self._lock:
+            for process, conn in self._workers:
+                try:
+                    conn.send(('stop', None))
+                except (BrokenPipeError, OSError):
+                    pass
+            for process, conn in self._workers:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+                conn.close()
+            self._workers = []
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+数据更新通知 - Arrow写入后按交易对发出新数据通知，供处理引擎事件驱动地重算特征
+"""
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SymbolUpdateNotifier:
+    """按交易对汇总的新数据通知
+
+    写入方每落盘一个批次调用 notify(symbols)，处理方调用 wait_for_updates()
+    阻塞直到有交易对更新，再经过 debounce 秒收集同一波写入，返回这段时间内
+    更新过的交易对集合。通知在取走前合并，处理慢时不会积压。
+    """
+
+    def __init__(self):
+        self._dirty = set()
+        self._closed = False
+        self._condition = threading.Condition()
+
+        # 指标
+        self.notifications = 0
+        self.rounds = 0
+
+    def notify(self, symbols):
+        """标记交易对有新数据"""
+        with self._condition:
+            self._dirty.update(symbols)
+            self.notifications += 1
+            self._condition.notify_all()
+
+    def wait_for_updates(self, timeout=None, debounce=0.0):
+        """等待新数据，返回更新过的交易对集合；超时或关闭时返回空集合"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._dirty or self._closed, timeout=timeout):
+                return set()
+            if self._closed:
+                return set()
+
+        # 首个通知到达后再等待 debounce 秒，合并同一波写入
+        if debounce > 0:
+            deadline = time.monotonic() + debounce
+            with self._condition:
+                while not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+        with self._condition:
+            symbols, self._dirty = self._dirty, set()
+            if symbols:
+                self.rounds += 1
+            return symbols
+
+    def pending(self):
+        """尚未取走的更新交易对"""
+        with self._condition:
+            return set(self._dirty)
+
+    def close(self):
+        """唤醒所有等待方并停止通知"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        """返回通知指标"""
+        with self._condition:
+            return {
+                'notifications': self.notifications,
+                'rounds': self.rounds,
+                'pending': len(self._dirty),
+            }
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Arrow数据处理器（Arrow缓存 -> DuckDB）测试
+"""
+import sys
+import os
+import tempfile
+import warnings
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+
+# 添加项目路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+
+from realtime_processing.arrow_processor import ArrowProcessor
+from realtime_processing.arrow_store import HourlyArrowWriter, PartitionedArrowWriter, symbol_bucket
+from realtime_processing.compaction import ArrowCompactor
+from realtime_processing.duckdb_pool import DuckDBConnectionManager
+from realtime_processing.sharded_processor import ShardedArrowProcessor
+
+# 与 MiniQMTConnector.arrow_schema 一致
+OHLC_SCHEMA = pa.schema([
+    pa.field("symbol", pa.string()),
+    pa.field("timestamp", pa.timestamp('ns')),
+    pa.field("open", pa.float64()),
+    pa.field("high", pa.float64()),
+    pa.field("low", pa.float64()),
+    pa.field("close", pa.float64()),
+    pa.field("volume", pa.int64()),
+    pa.field("amount", pa.float64()),
+    pa.field("count", pa.int32()),
+])
+
+
+def make_ohlc_batch(symbol, timestamps, start_price=100.0):
+    """创建测试OHLC批次"""
+    n = len(timestamps)
+    prices = [start_price + i for i in range(n)]
+    return pa.record_batch([
+        pa.array([symbol] * n),
+        pa.array(timestamps, pa.timestamp('ns')),
+        pa.array(prices, pa.float64()),
+        pa.array([p + 1 for p in prices], pa.float64()),
+        pa.array([p - 1 for p in prices], pa.float64()),
+        pa.array(prices, pa.float64()),
+        pa.array([1000] * n, pa.int64()),
+        pa.array([p * 1000 for p in prices], pa.float64()),
+        pa.array([10] * n, pa.int32()),
+    ], schema=OHLC_SCHEMA)
+
+
+def test_incremental_load():
+    """测试增量加载：每轮只加载新追加的批次，重复数据按主键去重"""
+    print("📊 测试Arrow增量加载到DuckDB...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+        processor = ArrowProcessor(cache, db_path=os.path.join(tmp, 'features.duckdb'))
+
+        now = datetime.now()
+        ticks = [now - timedelta(seconds=10 - i) for i in range(5)]
+        writer.write_batch(make_ohlc_batch('BTCUSDT', ticks), now)
+
+        assert processor.load_arrow_to_duckdb() == 5
+        # 没有新数据时不重复加载
+        assert processor.load_arrow_to_duckdb() == 0
+
+        # 追加新批次（其中一条与已加载数据重复）
+        writer.write_batch(make_ohlc_batch('BTCUSDT', [ticks[-1], now]), now)
+        assert processor.load_arrow_to_duckdb() == 2
+
+        count = processor.duckdb_conn.execute("SELECT COUNT(*) FROM realtime_ohlc").fetchone()[0]
+        assert count == 6
+
+        writer.close()
+        processor.close()
+
+    print("   ✅ 增量加载测试通过")
+
+
+def test_realtime_features_from_arrow():
+    """测试基于Arrow结果计算的实时特征与pandas计算一致"""
+    print("📊 测试Arrow结果上的实时特征计算...")
+
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+        processor = ArrowProcessor(cache, db_path=os.path.join(tmp, 'features.duckdb'))
+
+        now = datetime.now()
+        ticks = [now - timedelta(seconds=30 - i) for i in range(30)]
+        batch = make_ohlc_batch('BTCUSDT', ticks)
+        np.random.seed(7)
+        close = 100 + np.cumsum(np.random.normal(0, 1, 30))
+        volume = np.random.randint(100, 1000, 30)
+        batch = batch.set_column(5, 'close', pa.array(close)) \
+            .set_column(6, 'volume', pa.array(volume, pa.int64()))
+        writer.write_batch(batch, now)
+        processor.load_arrow_to_duckdb()
+
+        features = processor.calculate_realtime_features('BTCUSDT')
+        df = batch.to_pandas()
+
+        assert features['price'] == df['close'].iloc[-1]
+        assert features['timestamp'] == ticks[-1]
+        assert np.isclose(features['ma_5'], df['close'].tail(5).mean())
+        assert np.isclose(features['ma_10'], df['close'].tail(10).mean())
+        assert np.isclose(features['ma_20'], df['close'].tail(20).mean())
+        assert np.isclose(features['volatility_20d'], df['close'].pct_change().tail(20).std(ddof=0))
+        assert np.isclose(features['volume_ratio'], df['volume'].iloc[-1] / df['volume'].tail(20).mean())
+        deltas = df['close'].diff().tail(14)
+        assert np.isclose(features['rsi_14'],
+                          100 - 100 / (1 + deltas.clip(lower=0).mean() / -deltas.clip(upper=0).mean()))
+        assert np.isclose(features['momentum_5d'],
+                          df['close'].iloc[-1] / df['close'].iloc[-6] - 1)
+
+        # 旧参数名 lookback_periods 仍可用（取 lookback_periods * 2 根K线），并提示弃用
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            legacy = processor.calculate_realtime_features('BTCUSDT', lookback_periods=5)
+        assert any(issubclass(w.category, DeprecationWarning) for w in caught)
+        expected = processor.calculate_realtime_features('BTCUSDT', lookback=10)
+        assert legacy['ma_10'] == expected['ma_10'] == features['ma_10']
+        assert legacy['ma_20'] == expected['ma_20'] != features['ma_20']
+
+        writer.close()
+        processor.close()
+
+    print("   ✅ Arrow实时特征测试通过")
+
+
+def test_set_based_features_match_per_symbol():
+    """测试一次窗口查询计算的多交易对特征与逐交易对计算一致"""
+    print("📊 测试多交易对批量特征计算...")
+
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+        processor = ArrowProcessor(cache, db_path=os.path.join(tmp, 'features.duckdb'))
+
+        now = datetime.now()
+        np.random.seed(11)
+        # 不同数据量覆盖各指标的最小窗口分支，3条的交易对数据不足被跳过
+        for symbol, n in [('ADAUSDT', 3), ('BTCUSDT', 50), ('DOTUSDT', 7), ('ETHUSDT', 12)]:
+            ticks = [now - timedelta(seconds=n - i) for i in range(n)]
+            batch = make_ohlc_batch(symbol, ticks)
+            close = 100 + np.cumsum(np.random.normal(0, 1, n))
+            volume = np.random.randint(100, 1000, n)
+            batch = batch.set_column(5, 'close', pa.array(close)) \
+                .set_column(6, 'volume', pa.array(volume, pa.int64()))
+            writer.write_batch(batch, now)
+        processor.load_arrow_to_duckdb()
+
+        batch_features = processor.calculate_all_features()
+        assert [f['symbol'] for f in batch_features] == ['BTCUSDT', 'DOTUSDT', 'ETHUSDT']
+
+        for features in batch_features:
+            expected = processor.calculate_realtime_features(features['symbol'])
+            assert features['timestamp'] == expected['timestamp']
+            for name in ['price', 'volume', 'daily_return', 'ma_5', 'ma_10', 'rsi_14',
+                         'volatility_20d', 'volume_ratio', 'momentum_5d']:
+                assert np.isclose(features[name], expected[name]), name
+
+        assert len(processor.process_all_symbols()) == 3
+        # 只重算指定的交易对
+        changed = processor.process_all_symbols(symbols={'ETHUSDT', 'ADAUSDT'})
+        assert [f['symbol'] for f in changed] == ['ETHUSDT']
+        assert changed[0]['ma_10'] == batch_features[2]['ma_10']
+
+        writer.close()
+        processor.close()
+
+    print("   ✅ 多交易对批量特征测试通过")
+
+
+def test_query_timings():
+    """测试热路径查询参数化执行并记录耗时"""
+    print("📊 测试查询耗时统计...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+        processor = ArrowProcessor(cache, db_path=os.path.join(tmp, 'features.duckdb'))
+
+        now = datetime.now()
+        writer.write_batch(make_ohlc_batch('BTCUSDT', [now - timedelta(seconds=i) for i in range(6)]), now)
+        processor.process_all_symbols()
+
+        # 交易对按参数绑定，不会被拼接进SQL
+        assert processor.calculate_realtime_features("BTCUSDT' OR '1'='1") is None
+        assert processor.get_all_symbols() == ['BTCUSDT']
+
+        stats = processor.get_query_stats()
+        assert stats['symbol_latest_rows']['count'] == 1
+        assert stats['upsert_symbols']['count'] == 1
+        assert stats['latest_rows']['count'] == 1
+        assert stats['insert_batch']['count'] == 1
+        assert stats['retention_delete']['count'] == 1
+        assert stats['latest_rows']['p99_ms'] >= stats['latest_rows']['p50_ms'] > 0
+
+        writer.close()
+        processor.close()
+
+    print("   ✅ 查询耗时统计测试通过")
+
+
+def test_hour_bucket_retention():
+    """测试小时分桶保留策略：按小时分表写入，过期分桶整表删除，视图合并存活分桶"""
+    print("📊 测试小时分桶保留策略...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        db_path = os.path.join(tmp, 'features.duckdb')
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+
+        # 先以 delete 策略写入数据，再切换为分桶策略迁移
+        processor = ArrowProcessor(cache, db_path=db_path)
+        now = datetime.now()
+        last_hour = now - timedelta(minutes=50)
+        writer.write_batch(make_ohlc_batch('BTCUSDT', [last_hour, now - timedelta(seconds=1)]), now)
+        assert processor.load_arrow_to_duckdb() == 2
+        processor.close()
+
+        processor = ArrowProcessor(cache, db_path=db_path, retention_mode='buckets')
+        buckets = {'realtime_ohlc_' + last_hour.strftime('%Y%m%d_%H'),
+                   'realtime_ohlc_' + now.strftime('%Y%m%d_%H')}
+        assert set(processor._buckets) == buckets
+        count = processor.duckdb_conn.execute("SELECT COUNT(*) FROM realtime_ohlc").fetchone()[0]
+        assert count == 2
+
+        # 新数据按事件时间写入对应分桶，重复数据去重（新处理器从头读取段文件）
+        writer.write_batch(make_ohlc_batch('BTCUSDT', [now - timedelta(seconds=1), now]), now)
+        processor.load_arrow_to_duckdb()
+        count = processor.duckdb_conn.execute("SELECT COUNT(*) FROM realtime_ohlc").fetchone()[0]
+        assert count == 3
+        assert processor.get_all_symbols() == ['BTCUSDT']
+
+        # 两小时后所有已有分桶过期，整表删除
+        later = now + timedelta(hours=2)
+        assert processor._drop_expired_buckets(later - timedelta(hours=1)) == len(buckets)
+        assert not buckets & set(processor._existing_buckets())
+        count = processor.duckdb_conn.execute("SELECT COUNT(*) FROM realtime_ohlc").fetchone()[0]
+        assert count == 0
+        assert processor.get_query_stats()['drop_bucket']['count'] == len(buckets)
+        processor.close()
+
+        # 切换回 delete 策略时分桶合并回数据表
+        processor = ArrowProcessor(cache, db_path=db_path)
+        assert processor._object_type('realtime_ohlc') == 'table'
+        assert processor._existing_buckets() == {}
+        processor.close()
+        writer.close()
+
+    print("   ✅ 小时分桶保留策略测试通过")
+
+
+def test_symbol_universe_changes():
+    """测试交易对全集随加载增量维护，并可获取新增/移除变更"""
+    print("📊 测试交易对全集缓存...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        db_path = os.path.join(tmp, 'features.duckdb')
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+        processor = ArrowProcessor(cache, db_path=db_path)
+        notifications = []
+        processor.add_symbol_listener(lambda added, removed: notifications.append((added, removed)))
+
+        now = datetime.now()
+        writer.write_batch(make_ohlc_batch('BTCUSDT', [now - timedelta(seconds=2)]), now)
+        writer.write_batch(make_ohlc_batch('ETHUSDT', [now - timedelta(seconds=1)]), now)
+        processor.load_arrow_to_duckdb()
+
+        assert processor.get_all_symbols() == ['BTCUSDT', 'ETHUSDT']
+        assert processor.pop_symbol_changes() == {'added': ['BTCUSDT', 'ETHUSDT'], 'removed': []}
+        assert processor.pop_symbol_changes() == {'added': [], 'removed': []}
+
+        # 已有交易对的新数据不产生变更
+        writer.write_batch(make_ohlc_batch('BTCUSDT', [now]), now)
+        processor.load_arrow_to_duckdb()
+        assert processor.pop_symbol_changes() == {'added': [], 'removed': []}
+        assert len(notifications) == 1
+
+        # 数据过期的交易对被移除
+        processor._expire_symbols(now - timedelta(milliseconds=500))
+        assert processor.get_all_symbols() == ['BTCUSDT']
+        assert processor.pop_symbol_changes() == {'added': [], 'removed': ['ETHUSDT']}
+        assert notifications[-1] == (set(), {'ETHUSDT'})
+        processor.close()
+
+        # 重启后从维度表恢复
+        processor = ArrowProcessor(cache, db_path=db_path)
+        assert processor.get_all_symbols() == ['BTCUSDT']
+        processor.close()
+        writer.close()
+
+    print("   ✅ 交易对全集缓存测试通过")
+
+
+def test_connection_manager_threads():
+    """测试托管连接应用配置，并为并行的加载与查询线程分配独立游标"""
+    print("📊 测试DuckDB托管连接...")
+
+    import threading
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {'duckdb': {'realtime_db_path': os.path.join(tmp, 'db', 'features.duckdb'),
+                             'config': {'threads': 2, 'memory_limit': '1GB'}}}
+        manager = DuckDBConnectionManager.from_config(config)
+        settings = manager.settings()
+        assert settings['threads'] == 2
+        assert 'MiB' in settings['memory_limit'] or 'GiB' in settings['memory_limit']
+
+        cache = os.path.join(tmp, 'arrow_cache')
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+        processor = ArrowProcessor(cache, connection_manager=manager)
+        now = datetime.now()
+
+        cursors = {}
+        errors = []
+
+        def loader():
+            try:
+                cursors['loader'] = processor.duckdb_conn
+                for i in range(20):
+                    ts = now - timedelta(seconds=100 - i)
+                    writer.write_batch(make_ohlc_batch('BTCUSDT', [ts]), now)
+                    processor.load_arrow_to_duckdb()
+            except Exception as e:
+                errors.append(e)
+
+        def reader():
+            try:
+                cursors['reader'] = processor.duckdb_conn
+                for _ in range(20):
+                    processor.calculate_all_features()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=loader), threading.Thread(target=reader)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        assert cursors['loader'] is not cursors['reader']
+        assert processor.duckdb_conn is processor.duckdb_conn
+        count = processor.duckdb_conn.execute("SELECT COUNT(*) FROM realtime_ohlc").fetchone()[0]
+        assert count == 20
+
+        writer.close()
+        processor.close()
+
+    print("   ✅ DuckDB托管连接测试通过")
+
+
+def test_sharded_processing_matches_single_process():
+    """测试分片工作进程计算的特征与单进程结果一致，且各分片只加载自己的交易对"""
+    print("📊 测试分片特征计算...")
+
+    import numpy as np
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        writer = PartitionedArrowWriter(cache, OHLC_SCHEMA, num_buckets=4)
+        now = datetime.now()
+        symbols = ['ADAUSDT', 'BTCUSDT', 'DOTUSDT', 'ETHUSDT', 'SOLUSDT', 'XRPUSDT']
+        for offset, symbol in enumerate(symbols):
+            ticks = [now - timedelta(seconds=30 - i) for i in range(20)]
+            writer.write_batch(make_ohlc_batch(symbol, ticks, start_price=100.0 + offset * 10))
+        writer.close()
+
+        single = ArrowProcessor(cache, arrow_layout='partitioned',
+                                db_path=os.path.join(tmp, 'features.duckdb'))
+        expected = {f['symbol']: f for f in single.process_all_symbols()}
+        single.close()
+
+        sharded = ShardedArrowProcessor(cache, num_shards=2, arrow_layout='partitioned')
+        try:
+            features = sharded.process_all_symbols()
+            assert [f['symbol'] for f in features] == symbols
+            for f in features:
+                for name in ['price', 'ma_5', 'ma_10', 'rsi_14', 'volatility_20d', 'momentum_5d']:
+                    assert np.isclose(f[name], expected[f['symbol']][name]), name
+                assert f['timestamp'] == expected[f['symbol']]['timestamp']
+
+            # 流水线的 ingest/compute 阶段：各分片增量加载后在工作进程内计算特征
+            assert sharded.load_arrow_to_duckdb() == 0
+            computed = sharded.calculate_all_features(symbols=['SOLUSDT', 'BTCUSDT'])
+            assert [f['symbol'] for f in computed] == ['BTCUSDT', 'SOLUSDT']
+            for f in computed:
+                assert np.isclose(f['atr_14'], expected[f['symbol']]['atr_14'])
+                assert f['entity_id'].startswith(f"{f['symbol']}_")
+
+            assert sharded.get_all_symbols() == symbols
+            stats = sharded.get_query_stats()
+            assert 'latest_rows@shard0' in stats and 'latest_rows@shard1' in stats
+        finally:
+            sharded.close()
+
+        # 分片只加载属于自己的交易对
+        shard0 = ArrowProcessor(cache, arrow_layout='partitioned', shard=(0, 2),
+                                db_path=os.path.join(tmp, 'shard0.duckdb'))
+        shard0.load_arrow_to_duckdb()
+        assert shard0.get_all_symbols() == [s for s in symbols if symbol_bucket(s, 2) == 0]
+        shard0.close()
+
+    print("   ✅ 分片特征计算测试通过")
+
+
+def test_primary_key_migration():
+    """测试旧版本无主键的表在初始化时去重并补充主键"""
+    print("📊 测试realtime_ohlc主键迁移...")
+
+    import duckdb
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'features.duckdb')
+        conn = duckdb.connect(db_path)
+        conn.execute("""
+            CREATE TABLE realtime_ohlc (
+                symbol VARCHAR, timestamp TIMESTAMP, open DOUBLE, high DOUBLE, low DOUBLE,
+                close DOUBLE, volume BIGINT, amount DOUBLE, count INTEGER,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        ts = datetime(2024, 1, 1, 9, 30)
+        for _ in range(2):
+            conn.execute("""
+                INSERT INTO realtime_ohlc (symbol, timestamp, open, high, low, close, volume, amount, count)
+                VALUES ('BTCUSDT', ?, 1, 1, 1, 1, 1, 1, 1)
+            """, [ts])
+        conn.close()
+
+        processor = ArrowProcessor(os.path.join(tmp, 'arrow_cache'), db_path=db_path)
+        count = processor.duckdb_conn.execute("SELECT COUNT(*) FROM realtime_ohlc").fetchone()[0]
+        assert count == 1
+        primary_keys = processor.duckdb_conn.execute("""
+            SELECT COUNT(*) FROM duckdb_constraints()
+            WHERE table_name = 'realtime_ohlc' AND constraint_type = 'PRIMARY KEY'
+        """).fetchone()[0]
+        assert primary_keys == 1
+        processor.close()
+
+    print("   ✅ 主键迁移测试通过")
+
+
+def test_compacted_history_view():
+    """测试压实后的Parquet历史数据可通过 ohlc_history 视图读取"""
+    print("📊 测试压实历史数据视图...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        compactor = ArrowCompactor(cache, os.path.join(tmp, "it's history"))
+        processor = ArrowProcessor(cache, db_path=os.path.join(tmp, 'features.duckdb'),
+                                   history_glob=compactor.history_glob)
+        # 还没有压实文件时不建立视图
+        assert processor._object_type('ohlc_history') is None
+
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+        for hour in [9, 10]:
+            ts = datetime(2024, 1, 2, hour, 30)
+            writer.write_batch(make_ohlc_batch('BTCUSDT', [ts, ts + timedelta(minutes=1)]), ts)
+            writer.write_batch(make_ohlc_batch('ETHUSDT', [ts]), ts)
+        writer.close()
+
+        assert compactor.run_once(datetime(2024, 1, 2, 12, 5)) == 6
+        assert os.listdir(cache) == []
+
+        # 下一次加载时建立视图，之后压实的小时无需重建视图即可读到
+        processor.load_arrow_to_duckdb()
+        assert processor._object_type('ohlc_history') == 'view'
+        rows = processor.duckdb_conn.execute("""
+            SELECT symbol, COUNT(*) FROM ohlc_history
+            WHERE timestamp >= '2024-01-02 10:00:00' GROUP BY symbol ORDER BY symbol
+        """).fetchall()
+        assert rows == [('BTCUSDT', 2), ('ETHUSDT', 1)]
+
+        writer = HourlyArrowWriter(cache, OHLC_SCHEMA)
+        ts = datetime(2024, 1, 2, 11, 30)
+        writer.write_batch(make_ohlc_batch('ADAUSDT', [ts]), ts)
+        writer.close()
+        assert compactor.run_once(datetime(2024, 1, 2, 13, 5)) == 1
+        count = processor.duckdb_conn.execute("SELECT COUNT(*) FROM ohlc_history").fetchone()[0]
+        assert count == 7
+        processor.close()
+
+    print("   ✅ 压实历史数据视图测试通过")
+
+
+if __name__ == "__main__":
+    for test_func in [test_incremental_load, test_realtime_features_from_arrow,
+                      test_set_based_features_match_per_symbol,
+                      test_query_timings, test_hour_bucket_retention, test_symbol_universe_changes,
+                      test_connection_manager_threads, test_sharded_processing_matches_single_process,
+                      test_primary_key_migration, test_compacted_history_view]:
+        test_func()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Arrow IPC缓存写入/读取路径测试
+"""
+import sys
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+
+# 添加项目路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+
+from realtime_processing.arrow_store import (
+    HourlyArrowWriter, IpcTailReader, PartitionedArrowWriter, column_views, hourly_files, load_manifest,
+    partitioned_files, read_ipc_table, symbol_bucket
+)
+from realtime_processing.compaction import ArrowCompactor
+from realtime_processing.columnar_builder import ColumnarTickBuilder, FlushPolicy
+from realtime_processing.metrics import LatencyHistogram
+from realtime_processing.ring_buffer import RingBufferStore
+
+SCHEMA = pa.schema([
+    pa.field("symbol", pa.string()),
+    pa.field("close", pa.float64()),
+])
+
+
+def make_batch(symbol, prices):
+    """创建测试批次"""
+    return pa.record_batch(
+        [pa.array([symbol] * len(prices)), pa.array(prices, pa.float64())],
+        schema=SCHEMA
+    )
+
+
+def test_append_without_rewrite():
+    """测试追加写入：多个批次写入同一小时文件，读取方可在写入过程中读取"""
+    print("📊 测试Arrow追加写入...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = HourlyArrowWriter(tmp, SCHEMA)
+        ts = datetime(2024, 1, 1, 9, 30)
+
+        path = writer.write_batch(make_batch('BTCUSDT', [1.0, 2.0]), ts)
+        writer.write_batch(make_batch('ETHUSDT', [3.0]), ts)
+
+        # 写入器未关闭时也能读到已写入的批次
+        assert read_ipc_table(path).num_rows == 3
+
+        writer.close()
+        table = read_ipc_table(path)
+        assert table.num_rows == 3
+        assert table.column('close').to_pylist() == [1.0, 2.0, 3.0]
+
+    print("   ✅ 追加写入测试通过")
+
+
+def test_hour_rotation_and_restart_segments():
+    """测试跨小时滚动以及重启后不覆盖已有段文件"""
+    print("📊 测试小时滚动...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ts = datetime(2024, 1, 1, 9, 59)
+        writer = HourlyArrowWriter(tmp, SCHEMA)
+        first = writer.write_batch(make_batch('BTCUSDT', [1.0]), ts)
+        second = writer.write_batch(make_batch('BTCUSDT', [2.0]), ts + timedelta(minutes=1))
+        writer.close()
+
+        assert first != second
+        assert read_ipc_table(first).num_rows == 1
+
+        # 模拟进程重启后在同一小时继续写入
+        writer = HourlyArrowWriter(tmp, SCHEMA)
+        third = writer.write_batch(make_batch('BTCUSDT', [3.0]), ts)
+        writer.close()
+
+        assert third != first
+        files = hourly_files(tmp, '20240101_09')
+        assert files == [first, third]
+        assert sum(read_ipc_table(f).num_rows for f in files) == 2
+
+    print("   ✅ 小时滚动测试通过")
+
+
+def test_memory_mapped_read():
+    """测试内存映射读取与NumPy零拷贝视图"""
+    print("📊 测试内存映射读取...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = HourlyArrowWriter(tmp, SCHEMA)
+        ts = datetime(2024, 1, 1, 9, 30)
+        path = writer.write_batch(make_batch('BTCUSDT', [1.0, 2.0, 3.0]), ts)
+
+        # 写入器打开期间也能映射读取
+        assert read_ipc_table(path, memory_map=True).num_rows == 3
+        writer.close()
+
+        table = read_ipc_table(path, memory_map=True)
+        views = column_views(table, ['close'])
+        assert views['close'].tolist() == [1.0, 2.0, 3.0]
+        # 数值列直接引用Arrow缓冲区，不发生复制
+        assert not views['close'].flags.owndata
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ohlc_20240101_09.arrow')
+        with pa.ipc.new_file(path, SCHEMA) as file_writer:
+            file_writer.write_batch(make_batch('BTCUSDT', [1.0, 2.0]))
+        assert read_ipc_table(path, memory_map=True).num_rows == 2
+
+    print("   ✅ 内存映射读取测试通过")
+
+
+def test_legacy_file_format():
+    """测试兼容旧的IPC File格式"""
+    print("📊 测试旧格式兼容...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ohlc_20240101_09.arrow')
+        with pa.ipc.new_file(path, SCHEMA) as writer:
+            writer.write_batch(make_batch('BTCUSDT', [1.0, 2.0]))
+
+        assert read_ipc_table(path).num_rows == 2
+
+    print("   ✅ 旧格式兼容测试通过")
+
+
+def test_tail_reader_watermarks():
+    """测试增量读取：每次只返回水位之后追加的批次，未写完的尾部下次重读"""
+    print("📊 测试Arrow增量读取水位...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = HourlyArrowWriter(tmp, SCHEMA, compression='zstd')
+        ts = datetime(2024, 1, 1, 9, 30)
+        path = writer.write_batch(make_batch('BTCUSDT', [1.0, 2.0]), ts)
+
+        tail = IpcTailReader()
+        schema, batches = tail.read_new_batches(path)
+        assert schema == SCHEMA
+        assert sum(b.num_rows for b in batches) == 2
+        watermark = tail.watermark(path)
+
+        # 没有新数据时不返回批次，水位不变
+        assert tail.read_new_batches(path)[1] == []
+        assert tail.watermark(path) == watermark
+
+        writer.write_batch(make_batch('ETHUSDT', [3.0]), ts)
+        batches = tail.read_new_batches(path)[1]
+        assert [b.column(1).to_pylist() for b in batches] == [[3.0]]
+
+        # 模拟写入方只写了一半的消息
+        with open(path, 'ab') as f:
+            f.write(b'\xff\xff\xff\xff\x10\x00')
+        assert tail.read_new_batches(path)[1] == []
+        assert tail.watermark(path) > watermark
+        writer.close()
+
+        # 旧的File格式按批次数计水位
+        legacy = os.path.join(tmp, 'ohlc_20240101_10.arrow')
+        with pa.ipc.new_file(legacy, SCHEMA) as legacy_writer:
+            legacy_writer.write_batch(make_batch('BTCUSDT', [1.0]))
+            legacy_writer.write_batch(make_batch('BTCUSDT', [2.0]))
+        assert len(tail.read_new_batches(legacy)[1]) == 2
+        assert tail.read_new_batches(legacy)[1] == []
+
+        # 文件被删除后丢弃水位
+        os.remove(legacy)
+        tail.forget_missing()
+        assert tail.watermark(legacy) is None
+        assert tail.watermark(path) is not None
+
+    print("   ✅ 增量读取水位测试通过")
+
+
+def test_partitioned_layout_manifest():
+    """测试按交易对分桶的分区布局与manifest裁剪"""
+    print("📊 测试分区布局...")
+
+    schema = pa.schema([
+        pa.field("symbol", pa.string()),
+        pa.field("timestamp", pa.timestamp('ns')),
+        pa.field("close", pa.float64()),
+    ])
+    ts = datetime(2024, 1, 1, 9, 30)
+    symbols = [f"SYM{i:03d}" for i in range(40)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = PartitionedArrowWriter(tmp, schema, num_buckets=8)
+        batch = pa.record_batch([
+            pa.array(symbols),
+            pa.array([ts + timedelta(seconds=i) for i in range(len(symbols))], pa.timestamp('ns')),
+            pa.array([float(i) for i in range(len(symbols))]),
+        ], schema=schema)
+        hour_dir = writer.write_batch(batch, ts)
+        assert str(hour_dir).endswith(os.path.join('date=20240101', 'hour=09'))
+
+        # 只打开目标交易对所在分桶的段
+        files = partitioned_files(tmp, '20240101_09', symbols=['SYM007'])
+        assert len(files) == 1
+        assert files[0].parent.name == f"symbol_bucket={symbol_bucket('SYM007', 8):02d}"
+        assert 'SYM007' in read_ipc_table(files[0]).column('symbol').to_pylist()
+
+        writer.close()
+        manifest = load_manifest(tmp, '20240101_09')
+        assert sum(info['rows'] for info in manifest['segments'].values()) == len(symbols)
+        assert all(info['closed'] for info in manifest['segments'].values())
+        assert sorted(s for info in manifest['segments'].values() for s in info['symbols']) == symbols
+
+        # 已关闭段按时间裁剪
+        assert partitioned_files(tmp, '20240101_09', since=ts + timedelta(hours=1)) == []
+        assert len(partitioned_files(tmp, '20240101_09')) == len(manifest['segments'])
+
+    print("   ✅ 分区布局测试通过")
+
+
+def test_compressed_segments_and_compaction():
+    """测试压缩段写入与已关闭小时压实为排序的Parquet"""
+    print("📊 测试压缩与压实...")
+
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        pa.field("symbol", pa.string()),
+        pa.field("timestamp", pa.timestamp('ns')),
+        pa.field("close", pa.float64()),
+    ])
+
+    def batch(symbols, ts):
+        return pa.record_batch([
+            pa.array(symbols),
+            pa.array([ts + timedelta(seconds=i) for i in range(len(symbols))], pa.timestamp('ns')),
+            pa.array([float(i) for i in range(len(symbols))]),
+        ], schema=schema)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'arrow_cache')
+        old_hour = datetime(2024, 1, 1, 9, 30)
+        now = datetime(2024, 1, 1, 12, 5)
+
+        hourly = HourlyArrowWriter(cache, schema, compression='zstd')
+        hourly.write_batch(batch(['ETHUSDT', 'BTCUSDT', 'ETHUSDT'], old_hour), old_hour)
+        current = hourly.write_batch(batch(['BTCUSDT'], now), now)
+        hourly.close()
+        partitioned = PartitionedArrowWriter(cache, schema, num_buckets=4, compression='lz4')
+        partitioned.write_batch(batch(['ADAUSDT', 'BTCUSDT'], old_hour), old_hour)
+        partitioned.close()
+
+        compactor = ArrowCompactor(cache, os.path.join(tmp, 'history'), row_group_size=2)
+        assert compactor.closed_hours(now) == ['20240101_09']
+        assert compactor.run_once(now) == 5
+
+        output = compactor.output_file('20240101_09')
+        table = pq.read_table(output)
+        assert table.column('symbol').to_pylist() == ['ADAUSDT', 'BTCUSDT', 'BTCUSDT', 'ETHUSDT', 'ETHUSDT']
+        # 按交易对聚簇后row group的统计范围可用于谓词下推
+        stats = pq.ParquetFile(output).metadata.row_group(0).column(0).statistics
+        assert stats.has_min_max and stats.min == 'ADAUSDT' and stats.max == 'BTCUSDT'
+
+        # 源段文件被删除，当前小时保留
+        assert hourly_files(cache, '20240101_09') == []
+        assert not os.path.exists(os.path.join(cache, 'date=20240101'))
+        assert read_ipc_table(current).num_rows == 1
+        assert compactor.run_once(now) == 0
+
+        # 分区目录中不属于压实范围的文件保留，目录不被整体删除
+        next_hour = datetime(2024, 1, 1, 10, 30)
+        partitioned = PartitionedArrowWriter(cache, schema, num_buckets=4)
+        partitioned.write_batch(batch(['ADAUSDT'], next_hour), next_hour)
+        partitioned.close()
+        stray = os.path.join(cache, 'date=20240101', 'hour=10', 'keep.txt')
+        with open(stray, 'w') as f:
+            f.write('not a segment')
+        assert compactor.run_once(now) == 1
+        assert os.path.exists(stray)
+        assert os.listdir(os.path.dirname(stray)) == ['keep.txt']
+
+        # 当前小时仍在写入，至少保留最近一个小时
+        try:
+            ArrowCompactor(cache, os.path.join(tmp, 'history'), keep_recent_hours=0)
+            assert False, "keep_recent_hours=0 应当被拒绝"
+        except ValueError:
+            pass
+
+    print("   ✅ 压缩与压实测试通过")
+
+
+def test_columnar_tick_builder():
+    """测试列式Tick构建器：tuple/dict行、扩容与缓冲区复用"""
+    print("📊 测试列式Tick构建器...")
+
+    schema = pa.schema([
+        pa.field("symbol", pa.string()),
+        pa.field("timestamp", pa.timestamp('ns')),
+        pa.field("close", pa.float64()),
+        pa.field("volume", pa.int64()),
+    ])
+    builder = ColumnarTickBuilder(schema, capacity=2)
+    ts = datetime(2024, 1, 1, 9, 30, 0, 123456)
+
+    builder.append(('BTCUSDT', ts, 45000.5, 10))
+    builder.append({'symbol': 'ETHUSDT', 'timestamp': ts, 'close': 2500.0, 'volume': 20})
+    builder.append(('BTCUSDT', ts + timedelta(seconds=1), 45001.0, 30))
+    assert builder.capacity == 4
+
+    batch = builder.flush()
+    assert len(builder) == 0
+    assert batch.schema == schema
+    assert batch.column(0).to_pylist() == ['BTCUSDT', 'ETHUSDT', 'BTCUSDT']
+    assert batch.column(1).to_pylist()[0] == ts
+    assert batch.column(3).to_pylist() == [10, 20, 30]
+
+    # 复用缓冲区不影响已生成的批次
+    builder.append(('DOTUSDT', ts, 1.0, 1))
+    assert batch.column(2).to_pylist() == [45000.5, 2500.0, 45001.0]
+    assert builder.flush().num_rows == 1
+
+    print("   ✅ 列式Tick构建器测试通过")
+
+
+def test_flush_policy_triggers():
+    """测试刷新策略：行数、字节数、等待时间触发"""
+    print("📊 测试刷新策略...")
+
+    builder = ColumnarTickBuilder(SCHEMA, capacity=8)
+    assert FlushPolicy(max_rows=2).should_flush(builder) is None
+
+    builder.append(('BTCUSDT', 1.0))
+    # 每行: 4字节字符串偏移 + 8字节float64 + 7字节字符内容
+    assert builder.nbytes == 19
+    assert FlushPolicy(max_rows=2, max_bytes=None, max_age_ms=None).should_flush(builder) is None
+    assert FlushPolicy(max_rows=None, max_bytes=10, max_age_ms=None).should_flush(builder) == 'bytes'
+
+    age_policy = FlushPolicy(max_rows=None, max_bytes=None, max_age_ms=20)
+    assert age_policy.should_flush(builder) is None
+    assert 0 < age_policy.wait_timeout(builder) <= 0.02
+    time.sleep(0.03)
+    assert age_policy.should_flush(builder) == 'age'
+    assert age_policy.wait_timeout(builder) == 0.0
+
+    builder.append(('BTCUSDT', 2.0))
+    assert FlushPolicy(max_rows=2).should_flush(builder) == 'rows'
+
+    builder.flush()
+    assert builder.nbytes == 0 and builder.age_ms == 0.0
+
+    # 非ASCII交易对按UTF-8编码字节数计（3个汉字为9字节），不按字符数
+    builder.append(('比特币', 1.0))
+    assert builder.nbytes == 21
+    builder.flush()
+    assert age_policy.wait_timeout(builder) == 1.0
+
+    print("   ✅ 刷新策略测试通过")
+
+
+def test_latency_histogram():
+    """测试延迟直方图的分位数近似"""
+    print("📊 测试延迟直方图...")
+
+    histogram = LatencyHistogram(buckets_ms=(1, 10, 100))
+    for value in [0.5] * 98 + [50, 500]:
+        histogram.record(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100
+    assert snapshot['p50_ms'] == 1
+    assert snapshot['p99_ms'] == 100
+    assert snapshot['max_ms'] == 500
+    assert snapshot['buckets'] == {'le_1': 98, 'le_10': 0, 'le_100': 1, 'inf': 1}
+    assert histogram.percentile(100) == 500
+
+    print("   ✅ 延迟直方图测试通过")
+
+
+def test_ring_buffer_latest():
+    """测试环形缓冲区：按交易对拆分、回绕与最新N条查询"""
+    print("📊 测试环形缓冲区...")
+
+    schema = pa.schema([
+        pa.field("symbol", pa.string()),
+        pa.field("timestamp", pa.timestamp('ns')),
+        pa.field("close", pa.float64()),
+    ])
+    store = RingBufferStore(schema, capacity=4)
+    ts = datetime(2024, 1, 1, 9, 30)
+
+    for start in range(0, 10, 2):
+        store.append_batch(pa.record_batch([
+            pa.array(['BTCUSDT', 'ETHUSDT', 'BTCUSDT']),
+            pa.array([ts + timedelta(seconds=start), ts, ts + timedelta(seconds=start + 1)],
+                     pa.timestamp('ns')),
+            pa.array([float(start), -1.0, float(start + 1)]),
+        ], schema=schema))
+
+    assert store.size('BTCUSDT') == 4
+    assert store.size('ETHUSDT') == 4
+    assert store.latest('DOTUSDT', 3) is None
+
+    # 最新数据按时间倒序返回，且只保留最近capacity条
+    latest = store.latest_frame('BTCUSDT', 3)
+    assert latest['close'].tolist() == [9.0, 8.0, 7.0]
+    assert latest['timestamp'].iloc[0] == ts + timedelta(seconds=9)
+    assert list(latest.columns) == schema.names
+    assert store.latest_frame('BTCUSDT', 10)['close'].tolist() == [9.0, 8.0, 7.0, 6.0]
+
+    print("   ✅ 环形缓冲区测试通过")
+
+
+if __name__ == "__main__":
+    for test_func in [test_append_without_rewrite, test_hour_rotation_and_restart_segments,
+                      test_memory_mapped_read, test_legacy_file_format, test_tail_reader_watermarks,
+                      test_partitioned_layout_manifest, test_compressed_segments_and_compaction,
+                      test_columnar_tick_builder, test_flush_policy_triggers,
+                      test_latency_histogram, test_ring_buffer_latest]:
+        test_func()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+特征计算器（逐交易对/面板）测试
+"""
+import sys
+import os
+import re
+from datetime import datetime, timedelta
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# 添加项目路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+
+from realtime_processing.feature_calculator import FeatureCalculator
+from realtime_processing.feature_registry import (REALTIME_PUSH_FEATURES, REGISTRY, FeatureRegistry,
+                                                  FeatureSpec)
+from realtime_processing.indicator_kernels import (_atr_loop, _ema_loop, _obv_loop, _rsi_loop,
+                                                   _true_range_loop, available_backends, bollinger_bands,
+                                                   get_kernels, rsi_from_changes, stochastic_k, tail_std)
+from realtime_processing.panel_features import PricePanel, panel_features_table
+
+DBT_MODELS = os.path.join(os.path.dirname(__file__), '../../dbt_project/models')
+
+# 实时特征与 dbt mart_technical_indicators 同名列中口径不同的列（README「特征说明」中有同样的说明）
+DBT_KNOWN_DIFFERENCES = {
+    'daily_return': "实时为相邻收盘价收益率，mart为日内收益率 (close-open)/open（对应 open_close_ratio）",
+    'rsi_14': "实时用相邻收盘价的变化，mart用日内收益率",
+    'volatility_20d': "实时为相邻收盘价收益率的总体标准差，mart为日内收益率的样本标准差",
+    'bollinger_upper': "实时用收盘价的总体标准差，mart用样本标准差",
+    'bollinger_lower': "实时用收盘价的总体标准差，mart用样本标准差",
+    'stoch_k_14': "实时取0~100，mart取0~1",
+}
+
+
+def make_ohlcv(n, start_price=45000.0, seed=7):
+    """随机游走的OHLCV数据"""
+    rng = np.random.default_rng(seed)
+    closes = start_price * np.cumprod(1 + rng.normal(0, 0.002, n))
+    opens = np.concatenate([[start_price], closes[:-1]])
+    highs = np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, 0.001, n)))
+    lows = np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, 0.001, n)))
+    volumes = rng.integers(1000, 100000, n)
+    # 偶尔出现收盘价不变的K线
+    closes[10::17] = closes[9::17][:len(closes[10::17])]
+    return pd.DataFrame({
+        'timestamp': [datetime(2024, 1, 1) + timedelta(minutes=i) for i in range(n)],
+        'open': opens,
+        'high': highs,
+        'low': lows,
+        'close': closes,
+        'volume': volumes,
+    })
+
+
+def render_dbt_model(path, relations):
+    """将dbt模型中的Jinja替换为DuckDB可直接执行的SQL（去掉config，ref/source/var按 relations 替换）"""
+    with open(os.path.join(DBT_MODELS, path), encoding='utf-8') as f:
+        sql = f.read()
+    sql = re.sub(r"\{\{\s*config\(.*?\)\s*\}\}", "", sql)
+    sql = re.sub(r"\{\{\s*ref\('(\w+)'\)\s*\}\}", lambda m: relations[m.group(1)], sql)
+    sql = re.sub(r"\{\{\s*source\('(\w+)',\s*'(\w+)'\)\s*\}\}",
+                 lambda m: relations[f"{m.group(1)}.{m.group(2)}"], sql)
+    sql = re.sub(r"\{\{\s*var\(\"(\w+)\"\)\s*\}\}", lambda m: relations[m.group(1)], sql)
+    return sql
+
+
+def assert_features_match(expected_features, actual_features):
+    assert set(expected_features) == set(actual_features), set(expected_features) ^ set(actual_features)
+    for key, expected in expected_features.items():
+        actual = actual_features[key]
+        if isinstance(expected, (float, np.floating)):
+            assert np.isclose(actual, expected, rtol=1e-8, atol=1e-9), (key, actual, expected)
+        else:
+            assert actual == expected, (key, actual, expected)
+
+
+def test_panel_matches_per_symbol():
+    """面板向量化计算与逐交易对计算一致（含历史长度不同的交易对）"""
+    print("📊 测试跨交易对面板计算...")
+
+    # 覆盖：不足5根、各窗口回退、刚满窗口、超过lookback
+    lengths = {'SYM00': 3, 'SYM01': 5, 'SYM02': 13, 'SYM03': 14, 'SYM04': 15, 'SYM05': 20,
+               'SYM06': 25, 'SYM07': 26, 'SYM08': 50, 'SYM09': 120}
+    frames = {symbol: make_ohlcv(n, 100.0 + i * 50, seed=i) for i, (symbol, n) in enumerate(lengths.items())}
+    frames = {symbol: df.assign(symbol=symbol) for symbol, df in frames.items()}
+    table = pa.Table.from_pandas(pd.concat(frames.values()).sample(frac=1, random_state=3),
+                                 preserve_index=False)
+
+    calculator = FeatureCalculator()
+    panel = PricePanel.from_arrow(table, lookback=50)
+    assert panel.closes.shape == (len(lengths), 50)
+    result = panel_features_table(panel)
+    rows = {row['symbol']: row for row in result.to_pylist()}
+    assert 'SYM00' not in rows
+    assert len(rows) == len(lengths) - 1
+
+    for symbol, df in frames.items():
+        batch = calculator.calculate_comprehensive_features(df.tail(50).drop(columns='symbol'), symbol)
+        if batch is None:
+            continue
+        assert_features_match(batch, rows[symbol])
+
+    print(f"   📊 计算了 {result.num_rows} 个交易对、{result.num_columns} 列特征")
+    print("   ✅ 面板计算测试通过")
+
+
+def test_indicator_kernel_backends():
+    """各指标内核后端与循环参考实现一致"""
+    print("📊 测试指标内核后端...")
+
+    df = make_ohlcv(120)
+    closes, highs, lows = df['close'].values, df['high'].values, df['low'].values
+    volumes = df['volume'].values.astype(float)
+    closes_with_gap = closes.copy()
+    closes_with_gap[100] = np.nan
+
+    # 原 ArrowProcessor._calculate_rsi 的pandas实现
+    deltas = pd.Series(closes_with_gap[-14:]).diff().dropna()
+    gains, losses = deltas.where(deltas > 0, 0), -deltas.where(deltas < 0, 0)
+    pandas_rsi = 100 - 100 / (1 + gains.rolling(14, min_periods=1).mean().iloc[-1]
+                              / losses.rolling(14, min_periods=1).mean().iloc[-1])
+
+    for backend in available_backends():
+        kernels = get_kernels(backend)
+        assert np.allclose(kernels.ema(closes, 12), _ema_loop(closes, 2 / 13))
+        assert np.allclose(kernels.true_range(highs, lows, closes), _true_range_loop(highs, lows, closes))
+        for period in (1, 14, 200):
+            assert np.isclose(kernels.atr(highs, lows, closes, period), _atr_loop(highs, lows, closes, period))
+            assert np.isclose(kernels.rsi(closes, period), _rsi_loop(closes, period))
+            assert np.isclose(kernels.obv(closes, volumes, period), _obv_loop(closes, volumes, period))
+        assert np.isclose(kernels.rsi(closes_with_gap[-14:], 14), pandas_rsi)
+        assert kernels.rsi(closes[:1], 14) == 50.0
+        assert kernels.atr(highs[:1], lows[:1], closes[:1], 14) == highs[0] - lows[0]
+        print(f"   📊 {backend} 后端一致")
+
+    print("   ✅ 指标内核测试通过")
+
+
+def test_feature_registry_selective():
+    """特征注册表：全量计算与批量一致，按需计算只执行所需子图"""
+    print("📊 测试特征注册表...")
+
+    # 单个序列上用内核后端计算与通用（面板同款）实现一致
+    for n in (5, 13, 14, 20, 26, 80):
+        df = make_ohlcv(n, seed=n)
+        columns = {name: df[name].values for name in ('open', 'high', 'low', 'close', 'volume')}
+        generic = REGISTRY.compute(columns)
+        for backend in available_backends():
+            assert_features_match(generic, REGISTRY.compute(columns, kernels=get_kernels(backend)))
+
+    # 推送源字段只需要其依赖的子图（不计算EMA/MACD/形态等）
+    calculator = FeatureCalculator()
+    plan = [spec.name for spec in REGISTRY.resolve(REALTIME_PUSH_FEATURES)]
+    assert plan.index('avg_volume_20d') < plan.index('volume_ratio')
+    assert plan.count('avg_volume_20d') == 1
+    assert not {'ema_26', 'macd_12_26_9', 'bollinger_20', 'atr_14', 'doji'} & set(plan)
+    assert calculator.feature_lookback(REALTIME_PUSH_FEATURES) == 20
+    assert calculator.feature_lookback(['trend_strength']) == 20
+    assert calculator.feature_lookback() == 26
+
+    df = make_ohlcv(30)
+    pushed = calculator.calculate_features(df, 'BTCUSDT', REALTIME_PUSH_FEATURES)
+    full = calculator.calculate_comprehensive_features(df, 'BTCUSDT')
+    assert set(pushed) == {'symbol', 'timestamp', 'event_timestamp', *REALTIME_PUSH_FEATURES}
+    assert_features_match({key: full[key] for key in pushed}, pushed)
+
+    # 环与未知特征
+    registry = FeatureRegistry()
+    registry.register(FeatureSpec('a', lambda ctx: 1, deps=['b']))
+    registry.register(FeatureSpec('b', lambda ctx: 1, deps=['a']))
+    for names in (['a'], ['missing']):
+        try:
+            registry.resolve(names)
+            assert False, "应当抛出ValueError"
+        except ValueError:
+            pass
+
+    print(f"   📊 推送源特征子图: {len(plan)} 个节点（全部: {len(REGISTRY.resolve())}）")
+    print("   ✅ 特征注册表测试通过")
+
+
+def test_indicator_definitions_match_dbt_mart():
+    """实时特征与dbt mart_technical_indicators 的同名列对照
+
+    同名列除 DBT_KNOWN_DIFFERENCES 列出的已知口径差异外必须一致；已知差异的列必须确实不同
+    （口径统一后应从列表中移除），并用同一指标库按mart的输入与参数复现mart的值。
+    """
+    print("📊 测试指标定义与dbt mart对照...")
+
+    raw = pd.concat([make_ohlcv(60, 100.0 + i * 50, seed=20 + i).assign(symbol=symbol)
+                     for i, symbol in enumerate(['AAA', 'BBB', 'CCC'])])
+    # 加入跳空，使日内收益率与相邻收盘价收益率不同
+    raw['open'] *= 1 + np.random.default_rng(3).normal(0, 0.001, len(raw))
+    raw['high'] = raw[['open', 'high']].max(axis=1)
+    raw['low'] = raw[['open', 'low']].min(axis=1)
+    relations = {'raw.ohlc_data': 'raw_ohlc_data', 'stg_ohlc_data': 'stg_ohlc_data',
+                 'start_date': '2000-01-01', 'end_date': '2100-01-01'}
+    con = duckdb.connect()
+    con.register('raw_ohlc_data', raw)
+    con.execute("CREATE VIEW stg_ohlc_data AS " + render_dbt_model('staging/stg_ohlc_data.sql', relations))
+    mart = con.execute(render_dbt_model('marts/mart_technical_indicators.sql', relations)).df()
+    staged = con.execute("SELECT * FROM stg_ohlc_data ORDER BY symbol, timestamp").df()
+    con.close()
+
+    calculator = FeatureCalculator()
+    panel = {row['symbol']: row for row in panel_features_table(PricePanel.from_arrow(
+        pa.Table.from_pandas(staged, preserve_index=False), lookback=60)).to_pylist()}
+    latest = mart.sort_values('timestamp').groupby('symbol').tail(1).set_index('symbol')
+
+    shared = sorted(set(latest.columns) & set(REGISTRY.names()))
+    assert set(DBT_KNOWN_DIFFERENCES) <= set(shared)
+    for symbol, df in staged.groupby('symbol'):
+        expected = latest.loc[symbol]
+        df = df.drop(columns='symbol').reset_index(drop=True)
+        features = calculator.calculate_comprehensive_features(df, symbol)
+        assert_features_match(features, panel[symbol])
+        assert features['timestamp'] == expected['timestamp']
+
+        # 同名列：口径一致的必须相等，已知差异的必须不同
+        for name in shared:
+            same = np.isclose(features[name], expected[name])
+            assert same != (name in DBT_KNOWN_DIFFERENCES), (name, features[name], expected[name])
+        assert np.isclose(features['volume_ratio'], expected['volume'] / expected['avg_volume_20d'])
+        assert np.isclose(features['open_close_ratio'], expected['daily_return'])
+
+        # 已知差异：同一指标库按mart的输入与参数计算即得到mart的值
+        closes, highs, lows = df['close'].values, df['high'].values, df['low'].values
+        intraday = df['daily_return'].values
+        _, upper, lower = bollinger_bands(closes, 20, ddof=1)
+        assert np.isclose(tail_std(intraday, 20, ddof=1), expected['volatility_20d'])
+        assert np.isclose(rsi_from_changes(intraday, 14), expected['rsi_14'])
+        assert np.isclose(stochastic_k(highs, lows, closes, 14, scale=1.0), expected['stoch_k_14'])
+        assert np.isclose(upper, expected['bollinger_upper'])
+        assert np.isclose(lower, expected['bollinger_lower'])
+        assert np.isclose(features['stoch_k_14'], 100 * expected['stoch_k_14'])
+
+    print(f"   📊 对照了 {len(latest)} 个交易对的 {len(shared)} 个同名列"
+          f"（已知口径差异 {len(DBT_KNOWN_DIFFERENCES)} 列）")
+    print("   ✅ dbt指标口径对照测试通过")
+
+
+if __name__ == "__main__":
+    for test_func in [test_panel_matches_per_symbol, test_indicator_kernel_backends,
+                      test_feature_registry_selective, test_indicator_definitions_match_dbt_mart]:
+        test_func()
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+行情接入测试
+"""
+import sys
+import os
+import asyncio
+import queue
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yaml
+
+# 添加项目路径
+sys.path.append(os.path.join(os.path.dirname(__file__), '../..'))
+
+from realtime_processing.arrow_processor import ArrowProcessor
+from realtime_processing.ingestion_channel import IngestionChannel
+from realtime_processing.market_feeds import HistoricalReplayFeed, LocalReplayFeed
+from realtime_processing.miniqmt_connector import MiniQMTConnector
+from realtime_processing.pipeline import ProcessingPipeline
+from realtime_processing.update_notifier import SymbolUpdateNotifier
+
+
+def create_connector(tmp, **data_sources):
+    """在临时目录中创建连接器"""
+    os.makedirs(tmp, exist_ok=True)
+    config_path = os.path.join(tmp, 'database.yml')
+    data_sources.setdefault('arrow_cache_path', os.path.join(tmp, 'arrow_cache'))
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump({'data_sources': data_sources}, f)
+    return MiniQMTConnector(config_path)
+
+
+def make_tick(symbol, price):
+    """创建测试tick（按arrow_schema顺序的元组）"""
+    return (symbol, None, price, price, price, price, 1, price, 1)
+
+
+def drain(channel):
+    """取出通道中的全部tick"""
+    ticks = []
+    while not channel.empty():
+        ticks.append(channel.get_nowait())
+    return ticks
+
+
+def test_drop_policies():
+    """测试drop_newest/drop_oldest策略与计数"""
+    print("📊 测试丢弃策略...")
+
+    newest = IngestionChannel(maxsize=2, policy='drop_newest')
+    oldest = IngestionChannel(maxsize=2, policy='drop_oldest')
+    for price in [1.0, 2.0, 3.0]:
+        newest.put(make_tick('BTCUSDT', price))
+        oldest.put(make_tick('BTCUSDT', price))
+
+    assert [t[5] for t in drain(newest)] == [1.0, 2.0]
+    assert [t[5] for t in drain(oldest)] == [2.0, 3.0]
+
+    stats = oldest.stats()
+    assert stats['enqueued'] == 3
+    assert stats['dropped'] == 1
+    assert stats['high_water_mark'] == 2
+    assert newest.stats()['enqueued'] == 2
+
+    print("   ✅ 丢弃策略测试通过")
+
+
+def test_coalesce_policy():
+    """测试coalesce策略：队列满时同一交易对只保留最新tick"""
+    print("📊 测试合并策略...")
+
+    channel = IngestionChannel(maxsize=2, policy='coalesce')
+    channel.put(make_tick('BTCUSDT', 1.0))
+    channel.put(make_tick('ETHUSDT', 10.0))
+    channel.put(make_tick('BTCUSDT', 2.0))
+    channel.put(make_tick('BTCUSDT', 3.0))
+
+    ticks = drain(channel)
+    assert [(t[0], t[5]) for t in ticks] == [('BTCUSDT', 3.0), ('ETHUSDT', 10.0)]
+    assert channel.stats()['coalesced'] == 2
+    assert channel.stats()['dropped'] == 0
+
+    # 被消费后的交易对不再合并，退化为丢弃最旧的tick
+    channel.put(make_tick('BTCUSDT', 4.0))
+    channel.put(make_tick('ETHUSDT', 11.0))
+    channel.put(make_tick('ADAUSDT', 0.5))
+    assert [t[0] for t in drain(channel)] == ['ETHUSDT', 'ADAUSDT']
+    assert channel.stats()['dropped'] == 1
+
+    print("   ✅ 合并策略测试通过")
+
+
+def test_block_policy():
+    """测试block策略：队列满时阻塞直到消费者取走数据"""
+    print("📊 测试阻塞策略...")
+
+    channel = IngestionChannel(maxsize=1, policy='block')
+    channel.put(make_tick('BTCUSDT', 1.0))
+
+    try:
+        channel.put(make_tick('BTCUSDT', 2.0), timeout=0.05)
+        assert False, "队列满时应超时"
+    except queue.Full:
+        pass
+
+    consumer = threading.Timer(0.05, channel.get)
+    consumer.start()
+    start = time.monotonic()
+    assert channel.put(make_tick('BTCUSDT', 3.0), timeout=2)
+    assert time.monotonic() - start >= 0.04
+    consumer.join()
+    assert channel.get(timeout=1)[5] == 3.0
+
+    try:
+        channel.get(timeout=0.01)
+        assert False, "空队列应超时"
+    except queue.Empty:
+        pass
+
+    print("   ✅ 阻塞策略测试通过")
+
+
+def test_async_ingestion_with_local_replay():
+    """测试异步接入模式：多个交易对行情源复用一个事件循环写入Arrow缓存"""
+    print("📊 测试异步接入...")
+
+    symbols = [f"SYM{i:03d}" for i in range(50)]
+    base = datetime.now().replace(microsecond=0)
+    ticks = [
+        (symbol, base + timedelta(milliseconds=i), 1.0 + i, 1.0 + i, 1.0 + i, 1.0 + i, i, 1.0, 1)
+        for i in range(5) for symbol in symbols
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connector = create_connector(tmp)
+        connector.is_running = True
+        asyncio.run(connector.ingest_async(symbols, LocalReplayFeed(ticks)))
+        connector.is_running = False
+
+        df = connector.read_arrow_data()
+        assert len(df) == len(ticks)
+        assert set(df['symbol']) == set(symbols)
+
+        # 事件时间原样保留，环形缓冲区同步更新
+        latest = connector.get_latest_data('SYM007', limit=5)
+        assert latest['close'].tolist() == [5.0, 4.0, 3.0, 2.0, 1.0]
+        assert latest['timestamp'].iloc[0] == base + timedelta(milliseconds=4)
+
+        # 默认按100行刷新，剩余数据在结束时写入
+        flush_stats = connector.get_flush_stats()
+        assert flush_stats['reasons'] == {'rows': 2, 'close': 1}
+        assert flush_stats['flush_latency']['count'] == 3
+
+        # 每次落盘都发出交易对更新通知
+        assert connector.update_notifier.pending() == set(symbols)
+        assert connector.update_notifier.stats()['notifications'] == 3
+
+        # 异步接入与线程模式共用同一个接入通道的指标
+        ingestion_stats = connector.get_ingestion_stats()
+        assert ingestion_stats['enqueued'] == len(ticks)
+        assert ingestion_stats['dropped'] == 0
+
+    print("   ✅ 异步接入测试通过")
+
+
+def test_async_ingestion_backpressure():
+    """测试异步接入遵循接入通道的背压策略：block 策略下通道满时等待而不丢数据"""
+    print("📊 测试异步接入背压...")
+
+    symbols = [f"SYM{i:03d}" for i in range(20)]
+    base = datetime.now().replace(microsecond=0)
+    ticks = [
+        (symbol, base + timedelta(milliseconds=i), 1.0, 1.0, 1.0, 1.0, 1, 1.0, 1)
+        for i in range(10) for symbol in symbols
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connector = create_connector(tmp, ingestion_queue_size=8, ingestion_policy='block')
+        connector.is_running = True
+        asyncio.run(connector.ingest_async(symbols, LocalReplayFeed(ticks)))
+        connector.is_running = False
+
+        assert len(connector.read_arrow_data()) == len(ticks)
+        stats = connector.get_ingestion_stats()
+        assert stats['policy'] == 'block'
+        assert stats['enqueued'] == len(ticks)
+        assert stats['dropped'] == 0
+        assert stats['high_water_mark'] <= 8
+
+    print("   ✅ 异步接入背压测试通过")
+
+
+def test_update_notifier_debounce():
+    """测试新数据通知：防抖窗口内的多次写入合并为一轮，超时返回空集合"""
+    print("📊 测试新数据通知防抖...")
+
+    notifier = SymbolUpdateNotifier()
+    assert notifier.wait_for_updates(timeout=0.01) == set()
+
+    def writer():
+        for symbol in ['BTCUSDT', 'ETHUSDT', 'BTCUSDT']:
+            notifier.notify([symbol])
+            time.sleep(0.02)
+
+    thread = threading.Thread(target=writer)
+    start = time.monotonic()
+    thread.start()
+    symbols = notifier.wait_for_updates(timeout=1, debounce=0.2)
+    elapsed = time.monotonic() - start
+    thread.join()
+
+    assert symbols == {'BTCUSDT', 'ETHUSDT'}
+    assert 0.2 <= elapsed < 1
+    assert notifier.stats() == {'notifications': 3, 'rounds': 1, 'pending': 0}
+
+    # 关闭后等待方立即返回
+    threading.Timer(0.05, notifier.close).start()
+    assert notifier.wait_for_updates(timeout=5) == set()
+
+    print("   ✅ 新数据通知防抖测试通过")
+
+
+def test_pipeline_slow_push_does_not_stall_compute():
+    """测试流水线：推送阶段变慢时丢弃最旧的待推送批次，计算阶段不被阻塞"""
+    print("📊 测试处理流水线...")
+
+    pushed = []
+
+    def slow_push(batch):
+        time.sleep(0.1)
+        pushed.append(batch)
+        return len(batch)
+
+    pipeline = ProcessingPipeline([
+        ('ingest', lambda n: list(range(n))),
+        ('compute', lambda rows: [row * 2 for row in rows]),
+        ('serialize', lambda rows: tuple(rows)),
+        ('push', slow_push),
+    ], queue_size=2)
+    pipeline.start()
+    try:
+        start = time.monotonic()
+        for n in range(1, 21):
+            assert pipeline.submit(n, timeout=1)
+        # 0条的批次在ingest后为空，不向下游传递
+        pipeline.submit(0, timeout=1)
+
+        deadline = time.monotonic() + 2
+        while pipeline.stats()['serialize']['processed'] < 20 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        elapsed = time.monotonic() - start
+
+        stats = pipeline.stats()
+        assert stats['ingest']['processed'] == 21
+        assert stats['compute']['processed'] == 20
+        assert stats['serialize']['processed'] == 20
+        # 20个批次若逐个等待推送至少需要2秒
+        assert elapsed < 1.5
+        assert stats['push']['queue']['dropped'] > 0
+        assert stats['push']['queue']['high_water_mark'] == 2
+        assert stats['compute']['latency']['count'] == 20
+
+        time.sleep(0.5)
+        assert pushed and pushed[-1] == tuple(range(0, 40, 2))
+    finally:
+        pipeline.stop()
+
+    print("   ✅ 处理流水线测试通过")
+
+
+def test_pipeline_stop_drains_queued_batches():
+    """测试停止流水线时先排空各级队列，已提交的批次都被处理"""
+    print("📊 测试流水线停止前排空...")
+
+    pushed = []
+
+    def slow_compute(n):
+        time.sleep(0.02)
+        return [n]
+
+    pipeline = ProcessingPipeline([
+        ('compute', slow_compute),
+        ('push', pushed.extend),
+    ], queue_size=8)
+    pipeline.start()
+    for n in range(8):
+        assert pipeline.submit(n, timeout=1)
+    assert not pipeline.idle()
+    pipeline.stop(drain_timeout=5)
+
+    assert pushed == list(range(8))
+    assert pipeline.idle()
+
+    print("   ✅ 流水线排空测试通过")
+
+
+def write_recording(tmp, symbols, rows, step_ms=10, first=0, filename='recording.parquet'):
+    """录制一份Parquet行情文件（第 first 到 first+rows-1 根），返回路径和事件时间起点"""
+    base = datetime(2024, 1, 2, 9, 30, 0, 1)
+    records = {name: [] for name in
+               ['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume', 'amount', 'count']}
+    for i in range(first, first + rows):
+        for symbol in symbols:
+            price = 100.0 + i
+            for name, value in zip(records, (symbol, base + timedelta(milliseconds=i * step_ms),
+                                             price, price, price, price, i, price * i, 1)):
+                records[name].append(value)
+    path = os.path.join(tmp, filename)
+    pq.write_table(pa.table(records), path)
+    return path, base
+
+
+def test_historical_replay_preserves_event_time():
+    """测试历史回放：线程/异步两种模式尽快回放，事件时间原样保留"""
+    print("📊 测试历史回放...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, base = write_recording(tmp, ['BTCUSDT', 'ETHUSDT'], rows=30)
+
+        for mode in ['thread', 'async']:
+            connector = create_connector(os.path.join(tmp, mode), ingestion_policy='block')
+            feed = HistoricalReplayFeed(path, speed=None)
+            assert feed.symbols() == ['BTCUSDT', 'ETHUSDT']
+
+            connector.start_data_collection(None, mode=mode, feed=feed)
+            deadline = time.monotonic() + 5
+            while connector.ring_buffer.size('ETHUSDT') < 30 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            connector.stop_data_collection()
+
+            df = connector.read_arrow_data()
+            assert len(df) == 60, mode
+            eth = df[df['symbol'] == 'ETHUSDT'].sort_values('timestamp')
+            assert eth['timestamp'].iloc[0] == base
+            assert eth['timestamp'].iloc[-1] == base + timedelta(milliseconds=290)
+
+    print("   ✅ 历史回放测试通过")
+
+
+def test_replay_through_processor():
+    """测试历史回放端到端：两段回放增量加载到DuckDB，按事件时间保留数据并计算特征"""
+    print("📊 测试历史回放端到端加载...")
+
+    symbols = ['BTCUSDT', 'ETHUSDT']
+    step = timedelta(minutes=2)
+    with tempfile.TemporaryDirectory() as tmp:
+        connector = create_connector(tmp, ingestion_policy='block')
+        processors = {
+            mode: ArrowProcessor(connector.arrow_cache_path, retention_mode=mode, retention_hours=1,
+                                 db_path=os.path.join(tmp, f'{mode}.duckdb'))
+            for mode in ['delete', 'buckets']
+        }
+
+        # 两段录制共2小时（每2分钟一根），分两次回放、两次增量加载
+        for part in range(2):
+            path, base = write_recording(tmp, symbols, rows=30, step_ms=step.total_seconds() * 1000,
+                                         first=part * 30, filename=f'part{part}.parquet')
+            connector.start_data_collection(None, mode='thread', feed=HistoricalReplayFeed(path, speed=0))
+            deadline = time.monotonic() + 5
+            while connector.ring_buffer.size('ETHUSDT') < 30 * (part + 1) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            connector.stop_data_collection()
+
+            latest = base + step * (part * 30 + 29)
+            for mode, processor in processors.items():
+                assert processor.load_arrow_to_duckdb() == 60, mode
+                assert processor.event_watermark == latest
+                assert processor.get_all_symbols() == symbols, mode
+
+                features = processor.calculate_all_features()
+                assert [f['symbol'] for f in features] == symbols, mode
+                assert all(f['timestamp'] == latest for f in features)
+
+        # 保留水位（最后一根K线）之前1小时：delete 逐行删除，buckets 整小时删除
+        earliest = {mode: processor.duckdb_conn.execute(
+            "SELECT MIN(timestamp) FROM realtime_ohlc").fetchone()[0]
+            for mode, processor in processors.items()}
+        assert earliest['delete'] == latest - timedelta(hours=1)
+        assert earliest['buckets'] == datetime(2024, 1, 2, 10, 0, 0, 1)
+
+        for processor in processors.values():
+            processor.close()
+
+    print("   ✅ 历史回放端到端加载测试通过")
+
+
+def test_replay_clock_speed():
+    """测试回放时钟：按倍速压缩事件时间间隔"""
+    print("📊 测试回放时钟...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 事件时间跨度 0.9 秒，10 倍速回放约 0.09 秒
+        path, _ = write_recording(tmp, ['BTCUSDT'], rows=10, step_ms=100)
+        feed = HistoricalReplayFeed(path, speed=10)
+
+        start = time.monotonic()
+        ticks = list(feed.iter_ticks())
+        elapsed = time.monotonic() - start
+
+        assert len(ticks) == 10
+        assert 0.08 <= elapsed < 0.5, f"回放耗时异常: {elapsed:.3f}s"
+
+        # speed=0（main.py --speed 0）不等待，尽快回放
+        feed = HistoricalReplayFeed(path, speed=0)
+        start = time.monotonic()
+        assert len(list(feed.iter_ticks())) == 10
+        assert time.monotonic() - start < 0.05
+
+    print("   ✅ 回放时钟测试通过")
+
+
+if __name__ == "__main__":
+    for test_func in [test_drop_policies, test_coalesce_policy, test_block_policy,
+                      test_async_ingestion_with_local_replay, test_async_ingestion_backpressure,
+                      test_update_notifier_debounce,
+                      test_pipeline_slow_push_does_not_stall_compute,
+                      test_pipeline_stop_drains_queued_batches,
+                      test_historical_replay_preserves_event_time, test_replay_through_processor,
+                      test_replay_clock_speed]:
+        test_func()